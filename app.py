@@ -4,17 +4,94 @@
 # =====================================================
 
 import os
-import psycopg2
-import requests 
-import re
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+import hashlib
+import hmac
+import json
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from flask import Flask, Response, g, render_template, request, redirect, url_for, jsonify, flash, session, stream_with_context
+from flask import before_render_template, template_rendered
 from dotenv import load_dotenv
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
+from db import get_db_connection
+from cache import TTLCache
+from page_cache import blog_namespace, get_page_cache
+from pagination import fetch_page, get_page_size
+from generation import GenerationError, claim_job, create_job, update_job, get_job, stream_blog
+from generation import JOB_KINDS, MAX_BATCH_TOPICS, create_batch, fail_batch, get_batch, parse_topics
+from publisher import enqueue_publish
+import bulk_posts
+from search import SEARCH_KINDS, POST_STATUSES, search as search_content
+import transfer
+import similarity
+import metrics
 
 load_dotenv()
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a-super-secret-key-for-development')
+# When enabled the username travels in the signed session cookie, so most
+# requests can rebuild current_user without touching the database.
+app.config['USER_IN_SESSION'] = os.getenv('USER_IN_SESSION', 'false').lower() == 'true'
+
+# Celery task names for each kind of generation job (registered in celery_worker.py).
+GENERATION_TASKS = {
+    'posts': 'celery_worker.generate_posts',
+    'blog': 'celery_worker.generate_blog',
+}
+BATCH_TASK = 'celery_worker.generate_batch'
+
+# --- INSTRUMENTATION ---
+# Every request is timed and split into DB, Gemini and template time (db.py and
+# gemini_client.py add to the per-request tally). Served on /metrics; requests
+# over SLOW_REQUEST_SECONDS or SLOW_REQUEST_QUERIES are logged.
+http_request_seconds = metrics.Histogram("genie_http_request_seconds", "Time to handle a request.", ["endpoint", "method", "status"])
+http_db_seconds = metrics.Histogram("genie_http_db_seconds", "Time a request spent in SQL.", ["endpoint"])
+http_gemini_seconds = metrics.Histogram("genie_http_gemini_seconds", "Time a request spent waiting on Gemini.", ["endpoint"])
+http_render_seconds = metrics.Histogram("genie_http_render_seconds", "Time a request spent rendering templates.", ["endpoint"])
+http_queries = metrics.Histogram("genie_http_queries", "SQL statements per request.", ["endpoint"], buckets=metrics.COUNT_BUCKETS)
+page_cache_lookups = metrics.Gauge("genie_page_cache_lookups", "Page cache lookups in this process.", ["kind", "result"])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.render_started = []
+    metrics.start_tally()
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(error=None):
+    # Runs after streamed responses finish, so SSE generations are timed in full.
+    started = g.pop('request_started', None)
+    tally = metrics.stop_tally()
+    if started is None or tally is None:
+        return
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    status = 500 if error else g.get('response_status', 500)
+    http_request_seconds.observe(elapsed, endpoint=endpoint, method=request.method, status=status)
+    http_db_seconds.observe(tally['db_seconds'], endpoint=endpoint)
+    http_gemini_seconds.observe(tally['gemini_seconds'], endpoint=endpoint)
+    http_render_seconds.observe(tally['render_seconds'], endpoint=endpoint)
+    http_queries.observe(tally['queries'], endpoint=endpoint)
+    if metrics.is_slow(elapsed, tally['queries']):
+        print(f"SLOW REQUEST: {request.method} {request.path} ({endpoint}) {status} took {elapsed:.3f}s - "
+              f"db {tally['db_seconds']:.3f}s in {tally['queries']} queries, "
+              f"gemini {tally['gemini_seconds']:.3f}s in {tally['gemini_calls']} calls, render {tally['render_seconds']:.3f}s")
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    if g.get('render_started'):
+        metrics.add_to_tally('render_seconds', time.perf_counter() - g.render_started.pop())
 
 # --- LOGIN SYSTEM SETUP ---
 bcrypt = Bcrypt(app)
@@ -27,47 +104,132 @@ class User(UserMixin):
         self.id = id
         self.username = username
 
-@login_manager.user_loader
-def load_user(user_id):
-    conn = get_db_connection()
-    if conn:
+# Per-process cache of User objects so @login_required pages don't query users every time.
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '300'))
+)
+
+def invalidate_user(user_id):
+    """Drops a user from the loader cache after it is created or changed."""
+    user_cache.invalidate(str(user_id))
+
+def remember_user(user):
+    """Logs the user in and primes the loader cache (and the session, if enabled)."""
+    login_user(user)
+    user_cache.set(str(user.id), user)
+    if app.config['USER_IN_SESSION']:
+        session['username'] = user.username
+
+def cached_page(namespace, key, render):
+    """
+    Serves a page from the per-user page cache, calling render() on a miss.
+    render() returns (html, cacheable); pages that hit a database error or a
+    missing row are sent but not stored. Browsers get an ETag and revalidate.
+    """
+    page_cache = get_page_cache()
+    body = page_cache.get(current_user.id, namespace, key) if page_cache else None
+    if body is None:
+        body, cacheable = render()
+        if cacheable and page_cache:
+            page_cache.set(current_user.id, namespace, key, body)
+    response = app.make_response(body)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def invalidate_pages(*namespaces):
+    """Drops the current user's cached pages in the given namespaces."""
+    page_cache = get_page_cache()
+    if page_cache:
+        page_cache.invalidate(current_user.id, *namespaces)
+
+def screen_near_duplicates(cur, post_ids):
+    """
+    Checks posts about to be scheduled against the user's scheduled and
+    published posts, per NEAR_DUPLICATE_ON_SCHEDULE. Returns (post_ids that
+    may be scheduled, {post_id: (duplicate_id, score)}); with 'block' the
+    near-duplicates are left out of the first list.
+    """
+    mode = similarity.NEAR_DUPLICATE_ON_SCHEDULE
+    if mode not in ('warn', 'block') or not post_ids:
+        return post_ids, {}
+    duplicates = similarity.published_duplicates(cur, current_user.id, post_ids)
+    if mode == 'block':
+        post_ids = [post_id for post_id in post_ids if post_id not in duplicates]
+    return post_ids, duplicates
+
+def near_duplicate_message(duplicates):
+    outcome = 'not scheduled' if similarity.NEAR_DUPLICATE_ON_SCHEDULE == 'block' else 'scheduled anyway'
+    details = ', '.join(f"#{post_id} is {score:.0%} similar to #{duplicate_id}"
+                        for post_id, (duplicate_id, score) in sorted(duplicates.items()))
+    return f"Near-duplicates of posts already scheduled or published ({outcome}): {details}."
+
+LABELS_SQL = "SELECT id, name, color FROM labels WHERE user_id = %s ORDER BY name;"
+
+def get_labels(user_id):
+    """The user's labels (id, name, color), cached until a label is added or deleted."""
+    page_cache = get_page_cache()
+    labels_list = page_cache.get(user_id, 'labels', 'list') if page_cache else None
+    if labels_list is not None:
+        return labels_list
+    with get_db_connection() as conn:
+        if not conn:
+            return []
         cur = conn.cursor()
-        cur.execute("SELECT id, username FROM users WHERE id = %s;", (user_id,))
-        user_data = cur.fetchone()
+        cur.execute(LABELS_SQL, (user_id,))
+        labels_data = cur.fetchall()
         cur.close()
-        conn.close()
-        if user_data:
-            return User(id=user_data[0], username=user_data[1])
-    return None
+    labels_list = [{'id': label_data[0], 'name': label_data[1], 'color': label_data[2]} for label_data in labels_data]
+    if page_cache:
+        page_cache.set(user_id, 'labels', 'list', labels_list)
+    return labels_list
 
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        return conn
-    except Exception as e:
-        print(f"Error connecting to database: {e}")
-        return None
+LOAD_USER_SQL = "SELECT id, username FROM users WHERE id = %s;"
+
+@login_manager.user_loader
+def load_user(user_id):
+    user = user_cache.get(str(user_id))
+    if user:
+        return user
+    if app.config['USER_IN_SESSION'] and session.get('username'):
+        user = User(id=int(user_id), username=session['username'])
+        user_cache.set(str(user_id), user)
+        return user
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute(LOAD_USER_SQL, (user_id,))
+            user_data = cur.fetchone()
+            cur.close()
+            if user_data:
+                user = User(id=user_data[0], username=user_data[1])
+                user_cache.set(str(user_id), user)
+                return user
+    return None
 
 # --- AUTHENTICATION ROUTES ---
 
+LOGIN_SQL = "SELECT id, username, password FROM users WHERE username = %s;"
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, username, password FROM users WHERE username = %s;", (username,))
-            user_data = cur.fetchone()
-            cur.close()
-            conn.close()
-            if user_data and bcrypt.check_password_hash(user_data[2], password):
-                user = User(id=user_data[0], username=user_data[1])
-                login_user(user)
-                return redirect(url_for('index'))
-            else:
-                flash('Invalid username or password.')
+        with get_db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute(LOGIN_SQL, (username,))
+                user_data = cur.fetchone()
+                cur.close()
+                if user_data and bcrypt.check_password_hash(user_data[2], password):
+                    user = User(id=user_data[0], username=user_data[1])
+                    remember_user(user)
+                    return redirect(url_for('index'))
+                else:
+                    flash('Invalid username or password.')
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -76,190 +238,375 @@ def register():
         username = request.form['username']
         password = request.form['password']
         hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-        conn = get_db_connection()
-        if conn:
-            try:
-                cur = conn.cursor()
-                cur.execute("INSERT INTO users (username, password) VALUES (%s, %s);", (username, hashed_password))
-                conn.commit()
-                cur.close()
-                conn.close()
-                flash('Registration successful! Please log in.')
-                return redirect(url_for('login'))
-            except psycopg2.IntegrityError:
-                flash('Username already taken.')
+        import psycopg2   # for IntegrityError; db.py loads it on first connect
+        with get_db_connection() as conn:
+            if conn:
+                try:
+                    cur = conn.cursor()
+                    cur.execute("INSERT INTO users (username, password) VALUES (%s, %s) RETURNING id;", (username, hashed_password))
+                    new_user_id = cur.fetchone()[0]
+                    conn.commit()
+                    cur.close()
+                    invalidate_user(new_user_id)
+                    flash('Registration successful! Please log in.')
+                    return redirect(url_for('login'))
+                except psycopg2.IntegrityError:
+                    flash('Username already taken.')
     return render_template('register.html')
 
 @app.route('/logout')
 @login_required
 def logout():
     logout_user()
+    session.pop('username', None)
     return redirect(url_for('login'))
 
 
 # --- PAGE ROUTES ---
 
+# Keyset templates for pagination.fetch_page; migrate.py check EXPLAINs them too.
+DRAFTS_PAGE_SQL = """
+    SELECT id, created_at, post_text, hashtags, scheduled_for, status, near_duplicate_of, near_duplicate_score
+    FROM posts
+    WHERE user_id = %s AND status = 'draft' {keyset}
+    ORDER BY created_at DESC, id DESC
+"""
+BLOG_PAGE_SQL = """
+    SELECT id, created_at, title FROM blog_posts
+    WHERE user_id = %s {keyset}
+    ORDER BY created_at DESC, id DESC
+"""
+
+def fetch_drafts_page(user_id, cursor, page_size):
+    """Returns one page of the user's drafts, newest first, plus the cursor for the next page."""
+    posts = []
+    next_cursor = None
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            posts_data, next_cursor = fetch_page(cur, DRAFTS_PAGE_SQL, (user_id,), cursor, page_size)
+            cur.close()
+            for post_data in posts_data:
+                posts.append({
+                    'id': post_data[0], 'created_at': post_data[1], 'text': post_data[2],
+                    'hashtags': post_data[3], 'scheduled_for': post_data[4], 'status': post_data[5],
+                    'near_duplicate_of': post_data[6], 'near_duplicate_score': post_data[7]
+                })
+    return posts, next_cursor
+
+def fetch_blog_page(user_id, cursor, page_size):
+    """Returns one page of the user's blog posts, newest first, plus the next cursor."""
+    blog_posts = []
+    next_cursor = None
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            blog_posts_data, next_cursor = fetch_page(cur, BLOG_PAGE_SQL, (user_id,), cursor, page_size)
+            cur.close()
+            for blog_data in blog_posts_data:
+                blog_posts.append({'id': blog_data[0], 'created_at': blog_data[1], 'title': blog_data[2]})
+    return blog_posts, next_cursor
+
 @app.route('/')
 @login_required
 def index():
-    posts = []
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, post_text, hashtags, created_at, scheduled_for, status FROM posts WHERE user_id = %s ORDER BY created_at DESC;", (current_user.id,))
-        posts_data = cur.fetchall()
-        cur.close()
-        conn.close()
-        for post_data in posts_data:
-            posts.append({
-                'id': post_data[0], 'text': post_data[1], 'hashtags': post_data[2], 
-                'created_at': post_data[3], 'scheduled_for': post_data[4], 'status': post_data[5]
-            })
-    return render_template('index.html', posts=posts)
+    page_size = get_page_size(request.args.get('page_size'))
+    posts, next_cursor = fetch_drafts_page(current_user.id, request.args.get('cursor'), page_size)
+    return render_template('index.html', posts=posts, next_cursor=next_cursor, page_size=page_size,
+                           job_id=request.args.get('job', type=int), batch_id=request.args.get('batch', type=int))
 
 @app.route('/blog')
 @login_required
 def blog():
-    blog_posts = []
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title, created_at FROM blog_posts WHERE user_id = %s ORDER BY created_at DESC;", (current_user.id,))
-        blog_posts_data = cur.fetchall()
-        cur.close()
-        conn.close()
-        for blog_data in blog_posts_data:
-            blog_posts.append({'id': blog_data[0], 'title': blog_data[1], 'created_at': blog_data[2]})
-    return render_template('blog.html', blog_posts=blog_posts)
+    page_size = get_page_size(request.args.get('page_size'))
+    cursor = request.args.get('cursor')
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        # The job banner is per request, so this page isn't cached.
+        blog_posts, next_cursor = fetch_blog_page(current_user.id, cursor, page_size)
+        return render_template('blog.html', blog_posts=blog_posts, next_cursor=next_cursor, page_size=page_size, job_id=job_id)
+
+    def render():
+        blog_posts, next_cursor = fetch_blog_page(current_user.id, cursor, page_size)
+        return render_template('blog.html', blog_posts=blog_posts, next_cursor=next_cursor, page_size=page_size, job_id=None), True
+    return cached_page('blog_list', f"{cursor}:{page_size}", render)
 
 @app.route('/calendar')
 @login_required
 def calendar():
     return render_template('calendar.html')
 
+VIEW_BLOG_SQL = "SELECT id, title, content, created_at FROM blog_posts WHERE id = %s AND user_id = %s;"
+
 @app.route('/blog/<int:blog_id>')
 @login_required
 def view_blog(blog_id):
-    blog_post = None
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, title, content, created_at FROM blog_posts WHERE id = %s AND user_id = %s;", (blog_id, current_user.id))
-        blog_data = cur.fetchone()
-        cur.close()
-        conn.close()
-        if blog_data:
-            blog_post = {
-                'id': blog_data[0], 'title': blog_data[1],
-                'content': blog_data[2], 'created_at': blog_data[3]
-            }
-    return render_template('view_blog.html', blog_post=blog_post)
+    def render():
+        blog_post = None
+        with get_db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute(VIEW_BLOG_SQL, (blog_id, current_user.id))
+                blog_data = cur.fetchone()
+                cur.close()
+                if blog_data:
+                    blog_post = {
+                        'id': blog_data[0], 'title': blog_data[1],
+                        'content': blog_data[2], 'created_at': blog_data[3]
+                    }
+        return render_template('view_blog.html', blog_post=blog_post), blog_post is not None
+    return cached_page(blog_namespace(blog_id), 'page', render)
 
 @app.route('/labels')
 @login_required
 def labels():
-    labels_list = []
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, color FROM labels WHERE user_id = %s ORDER BY name;", (current_user.id,))
-        labels_data = cur.fetchall()
-        cur.close()
-        conn.close()
-        for label_data in labels_data:
-            labels_list.append({'id': label_data[0], 'name': label_data[1], 'color': label_data[2]})
-    return render_template('labels.html', labels=labels_list)
+    def render():
+        return render_template('labels.html', labels=get_labels(current_user.id)), True
+    return cached_page('labels', 'page', render)
+
+
+@app.route('/search')
+@login_required
+def search():
+    """Full-text search over the user's posts and blog posts, with label/status/date filters."""
+    query = (request.args.get('q') or '').strip()
+    kind = request.args.get('kind') if request.args.get('kind') in SEARCH_KINDS else 'all'
+    status = request.args.get('status') if request.args.get('status') in POST_STATUSES else None
+    label_id = request.args.get('label_id', type=int)
+    date_from = parse_calendar_bound(request.args.get('from'))
+    date_to = parse_calendar_bound(request.args.get('to'))
+    if date_to:
+        date_to += timedelta(days=1)   # 'to' is an inclusive day
+    filters = {'q': query, 'kind': kind, 'status': status, 'label_id': label_id,
+               'from': request.args.get('from', ''), 'to': request.args.get('to', '')}
+
+    results = []
+    if query:
+        with get_db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                results = search_content(cur, current_user.id, query, kind, label_id, status, date_from, date_to)
+                cur.close()
+
+    for result in results:
+        if result['kind'] == 'post':
+            result['url'] = url_for('edit', post_id=result['id'])
+        else:
+            result['url'] = url_for('view_blog', blog_id=result['id'])
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'results': [dict(result, snippet=str(result['snippet']),
+                                         created_at=result['created_at'].isoformat(),
+                                         scheduled_for=result['scheduled_for'].isoformat() if result.get('scheduled_for') else None)
+                                    for result in results]})
+    return render_template('search.html', results=results, filters=filters, labels=get_labels(current_user.id), statuses=POST_STATUSES)
+
+@app.route('/api/cache_stats')
+@login_required
+def api_cache_stats():
+    """Page cache hit/miss counters for this process."""
+    page_cache = get_page_cache()
+    return jsonify(page_cache.stats() if page_cache else {})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus metrics for this process, for scrapers sending
+    `Authorization: Bearer $METRICS_TOKEN`. Without METRICS_TOKEN the
+    endpoint is off, since the numbers describe traffic and backlogs.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        return Response("Not Found\n", status=404, mimetype='text/plain')
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    page_cache = get_page_cache()
+    if page_cache:
+        for kind, counts in page_cache.stats().items():
+            page_cache_lookups.set(counts['hits'], kind=kind, result='hit')
+            page_cache_lookups.set(counts['misses'], kind=kind, result='miss')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- API AND ACTION ROUTES ---
 
+@app.route('/api/drafts')
+@login_required
+def api_drafts():
+    """JSON version of the drafts list, used by index.html for infinite scroll."""
+    page_size = get_page_size(request.args.get('page_size'))
+    posts, next_cursor = fetch_drafts_page(current_user.id, request.args.get('cursor'), page_size)
+    for post in posts:
+        post['created_at'] = post['created_at'].isoformat()
+        post['scheduled_for'] = post['scheduled_for'].isoformat() if post['scheduled_for'] else None
+        post['schedule_url'] = url_for('schedule', post_id=post['id'])
+        post['edit_url'] = url_for('edit', post_id=post['id'])
+        post['near_duplicate_url'] = url_for('edit', post_id=post['near_duplicate_of']) if post['near_duplicate_of'] else None
+    return jsonify({'posts': posts, 'next_cursor': next_cursor})
+
+@app.route('/api/blog_posts')
+@login_required
+def api_blog_posts():
+    """JSON version of the blog list, used by blog.html for infinite scroll."""
+    page_size = get_page_size(request.args.get('page_size'))
+    blog_posts, next_cursor = fetch_blog_page(current_user.id, request.args.get('cursor'), page_size)
+    for blog_post in blog_posts:
+        blog_post['created_at'] = blog_post['created_at'].isoformat()
+        blog_post['url'] = url_for('view_blog', blog_id=blog_post['id'])
+    return jsonify({'blog_posts': blog_posts, 'next_cursor': next_cursor})
+
+def parse_calendar_bound(value):
+    """Parses a FullCalendar start/end parameter into a naive datetime (or None)."""
+    if not value:
+        return None
+    try:
+        # scheduled_for holds the wall-clock time typed into a datetime-local input,
+        # so the browser's UTC offset is dropped rather than converted.
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+def calendar_window(start, end):
+    """The `{window}` condition and params that limit the calendar queries to [start, end)."""
+    window_sql = ""
+    window_params = ()
+    if start:
+        window_sql += " AND p.scheduled_for >= %s"
+        window_params += (start,)
+    if end:
+        window_sql += " AND p.scheduled_for < %s"
+        window_params += (end,)
+    return window_sql, window_params
+
+# Scheduled posts and posts that ran out of publish attempts are shown.
+# The validator (count and latest change) and the events both come from the
+# (user_id, status, scheduled_for) index.
+CALENDAR_VALIDATOR_SQL = """
+    SELECT COUNT(*), MAX(p.updated_at) FROM posts p
+    WHERE p.user_id = %s AND p.status IN ('scheduled', 'failed') AND p.scheduled_for IS NOT NULL{window};
+"""
+CALENDAR_EVENTS_SQL = """
+    SELECT p.id, p.post_text, p.scheduled_for, l.color, p.status
+    FROM posts p
+    LEFT JOIN labels l ON p.label_id = l.id
+    WHERE p.user_id = %s AND p.status IN ('scheduled', 'failed') AND p.scheduled_for IS NOT NULL{window};
+"""
+
 @app.route('/api/posts')
 @login_required
 def api_posts():
+    start = parse_calendar_bound(request.args.get('start'))
+    end = parse_calendar_bound(request.args.get('end'))
+    window_sql, window_params = calendar_window(start, end)
+
     events = []
-    conn = get_db_connection()
-    if conn:
+    with get_db_connection() as conn:
+        if not conn:
+            return jsonify(events)
         cur = conn.cursor()
-        cur.execute("""
-            SELECT p.id, p.post_text, p.scheduled_for, l.color
-            FROM posts p
-            LEFT JOIN labels l ON p.label_id = l.id
-            WHERE p.status = 'scheduled' AND p.scheduled_for IS NOT NULL AND p.user_id = %s;
-        """, (current_user.id,))
-        posts_data = cur.fetchall()
-        cur.close()
-        conn.close()
-        for post_data in posts_data:
-            events.append({
-                'id': post_data[0],
-                'title': post_data[1][:25] + '...', 
-                'start': post_data[2].isoformat(),
-                'url': url_for('edit', post_id=post_data[0]),
-                'color': post_data[3] or '#ec4899'
-            })
-    return jsonify(events)
+        # Cheap validator first: the number of visible posts and their latest change.
+        cur.execute(CALENDAR_VALIDATOR_SQL.format(window=window_sql), (current_user.id,) + window_params)
+        post_count, last_modified = cur.fetchone()
+        etag = hashlib.md5(
+            f"{current_user.id}:{start}:{end}:{post_count}:{last_modified}".encode('utf-8')
+        ).hexdigest()
+        if etag in request.if_none_match or (
+            last_modified and request.if_modified_since
+            and last_modified.replace(microsecond=0) <= request.if_modified_since
+            and not request.if_none_match
+        ):
+            cur.close()
+            response = app.response_class(status=304)
+        else:
+            cur.execute(CALENDAR_EVENTS_SQL.format(window=window_sql), (current_user.id,) + window_params)
+            posts_data = cur.fetchall()
+            cur.close()
+            # Build the edit URL once instead of calling url_for for every row.
+            edit_url_prefix = url_for('edit', post_id=0).rsplit('/', 1)[0]
+            for post_data in posts_data:
+                failed = post_data[4] == 'failed'
+                events.append({
+                    'id': post_data[0],
+                    'title': ('Failed: ' if failed else '') + post_data[1][:25] + '...', 
+                    'start': post_data[2].isoformat(),
+                    'url': f"{edit_url_prefix}/{post_data[0]}",
+                    'color': '#ef4444' if failed else (post_data[3] or '#ec4899')
+                })
+            response = jsonify(events)
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Let the browser keep the response but revalidate it on every calendar load.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def enqueue_generation(kind, topic):
+    """Creates a generation job and hands it to the Celery worker. Returns the job id or None."""
+    # 'fresh' skips the generation cache so the user gets new wording for a repeated topic.
+    bypass_cache = request.form.get('fresh') == 'on'
+    job_id = create_job(current_user.id, kind, topic, bypass_cache)
+    if job_id is None:
+        flash('Could not start generation: the database is unavailable.')
+        return None
+    from celery_app import celery_app   # imported on first use: Celery dominates a cold start
+    try:
+        celery_app.send_task(GENERATION_TASKS[kind], args=[job_id])
+    except Exception as e:
+        print(f"Error queueing generation job {job_id}: {e}")
+        update_job(job_id, 'failed', error='Could not reach the task queue.')
+        flash('Could not start generation. Please try again.')
+        return None
+    return job_id
 
 @app.route('/generate', methods=['POST'])
 @login_required
 def generate():
-    user_prompt = request.form['prompt']
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    # --- UPDATED PROMPT FOR LINKEDIN POSTS ---
-    full_prompt = f"""
-    Act as a "Systems Architect" and expert in business automation for small businesses. Your target audience is overwhelmed entrepreneurs who are looking to scale their operations and free up their time.
-    Your task is to create 5 distinct LinkedIn posts based on the following topic: "{user_prompt}".
-    Each post must adhere to the following structure and guidelines:
-    - Tone: Professional, authoritative, and helpful, but with a human touch. Avoid overly technical jargon. Be friendly, informative, conversational, and engaging to encourage comments and reactions.
-    - Structure:
-      1. A compelling hook: Start with a question or a bold statement that addresses a common pain point of the target audience.
-      2. A value-driven body: Use bullet points to provide actionable tips, a case study, or a "before and after" scenario.
-      3. A clear call to action: End with a question to encourage engagement or an invitation to connect.
-    - Content: The 5 posts should be unique and cover different angles of the topic. For example:
-      - Post 1: A "why" post, explaining the strategic importance of the topic.
-      - Post 2: A "how-to" post, with actionable tips.
-      - Post 3: A case study, showcasing a real-world example.
-      - Post 4: A myth-busting post, addressing a common misconception.
-      - Post 5: A personal reflection, sharing your own experience with the topic.
-    - Hashtags: Include 3-5 relevant hashtags at the end of each post, such as #businessautomation, #systemsarchitect, #entrepreneurship, #smallbusinessowner, #efficiency.
-    Please provide the 5 LinkedIn posts in a clean, ready-to-post format, separated by '---'.
+    job_id = enqueue_generation('posts', request.form['prompt'])
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id}), (202 if job_id else 503)
+    return redirect(url_for('index', job=job_id) if job_id else url_for('index'))
+
+@app.route('/generate/batch', methods=['POST'])
+@login_required
+def generate_batch():
     """
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={api_key}"
-    payload = {"contents": [{"parts": [{"text": full_prompt}]}]}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        try:
-            result = response.json()
-            generated_text = result['candidates'][0]['content']['parts'][0]['text']
-            individual_posts = generated_text.strip().split('---')
-            conn = get_db_connection()
-            if conn:
-                cur = conn.cursor()
-                for post_content in individual_posts:
-                    if post_content.strip():
-                        parts = post_content.strip().split('\n')
-                        # Find the last line that starts with '#' for hashtags
-                        hashtag_line_index = -1
-                        for i in range(len(parts) - 1, -1, -1):
-                            if parts[i].strip().startswith('#'):
-                                hashtag_line_index = i
-                                break
-                        
-                        if hashtag_line_index != -1:
-                            post_text = "\n".join(parts[:hashtag_line_index]).strip()
-                            hashtags = " ".join(parts[hashtag_line_index:]).strip()
-                        else: # Fallback if no hashtags are found
-                            post_text = "\n".join(parts).strip()
-                            hashtags = ""
-                            
-                        cur.execute("INSERT INTO posts (post_text, hashtags, status, user_id) VALUES (%s, %s, 'draft', %s);", (post_text, hashtags, current_user.id))
-                conn.commit()
-                cur.close()
-                conn.close()
-        except (KeyError, IndexError) as e:
-            print(f"Error parsing Gemini response: {e}")
-    return redirect(url_for('index'))
+    Queues one generation job per topic and a single worker task that runs
+    them concurrently. Topics come from 'topics' (one per line, or repeated;
+    a list in JSON) and/or the first column of an uploaded 'topics_csv' file.
+    """
+    data = request.get_json(silent=True) or request.form
+    wants_json = request.is_json or request.accept_mimetypes.best == 'application/json'
+
+    def respond(error, status):
+        if wants_json:
+            return jsonify({'error': error}), status
+        flash(error)
+        return redirect(url_for('index'))
+
+    kind = data.get('kind') or 'posts'
+    upload = request.files.get('topics_csv')
+    csv_text = upload.read().decode('utf-8-sig', errors='replace') if upload else None
+    topics = parse_topics(data.get('topics') if request.is_json else request.form.getlist('topics'), csv_text)
+    if kind not in JOB_KINDS:
+        return respond(f"Unknown kind. Use one of: {', '.join(JOB_KINDS)}.", 400)
+    if not topics:
+        return respond("Enter at least one topic.", 400)
+    if len(topics) > MAX_BATCH_TOPICS:
+        return respond(f"At most {MAX_BATCH_TOPICS} topics can be generated at once.", 400)
+
+    bypass_cache = str(data.get('fresh')).lower() in ('on', 'true')
+    batch_id, job_ids = create_batch(current_user.id, kind, topics, bypass_cache)
+    if batch_id is None:
+        return respond('Could not start generation: the database is unavailable.', 503)
+    from celery_app import celery_app
+    try:
+        celery_app.send_task(BATCH_TASK, args=[batch_id])
+    except Exception as e:
+        print(f"Error queueing generation batch {batch_id}: {e}")
+        fail_batch(batch_id, 'Could not reach the task queue.')
+        return respond('Could not start generation. Please try again.', 503)
+    if wants_json:
+        return jsonify({'batch_id': batch_id, 'job_ids': job_ids}), 202
+    return redirect(url_for('index', batch=batch_id))
 
 @app.route('/add_post', methods=['POST'])
 @login_required
@@ -267,120 +614,110 @@ def add_post():
     post_text = request.form['post_text']
     hashtags = request.form['hashtags']
     if post_text and hashtags:
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO posts (post_text, hashtags, status, user_id) VALUES (%s, %s, 'draft', %s);", (post_text, hashtags, current_user.id))
-            conn.commit()
-            cur.close()
-            conn.close()
+        with get_db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                minhash, lsh_buckets = similarity.index_values(current_user.id, post_text)
+                cur.execute("""
+                    INSERT INTO posts (post_text, hashtags, status, user_id, minhash, lsh_buckets)
+                    VALUES (%s, %s, 'draft', %s, %s::bigint[], %s::bigint[]) RETURNING id;
+                """, (post_text, hashtags, current_user.id, minhash, lsh_buckets))
+                similarity.flag_posts(cur, current_user.id, [cur.fetchone()[0]])
+                conn.commit()
+                cur.close()
     return redirect(url_for('index'))
 
 @app.route('/generate_blog', methods=['POST'])
 @login_required
 def generate_blog():
-    user_prompt = request.form['blog_prompt']
-    api_key = os.getenv("GEMINI_API_KEY")
-
-    # --- UPDATED PROMPT FOR BLOG POSTS ---
-    full_prompt = f"""
-    Act as a "Systems Architect" and a leading expert in business process automation. You are writing for an audience of ambitious entrepreneurs who want to scale their businesses through smart, technology-driven solutions.
-    Your task is to write a minimum 1500-word blog post on the following topic: "{user_prompt}".
-    The blog post must meet the following criteria:
-    - Structure and Content:
-      - Engaging Introduction: Start with a relatable story or a startling statistic to hook the reader.
-      - In-depth Analysis: The body of the post should provide a detailed, step-by-step strategy. Use clear subheadings to break up the text.
-      - Evidence-Based Claims: Back up all claims with links to at least 3-5 external, reputable sources (e.g., industry reports, academic studies, articles from established business publications).
-      - Actionable Advice: The post should be practical and provide the reader with a clear roadmap they can follow.
-      - Strong Conclusion: Summarize the key takeaways and end with a powerful call to action.
-    - Tone: Authoritative, well-researched, and highly credible. The tone should reflect your position as a premium technical consultant.
-    
-    After the blog post, please generate 5 unique LinkedIn posts based on the content of the article. These posts should follow the same structure and guidelines as the previous prompt (hook, value-driven body, CTA, and relevant hashtags).
-    
-    Please provide the full blog post and the 5 LinkedIn posts using the following strict format:
-    <BLOG_TITLE_START>The Blog Title Goes Here<BLOG_TITLE_END>
-    <BLOG_CONTENT_START>
-    The entire blog content, with a minimum of 1500 words, goes here.
-    <BLOG_CONTENT_END>
-    <POST_START>
-    LinkedIn Post 1 content...
-    #hashtag1 #hashtag2
-    <POST_END>
-    <POST_START>
-    LinkedIn Post 2 content...
-    #hashtag3 #hashtag4
-    <POST_END>
-    <POST_START>
-    LinkedIn Post 3 content...
-    #hashtag5 #hashtag6
-    <POST_END>
-    <POST_START>
-    LinkedIn Post 4 content...
-    #hashtag7 #hashtag8
-    <POST_END>
-    <POST_START>
-    LinkedIn Post 5 content...
-    #hashtag9 #hashtag10
-    <POST_END>
+    job_id = enqueue_generation('blog', request.form['blog_prompt'])
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id}), (202 if job_id else 503)
+    return redirect(url_for('blog', job=job_id) if job_id else url_for('blog'))
+
+@app.route('/generate_blog/stream', methods=['POST'])
+@login_required
+def start_blog_stream():
+    """
+    Streaming alternative to /generate_blog. Records the generation as a job
+    and returns the URL its events are read from; nothing is generated until
+    that URL is opened, and it can only be opened once.
+    """
+    bypass_cache = request.form.get('fresh') == 'on'
+    job_id = create_job(current_user.id, 'blog', request.form.get('blog_prompt', ''), bypass_cache)
+    if job_id is None:
+        return jsonify({'error': 'Could not start generation: the database is unavailable.'}), 503
+    return jsonify({'job_id': job_id, 'stream_url': url_for('generate_blog_stream', job_id=job_id)}), 202
+
+@app.route('/generate_blog/stream/<int:job_id>')
+@login_required
+def generate_blog_stream(job_id):
     """
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={api_key}"
-    payload = {"contents": [{"parts": [{"text": full_prompt}]}]}
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
+    Server-sent events for a job started by POST /generate_blog/stream: the
+    title, blog content as it is written, and each LinkedIn post once it is
+    saved. Holds the request open for the whole generation, so it is meant
+    for threaded or async server workers.
+    """
+    job = claim_job(job_id, current_user.id)
+    if not job or job[0] != 'blog':
+        return jsonify({'error': 'Generation not found or already started.'}), 404
+    _, topic, bypass_cache = job
+    user_id = current_user.id
+
+    def events():
+        finished = False
         try:
-            result = response.json()
-            generated_text = result['candidates'][0]['content']['parts'][0]['text']
-            title_match = re.search(r'<BLOG_TITLE_START>(.*?)<BLOG_TITLE_END>', generated_text, re.DOTALL)
-            content_match = re.search(r'<BLOG_CONTENT_START>(.*?)<BLOG_CONTENT_END>', generated_text, re.DOTALL)
-            linkedin_posts = re.findall(r'<POST_START>(.*?)<POST_END>', generated_text, re.DOTALL)
-            if title_match and content_match and linkedin_posts:
-                blog_title = title_match.group(1).strip()
-                blog_content = content_match.group(1).strip()
-                conn = get_db_connection()
-                if conn:
-                    cur = conn.cursor()
-                    cur.execute("INSERT INTO blog_posts (title, content, user_id) VALUES (%s, %s, %s) RETURNING id;", (blog_title, blog_content, current_user.id))
-                    blog_id = cur.fetchone()[0]
-                    for post_content in linkedin_posts:
-                        if post_content.strip():
-                            # Find the last line that starts with '#' for hashtags
-                            parts = post_content.strip().split('\n')
-                            hashtag_line_index = -1
-                            for i in range(len(parts) - 1, -1, -1):
-                                if parts[i].strip().startswith('#'):
-                                    hashtag_line_index = i
-                                    break
-                            
-                            if hashtag_line_index != -1:
-                                post_text = "\n".join(parts[:hashtag_line_index]).strip()
-                                hashtags = " ".join(parts[hashtag_line_index:]).strip()
-                            else: # Fallback if no hashtags are found
-                                post_text = "\n".join(parts).strip()
-                                hashtags = ""
-
-                            cur.execute("INSERT INTO posts (post_text, hashtags, status, blog_post_id, user_id) VALUES (%s, %s, 'draft', %s, %s);", (post_text, hashtags, blog_id, current_user.id))
-                    conn.commit()
-                    cur.close()
-                    conn.close()
-            else:
-                print("Error: Could not find all required separators in the AI response.")
-        except (KeyError, IndexError) as e:
-            print(f"Error parsing Gemini response for blog: {e}")
-    return redirect(url_for('blog'))
+            for event, data in stream_blog(user_id, topic, bypass_cache):
+                if event == 'done':
+                    update_job(job_id, 'done', post_ids=data['post_ids'], blog_post_id=data['blog_post_id'])
+                    finished = True
+                    data['url'] = url_for('view_blog', blog_id=data['blog_post_id'])
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except GenerationError as e:
+            print(f"Error streaming blog generation: {e}")
+            update_job(job_id, 'failed', error=str(e))
+            finished = True
+            yield f"event: failed\ndata: {json.dumps({'error': str(e)})}\n\n"
+        finally:
+            if not finished:
+                update_job(job_id, 'failed', error='The stream was closed before the generation finished.')
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job(job_id):
+    """Status of a generation job: pending, running, done or failed, plus what it created."""
+    job = get_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+    job['created_at'] = job['created_at'].isoformat()
+    job['updated_at'] = job['updated_at'].isoformat()
+    return jsonify(job)
+
+@app.route('/api/batches/<int:batch_id>')
+@login_required
+def api_batch(batch_id):
+    """Progress of a generation batch: per-topic status, counts and what each job created."""
+    batch = get_batch(batch_id, current_user.id)
+    if not batch:
+        return jsonify({'error': 'Batch not found.'}), 404
+    batch['created_at'] = batch['created_at'].isoformat()
+    return jsonify(batch)
 
 @app.route('/update_blog/<int:blog_id>', methods=['POST'])
 @login_required
 def update_blog(blog_id):
     title = request.form['title']
     content = request.form['content']
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE blog_posts SET title = %s, content = %s WHERE id = %s AND user_id = %s;", (title, content, blog_id, current_user.id))
-        conn.commit()
-        cur.close()
-        conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE blog_posts SET title = %s, content = %s WHERE id = %s AND user_id = %s;", (title, content, blog_id, current_user.id))
+            conn.commit()
+            cur.close()
+            invalidate_pages('blog_list', blog_namespace(blog_id))
     return redirect(url_for('view_blog', blog_id=blog_id))
 
 # --- ROUTES FOR ADDING AND DELETING LABELS ---
@@ -391,27 +728,29 @@ def add_label():
     name = request.form['label_name']
     color = request.form['label_color']
     if name and color:
-        conn = get_db_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("INSERT INTO labels (name, color, user_id) VALUES (%s, %s, %s);", (name, color, current_user.id))
-            conn.commit()
-            cur.close()
-            conn.close()
+        with get_db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                cur.execute("INSERT INTO labels (name, color, user_id) VALUES (%s, %s, %s);", (name, color, current_user.id))
+                conn.commit()
+                cur.close()
+                invalidate_pages('labels')
     return redirect(url_for('labels'))
 
+UNLABEL_POSTS_SQL = "UPDATE posts SET label_id = NULL WHERE label_id = %s AND user_id = %s;"
+
 @app.route('/delete_label/<int:label_id>', methods=['POST'])
 @login_required
 def delete_label(label_id):
     """Deletes a label from the database."""
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE posts SET label_id = NULL WHERE label_id = %s AND user_id = %s;", (label_id, current_user.id))
-        cur.execute("DELETE FROM labels WHERE id = %s AND user_id = %s;", (label_id, current_user.id))
-        conn.commit()
-        cur.close()
-        conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute(UNLABEL_POSTS_SQL, (label_id, current_user.id))
+            cur.execute("DELETE FROM labels WHERE id = %s AND user_id = %s;", (label_id, current_user.id))
+            conn.commit()
+            cur.close()
+            invalidate_pages('labels')
     return redirect(url_for('labels'))
 
 
@@ -419,33 +758,218 @@ def delete_label(label_id):
 @login_required
 def schedule(post_id):
     scheduled_time_str = request.form['schedule_time']
-    conn = get_db_connection()
-    if conn:
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            allowed, duplicates = screen_near_duplicates(cur, [post_id])
+            if duplicates:
+                flash(near_duplicate_message(duplicates))
+            if not allowed:
+                cur.close()
+                return redirect(url_for('index'))
+            # Posts a worker is publishing right now, or that were already published, are left
+            # alone. Rescheduling gives a failed post a fresh set of publish attempts.
+            cur.execute(f"""
+                UPDATE posts SET scheduled_for = %s, {bulk_posts.RESCHEDULE_SET}
+                WHERE posts.id = %s AND posts.user_id = %s AND {bulk_posts.SCHEDULABLE}
+                RETURNING schedule_version, EXTRACT(EPOCH FROM (scheduled_for - NOW()));
+            """, (scheduled_time_str, post_id, current_user.id))
+            scheduled = cur.fetchone()
+            conn.commit()
+            cur.close()
+            if scheduled:
+                enqueue_publish(post_id, scheduled[0], scheduled[1])
+            else:
+                flash(NOT_SCHEDULABLE_MESSAGE.format(count=1))
+    return redirect(url_for('index'))
+
+BULK_ACTIONS = ('schedule', 'spread', 'unschedule', 'label', 'delete')
+NOT_SCHEDULABLE_MESSAGE = "{count} post(s) not changed: they are being published or were already published to LinkedIn."
+
+@app.route('/posts/bulk', methods=['POST'])
+@login_required
+def bulk_posts_action():
+    """
+    Applies one action to many posts in a single transaction. Takes JSON
+    ({"action": ..., "post_ids": [...], ...}) or the bulk form on index.html.
+
+      schedule    schedule_time
+      spread      start, end, mode ('even' or 'best_times')
+      unschedule  -
+      label       label_id (empty clears the label)
+      delete      -
+    """
+    data = request.get_json(silent=True) or request.form
+    wants_json = request.is_json or request.accept_mimetypes.best == 'application/json'
+    action = data.get('action')
+    post_ids = bulk_posts.parse_post_ids(data.get('post_ids') if request.is_json else request.form.getlist('post_ids'))
+    duplicates = {}   # near-duplicates found when scheduling, reported with the result
+    unschedulable = []   # posts left alone because they are being or were already published
+
+    def respond(error=None, changed=(), status=200):
+        if wants_json:
+            if error:
+                return jsonify({'error': error}), status
+            return jsonify({'action': action, 'post_ids': list(changed),
+                            'skipped': [post_id for post_id in post_ids if post_id not in changed],
+                            'near_duplicates': {post_id: list(match) for post_id, match in duplicates.items()}})
+        flash(error or f"{len(changed)} post(s) updated.")
+        if unschedulable and not error:
+            flash(NOT_SCHEDULABLE_MESSAGE.format(count=len(unschedulable)))
+        if duplicates and not error:
+            flash(near_duplicate_message(duplicates))
+        return redirect(url_for('index'))
+
+    if action not in BULK_ACTIONS:
+        return respond(f"Unknown action. Use one of: {', '.join(BULK_ACTIONS)}.", status=400)
+    if not post_ids:
+        return respond("No posts selected.", status=400)
+    if len(post_ids) > bulk_posts.MAX_BULK_POSTS:
+        return respond(f"At most {bulk_posts.MAX_BULK_POSTS} posts can be changed at once.", status=400)
+
+    if action == 'schedule':
+        scheduled_for = parse_calendar_bound(data.get('schedule_time'))
+        if not scheduled_for:
+            return respond("A schedule_time is required.", status=400)
+    elif action == 'spread':
+        start = parse_calendar_bound(data.get('start'))
+        end = parse_calendar_bound(data.get('end'))
+        mode = data.get('mode') or 'even'
+        if not start or not end or end <= start:
+            return respond("A start before the end is required.", status=400)
+        if mode not in ('even', 'best_times'):
+            return respond("mode must be 'even' or 'best_times'.", status=400)
+    elif action == 'label':
+        label_id = data.get('label_id') or None
+        try:
+            label_id = int(label_id) if label_id is not None else None
+        except (TypeError, ValueError):
+            return respond("label_id must be a number.", status=400)
+
+    scheduled = []
+    with get_db_connection() as conn:
+        if not conn:
+            return respond("The database is unavailable.", status=503)
         cur = conn.cursor()
-        cur.execute("UPDATE posts SET scheduled_for = %s, status = 'scheduled' WHERE id = %s AND user_id = %s;", (scheduled_time_str, post_id, current_user.id))
+        if action in ('schedule', 'spread'):
+            # With NEAR_DUPLICATE_ON_SCHEDULE=block, near-duplicates are left unscheduled.
+            to_schedule, duplicates = screen_near_duplicates(cur, post_ids)
+        if action == 'schedule':
+            scheduled = bulk_posts.schedule_posts(cur, current_user.id, to_schedule, scheduled_for)
+        elif action == 'spread' and mode == 'best_times':
+            scheduled = bulk_posts.spread_posts_best_times(cur, current_user.id, to_schedule, start, end, bulk_posts.best_times())
+        elif action == 'spread':
+            scheduled = bulk_posts.spread_posts_evenly(cur, current_user.id, to_schedule, start, end)
+        elif action == 'unschedule':
+            changed = bulk_posts.unschedule_posts(cur, current_user.id, post_ids)
+        elif action == 'label':
+            changed = bulk_posts.label_posts(cur, current_user.id, post_ids, label_id)
+        else:
+            changed = bulk_posts.delete_posts(cur, current_user.id, post_ids)
         conn.commit()
         cur.close()
-        conn.close()
-    return redirect(url_for('index'))
+
+    if action in ('schedule', 'spread'):
+        # Queue exact-time tasks only once the new times are committed.
+        for post_id, schedule_version, seconds_until_due in scheduled:
+            enqueue_publish(post_id, schedule_version, seconds_until_due)
+        changed = [row[0] for row in scheduled]
+        if action in ('schedule', 'spread'):
+            unschedulable = [post_id for post_id in to_schedule if post_id not in changed]
+        if action == 'spread' and mode == 'best_times' and to_schedule and not changed:
+            return respond("Not enough free posting slots in that date range.", status=409)
+    return respond(changed=changed)
+
+@app.route('/export/<kind>.<fmt>')
+@login_required
+def export_content(kind, fmt):
+    """
+    Downloads all of the user's posts or blog_posts as CSV or JSONL. The body
+    is streamed from a server-side cursor while the connection stays checked out.
+    """
+    if kind not in transfer.COLUMNS or fmt not in transfer.FORMATS:
+        return jsonify({'error': 'Export posts or blog_posts as csv or jsonl.'}), 404
+    stack = ExitStack()
+    conn = stack.enter_context(get_db_connection())
+    if not conn:
+        stack.close()
+        return jsonify({'error': 'The database is unavailable.'}), 503
+
+    user_id = current_user.id
+
+    def chunks():
+        with stack:
+            yield from transfer.export_rows(conn, user_id, kind, fmt)
+
+    filename = f"{kind}-{datetime.now():%Y%m%d}.{fmt}"
+    return Response(stream_with_context(chunks()), mimetype=transfer.FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"', 'Cache-Control': 'no-store'})
+
+@app.route('/import', methods=['POST'])
+@login_required
+def import_content():
+    """
+    Imports an uploaded CSV or JSONL file ('file') of posts or blog_posts
+    ('kind') in one transaction, using the columns the export writes. Rows
+    that fail validation are skipped and reported; the rest go in via COPY.
+    """
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    kind = request.form.get('kind') or 'posts'
+    upload = request.files.get('file')
+
+    def respond(message, status=200, summary=None):
+        if wants_json:
+            return jsonify(summary if summary else {'error': message}), status
+        flash(message)
+        return redirect(url_for('index'))   # the blog list is cached, so it shows no flash messages
+
+    if kind not in transfer.COLUMNS:
+        return respond("kind must be posts or blog_posts.", 400)
+    if not upload or not upload.filename:
+        return respond("Choose a CSV or JSONL file to import.", 400)
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in transfer.FORMATS:
+        return respond("format must be csv or jsonl.", 400)
+
+    with get_db_connection() as conn:
+        if not conn:
+            return respond("The database is unavailable.", 503)
+        try:
+            summary = transfer.import_upload(conn, current_user.id, kind, fmt, upload.stream)
+        except transfer.TransferError as e:
+            return respond(str(e), 400)
+
+    # Queue exact-time tasks only once the imported schedules are committed.
+    scheduled = summary.pop('scheduled')
+    for post_id, schedule_version, seconds_until_due in scheduled:
+        enqueue_publish(post_id, schedule_version, seconds_until_due)
+    summary['scheduled'] = len(scheduled)
+    if summary['labels_created']:
+        invalidate_pages('labels')
+    if kind == 'blog_posts' and summary['inserted']:
+        invalidate_pages('blog_list')
+    message = (f"Imported {summary['inserted']} of {summary['rows']} row(s): "
+               f"{summary['duplicates']} already existed, {summary['skipped']} skipped.")
+    for error in summary['errors'][:5]:
+        message += f" {error}."
+    return respond(message, summary=summary)
+
+EDIT_POST_SQL = "SELECT id, post_text, hashtags, scheduled_for, label_id FROM posts WHERE id = %s AND user_id = %s;"
 
 @app.route('/edit/<int:post_id>')
 @login_required
 def edit(post_id):
     post = None
     labels_list = []
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("SELECT id, post_text, hashtags, scheduled_for, label_id FROM posts WHERE id = %s AND user_id = %s;", (post_id, current_user.id))
-        post_data = cur.fetchone()
-        cur.execute("SELECT id, name FROM labels WHERE user_id = %s ORDER BY name;", (current_user.id,))
-        labels_data = cur.fetchall()
-        for label_data in labels_data:
-            labels_list.append({'id': label_data[0], 'name': label_data[1]})
-        cur.close()
-        conn.close()
-        if post_data:
-            post = {'id': post_data[0], 'text': post_data[1], 'hashtags': post_data[2], 'scheduled_for': post_data[3], 'label_id': post_data[4]}
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute(EDIT_POST_SQL, (post_id, current_user.id))
+            post_data = cur.fetchone()
+            cur.close()
+            if post_data:
+                post = {'id': post_data[0], 'text': post_data[1], 'hashtags': post_data[2], 'scheduled_for': post_data[3], 'label_id': post_data[4]}
+                labels_list = get_labels(current_user.id)
     return render_template('edit.html', post=post, labels=labels_list)
 
 @app.route('/update/<int:post_id>', methods=['POST'])
@@ -455,35 +979,61 @@ def update(post_id):
     hashtags = request.form['hashtags']
     scheduled_time_str = request.form['schedule_time']
     label_id = request.form.get('label_id')
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        label_id_to_save = label_id if label_id else None
-        if scheduled_time_str:
-            cur.execute("""
-                UPDATE posts SET post_text = %s, hashtags = %s, scheduled_for = %s, status = 'scheduled', label_id = %s
-                WHERE id = %s AND user_id = %s;
-            """, (post_text, hashtags, scheduled_time_str, label_id_to_save, post_id, current_user.id))
-        else:
-            cur.execute("""
-                UPDATE posts SET post_text = %s, hashtags = %s, scheduled_for = NULL, status = 'draft', label_id = %s
-                WHERE id = %s AND user_id = %s;
-            """, (post_text, hashtags, label_id_to_save, post_id, current_user.id))
-        conn.commit()
-        cur.close()
-        conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            label_id_to_save = label_id if label_id else None
+            minhash, lsh_buckets = similarity.index_values(current_user.id, post_text)
+            if scheduled_time_str and similarity.NEAR_DUPLICATE_ON_SCHEDULE in ('warn', 'block'):
+                matches = similarity.find_similar(cur, current_user.id, minhash, lsh_buckets, exclude_id=post_id,
+                                                  statuses=similarity.PUBLISHED_STATUSES)
+                if matches:
+                    flash(near_duplicate_message({post_id: matches[0]}))
+                    if similarity.NEAR_DUPLICATE_ON_SCHEDULE == 'block':
+                        scheduled_time_str = ''   # the edit is still saved, as a draft
+            # Bumping schedule_version supersedes any publish task queued for the old time.
+            # Published posts are left alone like in schedule(): their edits would never go out.
+            if scheduled_time_str:
+                cur.execute(f"""
+                    UPDATE posts SET post_text = %s, hashtags = %s, scheduled_for = %s, status = 'scheduled', label_id = %s,
+                        schedule_version = schedule_version + 1, publish_attempts = 0, next_attempt_at = NULL, last_error = NULL,
+                        minhash = %s::bigint[], lsh_buckets = %s::bigint[]
+                    WHERE posts.id = %s AND posts.user_id = %s AND {bulk_posts.SCHEDULABLE}
+                    RETURNING schedule_version, EXTRACT(EPOCH FROM (scheduled_for - NOW()));
+                """, (post_text, hashtags, scheduled_time_str, label_id_to_save, minhash, lsh_buckets, post_id, current_user.id))
+                scheduled = cur.fetchone()
+                updated = scheduled is not None
+            else:
+                cur.execute(f"""
+                    UPDATE posts SET post_text = %s, hashtags = %s, scheduled_for = NULL, status = 'draft', label_id = %s,
+                        schedule_version = schedule_version + 1, publish_attempts = 0, next_attempt_at = NULL, last_error = NULL,
+                        minhash = %s::bigint[], lsh_buckets = %s::bigint[]
+                    WHERE posts.id = %s AND posts.user_id = %s AND {bulk_posts.SCHEDULABLE};
+                """, (post_text, hashtags, label_id_to_save, minhash, lsh_buckets, post_id, current_user.id))
+                scheduled = None
+                updated = cur.rowcount > 0
+            if updated:
+                # An edit can make a post a near-duplicate of any other post, or stop it being one,
+                # and the same goes for the posts flagged as near-duplicates of it.
+                similarity.flag_posts(cur, current_user.id, [post_id], older_only=False)
+                similarity.reflag_duplicates_of(cur, current_user.id, post_id)
+            else:
+                flash(NOT_SCHEDULABLE_MESSAGE.format(count=1))
+            conn.commit()
+            cur.close()
+            if scheduled:
+                enqueue_publish(post_id, scheduled[0], scheduled[1])
     return redirect(url_for('index'))
 
 @app.route('/delete/<int:post_id>', methods=['POST'])
 @login_required
 def delete(post_id):
-    conn = get_db_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM posts WHERE id = %s AND user_id = %s;", (post_id, current_user.id))
-        conn.commit()
-        cur.close()
-        conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM posts WHERE id = %s AND user_id = %s;", (post_id, current_user.id))
+            conn.commit()
+            cur.close()
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
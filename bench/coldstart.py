@@ -0,0 +1,143 @@
+# =====================================================
+# FILE: bench/coldstart.py
+# Cold-start profile of the web app as a serverless function sees it: a
+# fresh interpreter imports app.py and serves GET /login. Reports import
+# time, time to the first response and the packages import time goes to,
+# and fails (exit 1) when a heavy module loads before it is needed, the
+# import budget is exceeded or a stored baseline regresses. Safe for CI:
+# nothing here touches Postgres, Redis or Gemini.
+#
+#   python -m bench.coldstart --runs 5 --budget-ms 400 --save bench/coldstart.json
+#   python -m bench.coldstart --baseline bench/coldstart.json
+# =====================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from bench import report
+
+# Modules the login page doesn't need; each is imported by the code path that uses it.
+LAZY_MODULES = ("psycopg2", "requests", "celery", "kombu", "redis", "eventlet", "linkedin_api")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+status = app.app.test_client().get('/login').status_code
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (answered - started) * 1000,
+    "status": status,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """`python -X importtime` output -> {top-level package: self time in ms}."""
+    by_package = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue   # the header line
+        by_package[name.strip().split(".")[0]] += int(self_us) / 1000
+    return by_package
+
+
+def probe():
+    """One cold start in a fresh interpreter. Returns the probe's result dict plus process and package timings."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=ROOT,
+                            capture_output=True, text=True, env=os.environ.copy())
+    process_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "probe failed")
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    measured["process_ms"] = process_ms
+    measured["packages"] = parse_importtime(result.stderr)
+    return measured
+
+
+def profile(runs):
+    """Medians over `runs` cold starts, with the slowest packages by import time."""
+    samples = [probe() for _ in range(runs)]
+    median = lambda key: round(report.percentile(sorted(sample[key] for sample in samples), 0.5), 1)
+    packages = defaultdict(list)
+    for sample in samples:
+        for name, ms in sample["packages"].items():
+            packages[name].append(ms)
+    top = sorted(((name, report.percentile(sorted(values), 0.5)) for name, values in packages.items()),
+                 key=lambda item: item[1], reverse=True)[:15]
+    return {
+        "runs": runs,
+        "python": sys.version.split()[0],
+        "process_ms": median("process_ms"),
+        "import_ms": median("import_ms"),
+        "first_response_ms": median("first_response_ms"),
+        "status": samples[-1]["status"],
+        "loaded": sorted(set().union(*(sample["loaded"] for sample in samples))),
+        "packages": [{"name": name, "ms": round(ms, 1)} for name, ms in top],
+    }
+
+
+def print_profile(result):
+    print(f"cold start over {result['runs']} run(s), Python {result['python']}: "
+          f"import {result['import_ms']} ms, first response {result['first_response_ms']} ms "
+          f"(status {result['status']}), whole process {result['process_ms']} ms")
+    print(f"{'package':<28}{'self ms':>10}")
+    for package in result["packages"]:
+        print(f"{package['name']:<28}{package['ms']:>10}")
+    if result["loaded"]:
+        print(f"\nloaded before first use: {', '.join(result['loaded'])}")
+
+
+def check(result, budget_ms=None, baseline=None, tolerance=0.2):
+    """Returns a list of problems; empty means the profile passes."""
+    problems = []
+    if result["loaded"]:
+        problems.append(f"imported eagerly: {', '.join(result['loaded'])}")
+    if result["status"] != 200:
+        problems.append(f"GET /login returned {result['status']}")
+    if budget_ms is not None and result["import_ms"] > budget_ms:
+        problems.append(f"import took {result['import_ms']} ms, budget {budget_ms} ms")
+    if baseline:
+        for key in ("import_ms", "first_response_ms"):
+            if result[key] > baseline[key] * (1 + tolerance):
+                problems.append(f"{key} {result[key]} vs baseline {baseline[key]}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start profile of the Social Genie web app.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import takes longer")
+    parser.add_argument("--save", help="write the profile to this JSON file")
+    parser.add_argument("--baseline", help="compare against this saved profile")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression against the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    result = profile(args.runs)
+    print_profile(result)
+    if args.save:
+        report.save(result, args.save)
+        print(f"\nSaved profile to {args.save}")
+    baseline = report.load(args.baseline) if args.baseline else None
+    problems = check(result, args.budget_ms, baseline, args.tolerance)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# =====================================================
+# FILE: bench/fake_gemini.py
+# A local stand-in for the Gemini REST API. Answers generateContent and
+# streamGenerateContent (SSE) with text in the same marker format the real
+# prompts ask for, after a configurable delay.
+#
+#   python -m bench.fake_gemini --port 8765 --latency 2.0 --words 1500
+# =====================================================
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("automation workflow team client process growth system revenue time owner "
+         "pipeline tools scale simple results weekly hours customers data focus").split()
+
+
+def filler(n_words, rng=random):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def fake_posts(n_words, rng=random):
+    """Five '---'-separated posts, each ending in a hashtag line."""
+    per_post = max(n_words // 5, 10)
+    posts = [f"{filler(per_post, rng)}\n\n#automation #smallbusiness #bench{i}" for i in range(5)]
+    return "\n---\n".join(posts)
+
+
+def fake_blog(n_words, rng=random):
+    """A blog in the <BLOG_TITLE_START>/<BLOG_CONTENT_START>/<POST_START> format."""
+    paragraphs = "\n\n".join(f"<p>{filler(100, rng)}</p>" for _ in range(max(n_words // 100, 1)))
+    posts = "\n".join(f"<POST_START>{filler(60, rng)}\n\n#automation #bench{i}<POST_END>" for i in range(5))
+    return (f"<BLOG_TITLE_START>Benchmark article {rng.randint(1, 10**6)}<BLOG_TITLE_END>\n"
+            f"<BLOG_CONTENT_START>\n{paragraphs}\n<BLOG_CONTENT_END>\n{posts}")
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeGemini/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        latency, jitter = self.server.latency, self.server.jitter
+        time.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError):
+            self.send_error(400)
+            return
+        with self.server.lock:
+            self.server.calls += 1
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._delay()
+            self.send_error(503)
+            return
+        text = fake_blog(self.server.words) if "<BLOG_TITLE_START>" in prompt else fake_posts(self.server.words)
+
+        if ":streamGenerateContent" in self.path:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            chunks = [text[i:i + 400] for i in range(0, len(text), 400)]
+            pause = self.server.latency / max(len(chunks), 1)
+            for chunk in chunks:
+                time.sleep(pause)
+                event = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            self.close_connection = True
+            return
+
+        self._delay()
+        payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start(port=0, latency=1.0, jitter=0.2, words=800, error_rate=0.0):
+    """Starts the server on a background thread. Returns it; server.base_url is the API base."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency, server.jitter, server.words, server.error_rate = latency, jitter, words, error_rate
+    server.calls = 0
+    server.lock = threading.Lock()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in for benchmarks.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per response (spread over a stream)")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--words", type=int, default=800, help="approximate words per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 503")
+    args = parser.parse_args()
+    server = start(args.port, args.latency, args.jitter, args.words, args.error_rate)
+    print(f"Fake Gemini listening; set GEMINI_API_BASE={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
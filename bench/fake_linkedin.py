@@ -0,0 +1,73 @@
+# =====================================================
+# FILE: bench/fake_linkedin.py
+# A stand-in for the linkedin_api package used by linkedin_pool.py.
+# install() must run before linkedin_pool (or celery_worker) is imported.
+#
+#   FAKE_LINKEDIN_LATENCY       seconds per create_share call (default 0.3)
+#   FAKE_LINKEDIN_LOGIN_LATENCY seconds per fresh login (default 1.0)
+#   FAKE_LINKEDIN_FAILURE_RATE  fraction of create_share calls that raise (default 0)
+# =====================================================
+
+import os
+import random
+import sys
+import threading
+import time
+import types
+import uuid
+
+from requests.cookies import RequestsCookieJar
+
+stats = {"logins": 0, "shares": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+
+class ChallengeException(Exception):
+    pass
+
+
+class UnauthorizedException(Exception):
+    pass
+
+
+def _count(name):
+    with _stats_lock:
+        stats[name] += 1
+
+
+class _Client:
+    def __init__(self, cookies):
+        self.session = types.SimpleNamespace(cookies=cookies)
+
+
+class Linkedin:
+    """Mimics the constructor and the single call the worker makes."""
+
+    def __init__(self, username, password, *, authenticate=True, refresh_cookies=False, cookies=None, **kwargs):
+        if cookies is None or refresh_cookies:
+            time.sleep(float(os.getenv("FAKE_LINKEDIN_LOGIN_LATENCY", "1.0")))
+            _count("logins")
+            cookies = RequestsCookieJar()
+            cookies.set("li_at", uuid.uuid4().hex)
+        self.username = username
+        self.client = _Client(cookies)
+
+    def create_share(self, commentary, visibility="CONNECTIONS"):
+        time.sleep(float(os.getenv("FAKE_LINKEDIN_LATENCY", "0.3")))
+        if random.random() < float(os.getenv("FAKE_LINKEDIN_FAILURE_RATE", "0")):
+            _count("failures")
+            raise RuntimeError("fake LinkedIn: HTTP 500")
+        _count("shares")
+        return {"urn": f"urn:li:share:{uuid.uuid4().int % 10**18}"}
+
+
+def install():
+    """Registers this module as linkedin_api (and linkedin_api.client)."""
+    package = types.ModuleType("linkedin_api")
+    package.Linkedin = Linkedin
+    client = types.ModuleType("linkedin_api.client")
+    client.ChallengeException = ChallengeException
+    client.UnauthorizedException = UnauthorizedException
+    package.client = client
+    sys.modules["linkedin_api"] = package
+    sys.modules["linkedin_api.client"] = client
@@ -0,0 +1,71 @@
+# =====================================================
+# FILE: bench/publish_ticks.py
+# Runs the worker's reconciliation sweep against the fake LinkedIn backend
+# until no due posts are left, and prints its timings as JSON. Started as a
+# subprocess by bench/run.py because celery_worker monkey patches on import.
+# =====================================================
+
+from bench import fake_linkedin
+fake_linkedin.install()
+
+import celery_worker  # noqa: E402  (patches with eventlet, then imports the worker)
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import time  # noqa: E402
+
+from bench import querycount  # noqa: E402
+from bench.report import percentile  # noqa: E402
+from db import get_db_connection  # noqa: E402
+
+
+def due_posts():
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*) FROM posts
+            WHERE status = 'scheduled' AND scheduled_for <= NOW()
+              AND (next_attempt_at IS NULL OR next_attempt_at <= NOW());
+        """)
+        due = cur.fetchone()[0]
+        cur.close()
+    return due
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-ticks", type=int, default=20)
+    args = parser.parse_args()
+
+    querycount.install()
+    before = dict(fake_linkedin.stats)
+    tick_times = []
+    queries = []
+    started = time.perf_counter()
+    for _ in range(args.max_ticks):
+        if not due_posts():
+            break
+        queries_before = querycount.total()
+        tick_started = time.perf_counter()
+        celery_worker.check_and_post_scheduled_content()
+        tick_times.append((time.perf_counter() - tick_started) * 1000)
+        queries.append(querycount.total() - queries_before)
+    elapsed = time.perf_counter() - started
+
+    published = fake_linkedin.stats["shares"] - before["shares"]
+    tick_times.sort()
+    print(json.dumps({
+        "ticks": len(tick_times),
+        "published": published,
+        "failed": fake_linkedin.stats["failures"] - before["failures"],
+        "logins": fake_linkedin.stats["logins"] - before["logins"],
+        "elapsed_s": round(elapsed, 2),
+        "posts_per_second": round(published / elapsed, 2) if elapsed else None,
+        "tick_p50_ms": round(percentile(tick_times, 0.5), 2) if tick_times else None,
+        "tick_max_ms": round(tick_times[-1], 2) if tick_times else None,
+        "queries_per_tick": round(sum(queries) / len(queries), 2) if queries else None,
+    }))
+
+
+if __name__ == "__main__":
+    main()
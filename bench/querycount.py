@@ -0,0 +1,49 @@
+# =====================================================
+# FILE: bench/querycount.py
+# Counts SQL statements per thread by giving pooled connections a counting
+# cursor. The benchmark resets the count at the start of each request.
+# =====================================================
+
+import threading
+import time
+
+import psycopg2
+
+import db
+
+_local = threading.local()
+_total = [0]           # across all threads (and greenlets, in the worker)
+_total_lock = threading.Lock()
+
+
+def reset():
+    _local.count = 0
+
+
+def count():
+    return getattr(_local, "count", 0)
+
+
+def total():
+    return _total[0]
+
+
+def _counting_cursor():
+    class CountingCursor(db.get_cursor_class()):
+        def execute(self, query, vars=None):
+            _local.count = getattr(_local, "count", 0) + 1
+            with _total_lock:
+                _total[0] += 1
+            return super().execute(query, vars)
+    return CountingCursor
+
+
+def install():
+    """Makes every connection db.py opens from now on count its queries."""
+    CountingCursor = _counting_cursor()
+
+    def _connect(pool):
+        conn = psycopg2.connect(pool.dsn, cursor_factory=CountingCursor)
+        pool._created[id(conn)] = time.monotonic()
+        return conn
+    db.ConnectionPool._connect = _connect
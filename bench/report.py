@@ -0,0 +1,99 @@
+# =====================================================
+# FILE: bench/report.py
+# Latency percentiles, throughput and per-route query counts, plus a
+# comparison against a stored baseline report.
+# =====================================================
+
+import json
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples, elapsed, query_counts):
+    """
+    samples: {route: [(seconds, ok), ...]} measured by the clients.
+    query_counts: {route: [queries per request, ...]} measured by the server.
+    Returns {route: stats} with latencies in milliseconds.
+    """
+    routes = {}
+    for route, measurements in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _ in measurements)
+        errors = sum(1 for _, ok in measurements if not ok)
+        queries = query_counts.get(route) or []
+        routes[route] = {
+            "count": len(measurements),
+            "errors": errors,
+            "rps": round(len(measurements) / elapsed, 2) if elapsed else None,
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        }
+    return routes
+
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"\n{meta['requests']} requests in {meta['elapsed_s']}s "
+          f"({meta['throughput_rps']} req/s, concurrency {meta['concurrency']})")
+    print(f"{'route':<24}{'count':>7}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    for route, stats in report["routes"].items():
+        queries = stats["queries_per_request"]
+        print(f"{route:<24}{stats['count']:>7}{stats['errors']:>5}{stats['rps']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{queries if queries is not None else '-':>9}")
+    publish = report.get("publish")
+    if publish:
+        print(f"\npublish: {publish['published']} posted, {publish['failed']} failed in {publish['ticks']} tick(s); "
+              f"tick p50 {publish['tick_p50_ms']} ms, {publish['posts_per_second']} posts/s, "
+              f"{publish['queries_per_tick']} queries/tick")
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Prints p95/throughput changes per route against the baseline and returns
+    the routes that regressed by more than `tolerance` (0.2 = 20%).
+    """
+    regressions = []
+    print(f"\n{'route':<24}{'p95 base':>10}{'p95 now':>10}{'change':>9}{'rps base':>10}{'rps now':>9}{'change':>9}")
+    for route, stats in report["routes"].items():
+        base = baseline.get("routes", {}).get(route)
+        if not base:
+            print(f"{route:<24}{'(new)':>10}")
+            continue
+        p95_change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        rps_change = (stats["rps"] - base["rps"]) / base["rps"] if base["rps"] else 0.0
+        flag = ""
+        if p95_change > tolerance or rps_change < -tolerance:
+            regressions.append(route)
+            flag = "  REGRESSION"
+        print(f"{route:<24}{base['p95_ms']:>10}{stats['p95_ms']:>10}{p95_change:>+9.0%}"
+              f"{base['rps']:>10}{stats['rps']:>9}{rps_change:>+9.0%}{flag}")
+    base_publish, publish = baseline.get("publish"), report.get("publish")
+    if base_publish and publish and base_publish.get("posts_per_second"):
+        change = (publish["posts_per_second"] - base_publish["posts_per_second"]) / base_publish["posts_per_second"]
+        flag = ""
+        if change < -tolerance:
+            regressions.append("publish")
+            flag = "  REGRESSION"
+        print(f"{'publish posts/s':<24}{base_publish['posts_per_second']:>10}{publish['posts_per_second']:>10}{change:>+9.0%}{flag}")
+    return regressions
@@ -0,0 +1,287 @@
+# =====================================================
+# FILE: bench/run.py
+# Offline load test: the app against a disposable local Postgres, a fake
+# Gemini server and a fake linkedin_api. Seeds data, drives a traffic mix,
+# runs publish ticks, then reports p50/p95/p99, throughput and queries per
+# route, optionally against a stored baseline.
+#
+#   BENCH_DATABASE_URL=postgresql://localhost/genie_bench \
+#       python -m bench.run --users 20 --posts 500 --duration 60 --save bench/baseline.json
+#   python -m bench.run ... --baseline bench/baseline.json   # exits 1 on regression
+#
+# The benchmark database is TRUNCATEd; its name must contain "bench".
+# =====================================================
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+
+from bench import fake_gemini, report
+
+# Route name -> relative weight in the traffic mix.
+DEFAULT_MIX = {
+    "index": 30,
+    "api_posts": 25,
+    "blog": 10,
+    "view_blog": 10,
+    "labels": 5,
+    "search": 5,
+    "login": 5,
+    "generate": 5,
+    "generate_stream": 1,
+}
+
+
+def parse_mix(value):
+    """'index=30,api_posts=25' -> dict; unknown routes are rejected."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown route '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def configure_environment(args, gemini):
+    """Everything the app reads at import time, pointed at local stand-ins."""
+    from bench.seed import CREDENTIALS_KEY
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "GEMINI_API_BASE": gemini.base_url,
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_MAX_CONCURRENCY": str(args.concurrency),
+        "GENERATION_CACHE_BACKEND": "off",
+        "CELERY_BROKER_URL": "memory://",
+        "CELERY_RESULT_BACKEND": "cache+memory://",
+        "DB_POOL_MAX_SIZE": str(max(args.concurrency, 10)),
+        "LINKEDIN_SESSION_DIR": tempfile.mkdtemp(prefix="genie-bench-sessions-"),
+        "LINKEDIN_CREDENTIALS_KEY": CREDENTIALS_KEY,
+        "LINKEDIN_POSTS_PER_MINUTE": str(args.linkedin_rate),
+        "FAKE_LINKEDIN_LATENCY": str(args.linkedin_latency),
+        "FAKE_LINKEDIN_FAILURE_RATE": str(args.linkedin_failure_rate),
+        "SECRET_KEY": "bench",
+    })
+
+
+def start_app():
+    """Imports the app with query counting and serves it on a threaded local server."""
+    from werkzeug.serving import make_server
+
+    from bench import querycount
+    querycount.install()
+    from app import app
+
+    query_counts = defaultdict(list)
+    lock = threading.Lock()
+
+    @app.before_request
+    def _reset_query_count():
+        querycount.reset()
+
+    @app.after_request
+    def _record_query_count(response):
+        from flask import request
+        with lock:
+            query_counts[request.endpoint].append(querycount.count())
+        return response
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", query_counts
+
+
+class VirtualUser:
+    """One logged-in browser session issuing requests from the mix."""
+
+    def __init__(self, base_url, username, blog_ids):
+        self.base_url = base_url
+        self.username = username
+        self.blog_ids = blog_ids
+        self.session = requests.Session()
+
+    def login(self):
+        from bench.seed import PASSWORD
+        response = self.session.post(self.base_url + "/login", data={"username": self.username, "password": PASSWORD},
+                                     allow_redirects=False)
+        return response.status_code == 302 and "/login" not in response.headers.get("Location", "")
+
+    def request(self, route, rng):
+        get = self.session.get
+        url = self.base_url
+        if route == "login":
+            self.session = requests.Session()
+            return self.login()
+        if route == "index":
+            return get(url + "/").ok
+        if route == "api_posts":
+            start = time.strftime("%Y-%m-01T00:00:00")
+            return get(url + "/api/posts", params={"start": start, "end": time.strftime("%Y-%m-28T00:00:00")}).ok
+        if route == "blog":
+            return get(url + "/blog").ok
+        if route == "view_blog":
+            return get(url + f"/blog/{rng.choice(self.blog_ids)}").ok if self.blog_ids else get(url + "/blog").ok
+        if route == "labels":
+            return get(url + "/labels").ok
+        if route == "search":
+            return get(url + "/search", params={"q": rng.choice(fake_gemini.WORDS)}).ok
+        if route == "generate":
+            response = self.session.post(url + "/generate", data={"prompt": f"bench topic {rng.random()}"},
+                                         headers={"Accept": "application/json"})
+            return response.status_code == 202
+        if route == "generate_stream":
+            started = self.session.post(url + "/generate_blog/stream", data={"blog_prompt": f"bench blog {rng.random()}"})
+            if started.status_code != 202:
+                return False
+            response = get(url + started.json()["stream_url"], stream=True)
+            body = b"".join(response.iter_content(chunk_size=None))
+            return response.ok and b"event: done" in body
+        raise ValueError(route)
+
+
+def run_load(base_url, users, blog_ids_by_user, mix, concurrency, duration, seed_value):
+    """Runs `concurrency` virtual users for `duration` seconds. Returns ({route: [(seconds, ok)]}, elapsed)."""
+    from bench.seed import username
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    routes, weights = list(mix), list(mix.values())
+
+    def worker(n):
+        rng = random.Random(seed_value + n)
+        user_index = n % users
+        user = VirtualUser(base_url, username(user_index), blog_ids_by_user.get(user_index, []))
+        user.login()
+        while time.monotonic() < deadline:
+            route = rng.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = user.request(route, rng)
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[route].append((elapsed, ok))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def run_publish(max_ticks):
+    """Runs bench.publish_ticks in a subprocess (it monkey patches with eventlet)."""
+    result = subprocess.run([sys.executable, "-m", "bench.publish_ticks", "--max-ticks", str(max_ticks)],
+                            capture_output=True, text=True, env=os.environ.copy())
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Client route names -> Flask endpoints, for matching server-side query counts.
+ENDPOINTS = {
+    "index": "index", "api_posts": "api_posts", "blog": "blog", "view_blog": "view_blog", "labels": "labels",
+    "search": "search", "login": "login", "generate": "generate", "generate_stream": "generate_blog_stream",
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for Social Genie.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=500, help="posts per user")
+    parser.add_argument("--blogs", type=int, default=20, help="blog posts per user")
+    parser.add_argument("--due-fraction", type=float, default=0.05, help="share of posts due for publishing")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument("--gemini-latency", type=float, default=1.0)
+    parser.add_argument("--gemini-words", type=int, default=800)
+    parser.add_argument("--linkedin-latency", type=float, default=0.3)
+    parser.add_argument("--linkedin-failure-rate", type=float, default=0.0)
+    parser.add_argument("--linkedin-rate", type=float, default=600, help="posts per minute per account")
+    parser.add_argument("--publish-ticks", type=int, default=20, help="0 skips the publish phase")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/throughput regression (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+    if "bench" not in urlparse(args.database_url).path:
+        parser.error("the benchmark database is wiped; its name must contain 'bench'")
+
+    gemini = fake_gemini.start(latency=args.gemini_latency, words=args.gemini_words)
+    configure_environment(args, gemini)
+
+    import psycopg2
+
+    import migrate
+    from bench import seed
+    conn = psycopg2.connect(args.database_url)
+    migrate.migrate(conn)
+    seeded = None
+    if not args.skip_seed:
+        seed.reset(conn)
+        seeded = seed.seed(conn, args.users, args.posts, args.blogs, args.due_fraction, args.seed)
+        print(f"Seeded {seeded}")
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT u.username, b.id FROM blog_posts b JOIN users u ON u.id = b.user_id
+        WHERE u.username LIKE 'bench\\_user\\_%';
+    """)
+    blog_ids_by_user = defaultdict(list)
+    for name, blog_id in cur.fetchall():
+        blog_ids_by_user[int(name.rsplit('_', 1)[1])].append(blog_id)
+    cur.close()
+    conn.close()
+
+    server, base_url, query_counts = start_app()
+    samples, elapsed = run_load(base_url, args.users, blog_ids_by_user, args.mix, args.concurrency, args.duration, args.seed)
+    server.shutdown()
+
+    routes = report.summarize(samples, elapsed, {route: query_counts.get(endpoint, []) for route, endpoint in ENDPOINTS.items()})
+    total = sum(stats["count"] for stats in routes.values())
+    result = {
+        "meta": {
+            "concurrency": args.concurrency, "elapsed_s": round(elapsed, 2), "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "gemini_calls": gemini.calls, "seeded": seeded,
+            "settings": {key: value for key, value in vars(args).items() if key not in ("database_url", "save", "baseline")},
+        },
+        "routes": routes,
+        "publish": run_publish(args.publish_ticks) if args.publish_ticks else None,
+    }
+    gemini.shutdown()
+
+    report.print_report(result)
+    if args.save:
+        report.save(result, args.save)
+        print(f"\nSaved report to {args.save}")
+    if args.baseline:
+        regressions = report.compare(result, report.load(args.baseline), args.tolerance)
+        if regressions:
+            print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
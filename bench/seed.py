@@ -0,0 +1,90 @@
+# =====================================================
+# FILE: bench/seed.py
+# Fills a disposable database with N users x M posts (plus labels and blog
+# posts) shaped like real use: mostly drafts, some scheduled, a few due now.
+# =====================================================
+
+import random
+from datetime import datetime, timedelta
+
+from flask_bcrypt import generate_password_hash
+from psycopg2.extras import execute_values
+
+from bench.fake_gemini import filler
+
+PASSWORD = "bench-password"
+CREDENTIALS_KEY = "bench-credentials-key"   # LINKEDIN_CREDENTIALS_KEY for the seeded accounts
+TABLES = "generation_jobs, generation_batches, linkedin_accounts, posts, blog_posts, labels, users"
+LABEL_COLORS = ("#ec4899", "#10b981", "#6366f1", "#f59e0b", "#ef4444")
+
+
+def username(i):
+    return f"bench_user_{i}"
+
+
+def reset(conn):
+    """Empties every app table. Only ever point this at a benchmark database."""
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE;")
+    conn.commit()
+    cur.close()
+
+
+def seed(conn, users=20, posts_per_user=500, blogs_per_user=20, due_fraction=0.05, seed_value=1):
+    """
+    Inserts the data and returns a summary dict. Every user has the password
+    PASSWORD, hashed once with the app's default bcrypt cost.
+    """
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(microsecond=0)
+    password_hash = generate_password_hash(PASSWORD).decode("utf-8")
+    cur = conn.cursor()
+
+    user_ids = [row[0] for row in execute_values(
+        cur, "INSERT INTO users (username, password) VALUES %s RETURNING id;",
+        [(username(i), password_hash) for i in range(users)], fetch=True)]
+
+    # One LinkedIn account per user, so publishing is paced per account like in production.
+    execute_values(cur, "INSERT INTO linkedin_accounts (user_id, linkedin_username, linkedin_password_encrypted) VALUES %s;",
+                   [(user_id, f"{username(i)}@example.com", PASSWORD, CREDENTIALS_KEY) for i, user_id in enumerate(user_ids)],
+                   template="(%s, %s, pgp_sym_encrypt(%s, %s))")
+
+    label_ids = {}
+    for user_id in user_ids:
+        label_ids[user_id] = [row[0] for row in execute_values(
+            cur, "INSERT INTO labels (name, color, user_id) VALUES %s RETURNING id;",
+            [(f"Label {n}", color, user_id) for n, color in enumerate(LABEL_COLORS)], fetch=True)]
+
+    blog_rows = []
+    for user_id in user_ids:
+        for _ in range(blogs_per_user):
+            content = "\n\n".join(f"<p>{filler(100, rng)}</p>" for _ in range(15))
+            blog_rows.append((filler(6, rng), content, user_id, now - timedelta(minutes=rng.randint(0, 180 * 1440))))
+    execute_values(cur, "INSERT INTO blog_posts (title, content, user_id, created_at) VALUES %s;", blog_rows, page_size=200)
+
+    counts = {"draft": 0, "scheduled": 0, "due": 0, "posted": 0}
+    for user_id in user_ids:
+        rows = []
+        for _ in range(posts_per_user):
+            created_at = now - timedelta(minutes=rng.randint(0, 180 * 1440))
+            label_id = rng.choice(label_ids[user_id]) if rng.random() < 0.4 else None
+            roll = rng.random()
+            if roll < due_fraction:
+                status, scheduled_for, kind = "scheduled", now - timedelta(minutes=rng.randint(1, 60)), "due"
+            elif roll < 0.3:
+                status, scheduled_for, kind = "scheduled", now + timedelta(minutes=rng.randint(60, 30 * 1440)), "scheduled"
+            elif roll < 0.4:
+                status, scheduled_for, kind = "posted", created_at + timedelta(days=1), "posted"
+            else:
+                status, scheduled_for, kind = "draft", None, "draft"
+            counts[kind] += 1
+            rows.append((filler(60, rng), "#automation #smallbusiness", status, scheduled_for, label_id, user_id, created_at))
+        execute_values(cur, """
+            INSERT INTO posts (post_text, hashtags, status, scheduled_for, label_id, user_id, created_at) VALUES %s;
+        """, rows, page_size=500)
+
+    conn.commit()
+    cur.execute("ANALYZE;")
+    conn.commit()
+    cur.close()
+    return {"users": users, "posts": users * posts_per_user, "blog_posts": len(blog_rows), "by_status": counts}
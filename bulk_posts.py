@@ -0,0 +1,151 @@
+# =====================================================
+# FILE: bulk_posts.py
+# Set-based actions on many posts at once: schedule, spread across a date
+# range, unschedule, relabel and delete. Each helper runs one statement on
+# the caller's cursor so a whole bulk request commits as one transaction.
+# =====================================================
+
+import os
+from datetime import time
+
+MAX_BULK_POSTS = int(os.getenv("MAX_BULK_POSTS", "500"))
+
+# Times of day (server wall-clock, like scheduled_for) used by the 'best_times'
+# spread. Weekday mornings, lunchtime and early evening by default.
+BEST_POST_TIMES = os.getenv("BEST_POST_TIMES", "08:30,12:00,17:30")
+
+# Columns every scheduling action resets, so a rescheduled post gets a fresh
+# publish task and a fresh set of retry attempts.
+RESCHEDULE_SET = """
+    status = 'scheduled', schedule_version = posts.schedule_version + 1,
+    publish_attempts = 0, next_attempt_at = NULL, last_error = NULL
+"""
+# Posts that may be (re)scheduled: not being published right now, and never
+# published before. A post with a LinkedIn URN would only be skipped by the
+# worker's idempotency guard, so scheduling it again would publish nothing.
+SCHEDULABLE = "posts.status <> 'publishing' AND posts.linkedin_post_urn IS NULL"
+SCHEDULED_RETURNING = "RETURNING posts.id, posts.schedule_version, EXTRACT(EPOCH FROM (posts.scheduled_for - NOW()))"
+
+
+def parse_post_ids(values):
+    """Turns submitted ids into a de-duplicated list of ints, ignoring junk."""
+    post_ids = []
+    for value in values or []:
+        try:
+            post_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if post_id not in post_ids:
+            post_ids.append(post_id)
+    return post_ids
+
+
+def best_times(value=BEST_POST_TIMES):
+    """Parses a comma-separated list of HH:MM times, sorted."""
+    times = []
+    for part in value.split(','):
+        try:
+            hour, minute = part.strip().split(':')
+            times.append(time(int(hour), int(minute)))
+        except ValueError:
+            continue
+    return sorted(set(times))
+
+
+def schedule_posts(cur, user_id, post_ids, scheduled_for):
+    """Schedules the posts for one time. Returns (id, schedule_version, seconds_until_due) rows."""
+    cur.execute(f"""
+        UPDATE posts SET scheduled_for = %s, {RESCHEDULE_SET}
+        WHERE posts.id = ANY(%s) AND posts.user_id = %s AND {SCHEDULABLE}
+        {SCHEDULED_RETURNING};
+    """, (scheduled_for, post_ids, user_id))
+    return cur.fetchall()
+
+
+def spread_posts_evenly(cur, user_id, post_ids, start, end):
+    """
+    Gives the posts evenly spaced times from `start` up to (not including) `end`,
+    oldest draft first. Returns the same rows as schedule_posts().
+    """
+    cur.execute(f"""
+        WITH targets AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY created_at, id) - 1 AS slot, COUNT(*) OVER () AS total
+            FROM posts
+            WHERE posts.id = ANY(%s) AND posts.user_id = %s AND {SCHEDULABLE}
+        )
+        UPDATE posts SET
+            scheduled_for = %s::timestamp + (%s::timestamp - %s::timestamp) * (targets.slot::float8 / targets.total),
+            {RESCHEDULE_SET}
+        FROM targets
+        WHERE posts.id = targets.id
+        {SCHEDULED_RETURNING};
+    """, (post_ids, user_id, start, end, start))
+    return cur.fetchall()
+
+
+def spread_posts_best_times(cur, user_id, post_ids, start, end, times):
+    """
+    Puts the posts into the weekday `times` slots between `start` and `end`,
+    skipping slots the user already has a scheduled post in and spacing the
+    posts out evenly over the free slots. Nothing is scheduled if there are
+    fewer free slots than posts. Returns the same rows as schedule_posts().
+    """
+    cur.execute(f"""
+        WITH slots AS (
+            SELECT slot_time, ROW_NUMBER() OVER (ORDER BY slot_time) - 1 AS slot, COUNT(*) OVER () AS total
+            FROM (
+                SELECT day::date + tod AS slot_time
+                FROM generate_series(%s::date, %s::date, INTERVAL '1 day') AS days (day)
+                CROSS JOIN unnest(%s::time[]) AS times (tod)
+            ) candidates
+            WHERE slot_time >= %s AND slot_time < %s
+              AND EXTRACT(ISODOW FROM slot_time) < 6
+              AND NOT EXISTS (
+                  SELECT 1 FROM posts taken
+                  WHERE taken.user_id = %s AND taken.status = 'scheduled'
+                    AND taken.scheduled_for = candidates.slot_time AND taken.id <> ALL(%s)
+              )
+        ), targets AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY created_at, id) - 1 AS slot, COUNT(*) OVER () AS total
+            FROM posts
+            WHERE posts.id = ANY(%s) AND posts.user_id = %s AND {SCHEDULABLE}
+        )
+        UPDATE posts SET scheduled_for = slots.slot_time, {RESCHEDULE_SET}
+        FROM targets
+        JOIN slots ON slots.slot = targets.slot * slots.total / targets.total
+        WHERE posts.id = targets.id AND targets.total <= slots.total
+        {SCHEDULED_RETURNING};
+    """, (start, end, times, start, end, user_id, post_ids, post_ids, user_id))
+    return cur.fetchall()
+
+
+def unschedule_posts(cur, user_id, post_ids):
+    """Turns scheduled or failed posts back into drafts. Returns the ids changed."""
+    cur.execute("""
+        UPDATE posts SET status = 'draft', scheduled_for = NULL, schedule_version = schedule_version + 1,
+            publish_attempts = 0, next_attempt_at = NULL, last_error = NULL
+        WHERE id = ANY(%s) AND user_id = %s AND status IN ('scheduled', 'failed')
+        RETURNING id;
+    """, (post_ids, user_id))
+    return [row[0] for row in cur.fetchall()]
+
+
+def label_posts(cur, user_id, post_ids, label_id):
+    """Sets (or with label_id=None clears) the label on the posts. Returns the ids changed."""
+    if label_id is None:
+        cur.execute("UPDATE posts SET label_id = NULL WHERE id = ANY(%s) AND user_id = %s RETURNING id;", (post_ids, user_id))
+    else:
+        # Joining labels makes sure the label belongs to the same user.
+        cur.execute("""
+            UPDATE posts SET label_id = labels.id
+            FROM labels
+            WHERE labels.id = %s AND labels.user_id = %s AND posts.id = ANY(%s) AND posts.user_id = %s
+            RETURNING posts.id;
+        """, (label_id, user_id, post_ids, user_id))
+    return [row[0] for row in cur.fetchall()]
+
+
+def delete_posts(cur, user_id, post_ids):
+    """Deletes the posts, except any a worker is publishing right now. Returns the ids deleted."""
+    cur.execute("DELETE FROM posts WHERE id = ANY(%s) AND user_id = %s AND status <> 'publishing' RETURNING id;", (post_ids, user_id))
+    return [row[0] for row in cur.fetchall()]
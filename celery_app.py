@@ -0,0 +1,21 @@
+# =====================================================
+# FILE: celery_app.py
+# The shared Celery app. The worker registers tasks on it and the
+# Flask app uses it to enqueue them (without importing eventlet).
+# =====================================================
+
+import os
+from celery import Celery
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# We use '127.0.0.1' rather than 'localhost' to avoid a Windows issue.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
+
+celery_app = Celery(
+    'tasks',
+    broker=CELERY_BROKER_URL,
+    backend=os.getenv('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+)
+celery_app.conf.task_track_started = True
@@ -10,103 +10,234 @@ eventlet.monkey_patch()
 # --- END OF FIX ---
 
 import os
-import psycopg2
-from celery import Celery
+import time
 from celery.schedules import crontab
+from celery.signals import task_failure, task_postrun, task_prerun, worker_ready
 from dotenv import load_dotenv
-from linkedin_api import Linkedin
+from celery_app import celery_app
+from publisher import (
+    LINKEDIN_BURST, LINKEDIN_POSTS_PER_MINUTE, PUBLISH_CONCURRENCY, PUBLISH_ETA_HORIZON,
+    PUBLISH_LEASE_SECONDS, PUBLISH_MAX_BATCHES, PUBLISH_RECONCILE_INTERVAL,
+    claim_due_posts, claim_post, enqueue_publish, mark_posted_many, measure_backlog, new_claim_token, posts_due_soon,
+    publish_posts, publish_seconds, queue_backlog, record_failures, release_posts,
+)
+from linkedin_pool import get_account, get_linkedin_pool
+from rate_limit import create_keyed_limiter
+import generation
+import metrics
 
 # Load environment variables from the .env file
 load_dotenv()
 
-# --- CELERY CONFIGURATION (UPDATED) ---
-# We've changed 'localhost' to '127.0.0.1' to fix a Windows issue.
-celery_app = Celery(
-    'tasks',
-    broker='redis://127.0.0.1:6379/0',
-    backend='redis://127.0.0.1:6379/0'
-)
+# --- CELERY CONFIGURATION ---
+# celery_app is defined in celery_app.py so the Flask app can enqueue tasks
+# without importing this module (and eventlet's monkey patching).
+
+# Token buckets pacing create_share calls for each LinkedIn account, shared by
+# every worker process through Redis.
+account_limiter = create_keyed_limiter(LINKEDIN_POSTS_PER_MINUTE / 60.0, LINKEDIN_BURST)
+
+# --- INSTRUMENTATION ---
+# Served on WORKER_METRICS_PORT (if set) once the worker is up. Tasks run in
+# this process under the eventlet pool, so one registry sees all of them.
+
+task_seconds = metrics.Histogram("genie_task_seconds", "Celery task run time.", ["task", "state"])
+task_db_seconds = metrics.Histogram("genie_task_db_seconds", "Time a Celery task spent in SQL.", ["task"])
+task_failures = metrics.Counter("genie_task_failures_total", "Celery tasks that raised.", ["task"])
+_task_started = {}   # task_id -> perf_counter() at prerun
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    port = os.getenv("WORKER_METRICS_PORT")
+    if port:
+        metrics.serve(int(port))
+        if os.getenv("METRICS_TOKEN"):
+            print(f"WORKER: Serving metrics on port {port}.")
+        else:
+            print(f"WORKER: METRICS_TOKEN is not set; the metrics port {port} serves nothing.")
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    metrics.start_tally()
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    tally = metrics.stop_tally()
+    if started is None:
+        return
+    task_seconds.observe(time.perf_counter() - started, task=task.name, state=state or 'UNKNOWN')
+    if tally:
+        task_db_seconds.observe(tally['db_seconds'], task=task.name)
+
+@task_failure.connect
+def count_task_failure(sender=None, **kwargs):
+    task_failures.inc(task=sender.name if sender else 'unknown')
 
-# --- DATABASE CONNECTION FUNCTION ---
-def get_db_connection():
-    """Establishes a connection to the database."""
+def measure_queue_backlog():
+    """Records how many messages wait in the default broker queue (best effort)."""
+    queue = celery_app.conf.task_default_queue
     try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        return conn
+        with celery_app.connection_for_read() as connection:
+            queue_backlog.set(connection.default_channel.queue_declare(queue=queue, passive=True).message_count, queue=queue)
     except Exception as e:
-        print(f"WORKER: Error connecting to database: {e}")
-        return None
+        print(f"WORKER: Could not read the broker queue length: {e}")
 
 # --- THE MAIN BACKGROUND TASK ---
 @celery_app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
-    """Sets up the scheduled task to run every minute."""
-    sender.add_periodic_task(60.0, check_and_post_scheduled_content.s(), name='check for posts every minute')
+    """
+    Sets up the reconciliation sweep. Posts are normally published by exact-time
+    ETA tasks queued from app.py; the sweep is the safety net for anything those
+    missed and queues ETA tasks for posts that come within the horizon.
+    """
+    sender.add_periodic_task(PUBLISH_RECONCILE_INTERVAL, check_and_post_scheduled_content.s(), name='reconcile scheduled posts')
 
 @celery_app.task
-def check_and_post_scheduled_content():
+def publish_scheduled_post(post_id, schedule_version):
     """
-    This is the main task. It fetches due posts, posts them to LinkedIn,
-    and updates their status in the database.
+    Exact-time publish of a single post, queued with a countdown when it is
+    scheduled. Does nothing if the post has since been rescheduled or unscheduled.
     """
-    print("WORKER: Checking for scheduled posts...")
-    conn = get_db_connection()
-    if not conn:
+    claim_token = new_claim_token()
+    post_data = claim_post(post_id, schedule_version, claim_token)
+    if not post_data:
         return
+    post_id, post_urn, error = _publish_post(post_data)
+    if post_urn:
+        if not mark_posted_many([(post_id, post_urn)]):
+            print(f"WORKER: Post ID {post_id} was already recorded as posted.")
+    elif error:
+        _schedule_retries(record_failures([(post_id, error)], claim_token))
+    else:
+        release_posts([post_id], claim_token)
 
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, post_text, hashtags, user_id FROM posts
-        WHERE status = 'scheduled' AND scheduled_for <= NOW();
-    """)
-    posts_to_publish = cur.fetchall()
-    
-    if not posts_to_publish:
+@celery_app.task
+def check_and_post_scheduled_content():
+    """
+    This is the reconciliation sweep. It claims overdue posts in batches,
+    posts them to LinkedIn, and updates their status in the database, then
+    queues exact-time tasks for posts due before the next sweep. Claims use
+    SKIP LOCKED leases, so several workers can run this at once.
+    """
+    print("WORKER: Checking for scheduled posts...")
+    measure_backlog()
+    measure_queue_backlog()
+    claimed_any = False
+    deferred_ids = []   # rate-limited posts, released at the end of the tick so it doesn't re-claim them
+    claim_token = new_claim_token()   # this sweep's leases; other tasks in the process have their own
+    green_pool = eventlet.GreenPool(PUBLISH_CONCURRENCY)
+    for _ in range(PUBLISH_MAX_BATCHES):
+        posts_to_publish = claim_due_posts(claim_token)
+        if not posts_to_publish:
+            break
+        claimed_any = True
+        print(f"WORKER: Claimed {len(posts_to_publish)} post(s) to publish.")
+
+        # Publish the batch concurrently, then record all successes in one UPDATE.
+        # Failures are backed off in one UPDATE too, so they drop out of this tick's claims.
+        published = []
+        failures = []
+        for post_id, post_urn, error in green_pool.imap(_publish_post, posts_to_publish):
+            if post_urn:
+                published.append((post_id, post_urn))
+            elif error:
+                failures.append((post_id, error))
+            else:
+                deferred_ids.append(post_id)
+        recorded = mark_posted_many(published)
+        if published:
+            print(f"WORKER: Recorded {len(recorded)} published post(s).")
+        _schedule_retries(record_failures(failures, claim_token))
+
+    release_posts(deferred_ids, claim_token)
+    if not claimed_any:
         print("WORKER: No posts due for publishing.")
-        cur.close()
-        conn.close()
-        return
-
-    print(f"WORKER: Found {len(posts_to_publish)} post(s) to publish.")
 
-    linkedin_username = os.getenv("LINKEDIN_USERNAME")
-    linkedin_password = os.getenv("LINKEDIN_PASSWORD")
+    # Queue exact-time tasks for everything due before the sweep after next.
+    # Duplicates are harmless: only one task can claim a given schedule_version.
+    for post_id, schedule_version, seconds_until_due in posts_due_soon(min(PUBLISH_ETA_HORIZON, 2 * PUBLISH_RECONCILE_INTERVAL)):
+        enqueue_publish(post_id, schedule_version, seconds_until_due)
 
-    if not linkedin_username or not linkedin_password:
-        print("WORKER: LinkedIn credentials not found in .env file.")
-        cur.close()
-        conn.close()
-        return
+def _publish_post(post_data):
+    """
+    Publishes one claimed post, paced per account.
+    Returns (post_id, urn, error): a urn on success, an error message on failure,
+    or neither if the post was deferred by the rate limiter.
+    """
+    post_id, post_text, hashtags, user_id, existing_urn = post_data
+    started = time.perf_counter()
+    post_id, post_urn, error = _send_post(post_id, post_text, hashtags, user_id, existing_urn)
+    outcome = 'posted' if post_urn and not existing_urn else 'duplicate' if post_urn else 'failed' if error else 'deferred'
+    publish_posts.inc(outcome=outcome)
+    publish_seconds.observe(time.perf_counter() - started, outcome=outcome)
+    return post_id, post_urn, error
+
+def _send_post(post_id, post_text, hashtags, user_id, existing_urn):
+    full_post_content = f"{post_text}\n\n{hashtags}"
+
+    # Idempotency guard: a post that already has a URN went out before; never send it twice.
+    if existing_urn:
+        print(f"WORKER: Post ID {post_id} already published as {existing_urn}; not sending it again.")
+        return post_id, existing_urn, None
+
+    account = get_account(user_id)
+    if not account:
+        print(f"WORKER: No LinkedIn account configured for user {user_id}; skipping post ID {post_id}.")
+        return post_id, None, "No LinkedIn account configured."
+
+    # Stay inside LinkedIn's limits for this account; give up before the lease runs out.
+    if not account_limiter.acquire(account[0], timeout=PUBLISH_LEASE_SECONDS / 2):
+        print(f"WORKER: Rate limit for {account[0]} is saturated; post ID {post_id} will wait for the next tick.")
+        return post_id, None, None
 
     try:
-        api = Linkedin(linkedin_username, linkedin_password)
-        print("WORKER: Successfully authenticated with LinkedIn.")
+        # create_share isn't idempotent: an expired session fails this attempt (retried with backoff)
+        # instead of re-sending right away.
+        post_result = get_linkedin_pool().call(account, lambda api: api.create_share(commentary=full_post_content, visibility='CONNECTIONS'),
+                                               idempotent=False)
+        post_urn = post_result.get('urn')
+        if post_urn:
+            print(f"WORKER: Successfully posted post ID {post_id} to LinkedIn.")
+            return post_id, post_urn, None
+        print(f"WORKER: Failed to get post URN for post ID {post_id}. Post may have failed.")
+        return post_id, None, "LinkedIn did not return a post URN."
     except Exception as e:
-        print(f"WORKER: LinkedIn authentication failed: {e}")
-        cur.close()
-        conn.close()
-        return
+        print(f"WORKER: Error posting post ID {post_id} to LinkedIn: {e}")
+        return post_id, None, str(e) or e.__class__.__name__
 
-    for post_data in posts_to_publish:
-        post_id, post_text, hashtags, user_id = post_data
-        full_post_content = f"{post_text}\n\n{hashtags}"
+def _schedule_retries(retries):
+    """Queues exact-time tasks for posts whose retry backoff ends before the next sweep."""
+    for post_id, schedule_version, seconds_until_retry in retries:
+        enqueue_publish(post_id, schedule_version, seconds_until_retry)
 
-        try:
-            post_result = api.create_share(commentary=full_post_content, visibility='CONNECTIONS')
-            post_urn = post_result.get('urn')
-            
-            if post_urn:
-                print(f"WORKER: Successfully posted post ID {post_id} to LinkedIn.")
-                cur.execute(
-                    "UPDATE posts SET status = 'posted', linkedin_post_urn = %s WHERE id = %s;",
-                    (post_urn, post_id)
-                )
-                conn.commit()
-            else:
-                print(f"WORKER: Failed to get post URN for post ID {post_id}. Post may have failed.")
+# --- GENERATION TASKS ---
+# Queued by /generate, /generate_blog and /generate/batch in app.py; the job rows track progress.
+
+@celery_app.task
+def generate_posts(job_id):
+    """Generates 5 LinkedIn drafts for a generation job."""
+    return generation.run_job(job_id)
 
-        except Exception as e:
-            print(f"WORKER: Error posting post ID {post_id} to LinkedIn: {e}")
+@celery_app.task
+def generate_blog(job_id):
+    """Generates a blog post and 5 LinkedIn drafts for a generation job."""
+    return generation.run_job(job_id)
 
-    cur.close()
-    conn.close()
+@celery_app.task
+def generate_batch(batch_id):
+    """
+    Runs every pending job of a generation batch, with at most
+    GENERATION_BATCH_CONCURRENCY Gemini calls in flight across all batches in
+    this worker process. Each job saves its drafts and status as it finishes;
+    one failing topic doesn't stop the rest.
+    """
+    job_ids = generation.pending_batch_jobs(batch_id)
+    if not job_ids:
+        print(f"WORKER: Generation batch {batch_id} has no pending jobs.")
+        return {'jobs': 0, 'failed': 0}
+    green_pool = eventlet.GreenPool(max(1, min(generation.GENERATION_BATCH_CONCURRENCY, len(job_ids))))
+    failed = sum(1 for ok in green_pool.imap(generation.run_batch_job, job_ids) if not ok)
+    print(f"WORKER: Generation batch {batch_id} finished {len(job_ids)} job(s), {failed} failed.")
+    return {'jobs': len(job_ids), 'failed': failed}
@@ -0,0 +1,212 @@
+# =====================================================
+# FILE: db.py
+# Shared Postgres connection pool for app.py and celery_worker.py.
+# psycopg2 is imported on the first connect rather than at import time, so
+# a serverless cold start that never reaches the database doesn't load it.
+# =====================================================
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+_cursor_class = None
+
+
+def get_cursor_class():
+    """The cursor class pooled connections use, built on first call (it subclasses psycopg2's cursor)."""
+    global _cursor_class
+    if _cursor_class is None:
+        from psycopg2 import extensions
+
+        class InstrumentedCursor(extensions.cursor):
+            """Times every statement for /metrics and the current request's breakdown."""
+
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    elapsed = time.perf_counter() - started
+                    metrics.db_query_seconds.observe(elapsed)
+                    metrics.add_to_tally('db_seconds', elapsed, count_field='queries')
+
+        _cursor_class = InstrumentedCursor
+    return _cursor_class
+
+
+class ConnectionPool:
+    """
+    A small thread-safe (and eventlet-safe, once monkey patched) pool.
+
+    Unlike psycopg2's built-in pools this one keeps every returned connection
+    idle up to max_size, waits for a free slot instead of raising straight
+    away, pings connections that have sat idle for a while before handing
+    them out, and recycles connections that are broken or too old.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=10.0,
+                 max_lifetime=1800.0, ping_after=30.0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._idle = []        # (conn, created_at, returned_at), most recent last
+        self._created = {}     # id(conn) -> created_at
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._warmed = False
+
+    def _connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.dsn, cursor_factory=get_cursor_class())
+        self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _warm(self):
+        # Open min_size connections up front so the first requests don't pay for them.
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+        for _ in range(self.min_size):
+            try:
+                conn = self._connect()
+            except Exception:
+                return
+            now = time.monotonic()
+            with self._lock:
+                self._idle.append((conn, now, now))
+
+    def _is_healthy(self, conn, created_at, returned_at):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.ping_after is not None and now - returned_at >= self.ping_after:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1;")
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        """Checks a connection out of the pool, opening a new one if none are idle."""
+        if not self._warmed:
+            self._warm()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection free after {self.timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+                conn, created_at, returned_at = entry
+                if self._is_healthy(conn, created_at, returned_at):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        from psycopg2 import extensions
+        try:
+            if discard or conn.closed:
+                self._discard(conn)
+                return
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    self._discard(conn)
+                    return
+            created_at = self._created.get(id(conn), time.monotonic())
+            with self._lock:
+                self._idle.append((conn, created_at, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns the process-wide pool, creating it on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    os.getenv("DATABASE_URL"),
+                    min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+                    max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                    ping_after=float(os.getenv("DB_POOL_PING_AFTER", "30")),
+                )
+                _pool_pid = pid
+    return _pool
+
+
+@contextmanager
+def get_db_connection():
+    """
+    Borrows a pooled connection for the duration of a `with` block.
+
+    Yields None if the database can't be reached, so callers keep the usual
+    `if conn:` check. The connection always goes back to the pool; anything
+    left uncommitted is rolled back and connection-level failures cause the
+    connection to be thrown away rather than reused.
+    """
+    pool = get_pool()
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Error connecting to database: {e}")
+        yield None
+        return
+    import psycopg2   # loaded by the pool's first connect
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
@@ -0,0 +1,34 @@
+# =====================================================
+# FILE: drafts.py
+# Batched writes of draft posts, shared by the web app, the Celery
+# worker, bulk generation and imports.
+# =====================================================
+
+import similarity
+
+
+def insert_drafts(cur, user_id, records, blog_post_id=None, page_size=500):
+    """
+    Inserts (post_text, hashtags) records as drafts using multi-row INSERTs
+    (one statement per `page_size` records) and returns their new ids in order.
+    Each draft is stored with its near-duplicate signature and flagged if it
+    is a near-duplicate of an earlier post.
+    Runs on the caller's cursor, so the caller owns the transaction.
+    """
+    if not records:
+        return []
+    from psycopg2.extras import execute_values
+    rows = execute_values(
+        cur,
+        "INSERT INTO posts (post_text, hashtags, status, blog_post_id, user_id, minhash, lsh_buckets) VALUES %s RETURNING id;",
+        [(post_text, hashtags, blog_post_id, user_id) + similarity.index_values(user_id, post_text)
+         for post_text, hashtags in records],
+        template="(%s, %s, 'draft', %s, %s, %s::bigint[], %s::bigint[])",
+        page_size=page_size,
+        fetch=True,
+    )
+    post_ids = [row[0] for row in rows]
+    flagged = similarity.flag_posts(cur, user_id, post_ids)
+    if flagged:
+        print(f"Flagged {len(flagged)} of {len(post_ids)} new draft(s) as near-duplicates.")
+    return post_ids
@@ -0,0 +1,184 @@
+# =====================================================
+# FILE: gemini_client.py
+# One place to talk to the Gemini API: a keep-alive session, timeouts,
+# retries with backoff and a cap on concurrent calls.
+# =====================================================
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# Overridable so benchmarks can point the client at a local stand-in.
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+DEFAULT_MODEL = "gemini-2.5-flash-preview-05-20"
+
+# Statuses worth retrying: rate limiting and transient server errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Raised when Gemini can't be reached or returns an unusable response."""
+
+
+class GeminiClient:
+    """
+    A reusable Gemini client.
+
+    A single requests.Session keeps TLS connections alive between calls, every
+    call has connect/read timeouts, 429/5xx responses and network errors are
+    retried with capped exponential backoff plus full jitter, and a semaphore
+    limits how many calls this process has in flight at once.
+    """
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 max_concurrency=4, queue_timeout=60.0):
+        self.api_key = api_key
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # requests is imported here, on first use, to keep it off the web app's cold-start path.
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._network_errors = (requests.ConnectionError, requests.Timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"x-goog-api-key": api_key or ""})
+
+    def url(self, method):
+        return f"{GEMINI_API_BASE}/models/{self.model}:{method}"
+
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @contextmanager
+    def slot(self):
+        """Holds one of the concurrency slots for the duration of a call (or a whole stream)."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise GeminiError(f"Too many concurrent Gemini calls; gave up after {self.queue_timeout}s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def post(self, method, payload, **kwargs):
+        """
+        POSTs to a model method, retrying transient failures.
+        Returns the successful requests.Response; raises GeminiError otherwise.
+        Callers are expected to hold a slot().
+        """
+        attempt = 0
+        while True:
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url(method), json=payload, timeout=self.timeout, **kwargs)
+            except self._network_errors as e:
+                self._record(method, 'error', started)
+                error = GeminiError(f"Gemini request failed: {e}")
+            else:
+                self._record(method, str(response.status_code), started)
+                if response.status_code == 200:
+                    return response
+                error = GeminiError(f"Gemini returned HTTP {response.status_code}")
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+            if attempt >= self.max_retries:
+                raise error
+            delay = self._backoff(attempt, retry_after)
+            print(f"{error}; retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries}).")
+            time.sleep(delay)
+            attempt += 1
+
+    def _record(self, method, outcome, started):
+        elapsed = time.perf_counter() - started
+        metrics.gemini_request_seconds.observe(elapsed, method=method, outcome=outcome)
+        metrics.add_to_tally('gemini_seconds', elapsed, count_field='gemini_calls')
+
+    def generate_text(self, prompt):
+        """Sends a single prompt and returns the generated text."""
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        with self.slot():
+            response = self.post("generateContent", payload)
+            try:
+                result = response.json()
+                return result['candidates'][0]['content']['parts'][0]['text']
+            except (KeyError, IndexError, ValueError) as e:
+                raise GeminiError(f"Error parsing Gemini response: {e}")
+
+    def stream_text(self, prompt):
+        """
+        Streams a prompt through streamGenerateContent (server-sent events),
+        yielding text chunks as Gemini produces them. Only the initial request
+        is retried; a stream that breaks part-way raises GeminiError.
+        """
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        with self.slot():
+            response = self.post("streamGenerateContent", payload, params={"alt": "sse"}, stream=True)
+            waited = 0.0   # time spent waiting on Gemini, not on whoever consumes the chunks
+            try:
+                lines = response.iter_lines(decode_unicode=True)
+                while True:
+                    started = time.perf_counter()
+                    line = next(lines, None)
+                    waited += time.perf_counter() - started
+                    if line is None:
+                        break
+                    if not line or not line.startswith("data:"):
+                        continue
+                    try:
+                        result = json.loads(line[len("data:"):])
+                    except ValueError as e:
+                        raise GeminiError(f"Error parsing Gemini stream: {e}")
+                    for candidate in result.get('candidates', []):
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                yield part['text']
+            except self._network_errors as e:
+                raise GeminiError(f"Gemini stream interrupted: {e}")
+            finally:
+                response.close()
+                metrics.gemini_stream_seconds.observe(waited)
+                metrics.add_to_tally('gemini_seconds', waited)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Returns the process-wide client, configured from the environment on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient(
+                    os.getenv("GEMINI_API_KEY"),
+                    model=os.getenv("GEMINI_MODEL", DEFAULT_MODEL),
+                    connect_timeout=float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5")),
+                    read_timeout=float(os.getenv("GEMINI_READ_TIMEOUT", "120")),
+                    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+                    backoff_base=float(os.getenv("GEMINI_BACKOFF_BASE", "1")),
+                    backoff_max=float(os.getenv("GEMINI_BACKOFF_MAX", "30")),
+                    max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")),
+                    queue_timeout=float(os.getenv("GEMINI_QUEUE_TIMEOUT", "60")),
+                )
+    return _client
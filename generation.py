@@ -0,0 +1,453 @@
+# =====================================================
+# FILE: generation.py
+# Gemini prompts and the generation jobs that turn them into drafts.
+# Runs inside the Celery worker so web requests never wait on Gemini.
+# =====================================================
+
+import csv
+import io
+import os
+import threading
+
+from db import get_db_connection
+from drafts import insert_drafts
+from gemini_client import GeminiError, get_gemini_client
+from generation_cache import generation_key, get_generation_cache
+from page_cache import invalidate as invalidate_pages
+from post_parser import MarkerStreamParser, parse_blog, parse_posts, split_post
+
+
+class GenerationError(Exception):
+    """Raised when Gemini fails or returns something we can't parse."""
+
+
+# --- PROMPTS ---
+
+def build_posts_prompt(topic):
+    """The full prompt for 5 LinkedIn posts on a topic."""
+    full_prompt = f"""
+    Act as a "Systems Architect" and expert in business automation for small businesses. Your target audience is overwhelmed entrepreneurs who are looking to scale their operations and free up their time.
+    Your task is to create 5 distinct LinkedIn posts based on the following topic: "{topic}".
+    Each post must adhere to the following structure and guidelines:
+    - Tone: Professional, authoritative, and helpful, but with a human touch. Avoid overly technical jargon. Be friendly, informative, conversational, and engaging to encourage comments and reactions.
+    - Structure:
+      1. A compelling hook: Start with a question or a bold statement that addresses a common pain point of the target audience.
+      2. A value-driven body: Use bullet points to provide actionable tips, a case study, or a "before and after" scenario.
+      3. A clear call to action: End with a question to encourage engagement or an invitation to connect.
+    - Content: The 5 posts should be unique and cover different angles of the topic. For example:
+      - Post 1: A "why" post, explaining the strategic importance of the topic.
+      - Post 2: A "how-to" post, with actionable tips.
+      - Post 3: A case study, showcasing a real-world example.
+      - Post 4: A myth-busting post, addressing a common misconception.
+      - Post 5: A personal reflection, sharing your own experience with the topic.
+    - Hashtags: Include 3-5 relevant hashtags at the end of each post, such as #businessautomation, #systemsarchitect, #entrepreneurship, #smallbusinessowner, #efficiency.
+    Please provide the 5 LinkedIn posts in a clean, ready-to-post format, separated by '---'.
+    """
+    return full_prompt
+
+def build_blog_prompt(topic):
+    """The full prompt for a blog post plus 5 LinkedIn posts based on it."""
+    full_prompt = f"""
+    Act as a "Systems Architect" and a leading expert in business process automation. You are writing for an audience of ambitious entrepreneurs who want to scale their businesses through smart, technology-driven solutions.
+    Your task is to write a minimum 1500-word blog post on the following topic: "{topic}".
+    The blog post must meet the following criteria:
+    - Structure and Content:
+      - Engaging Introduction: Start with a relatable story or a startling statistic to hook the reader.
+      - In-depth Analysis: The body of the post should provide a detailed, step-by-step strategy. Use clear subheadings to break up the text.
+      - Evidence-Based Claims: Back up all claims with links to at least 3-5 external, reputable sources (e.g., industry reports, academic studies, articles from established business publications).
+      - Actionable Advice: The post should be practical and provide the reader with a clear roadmap they can follow.
+      - Strong Conclusion: Summarize the key takeaways and end with a powerful call to action.
+    - Tone: Authoritative, well-researched, and highly credible. The tone should reflect your position as a premium technical consultant.
+    
+    After the blog post, please generate 5 unique LinkedIn posts based on the content of the article. These posts should follow the same structure and guidelines as the previous prompt (hook, value-driven body, CTA, and relevant hashtags).
+    
+    Please provide the full blog post and the 5 LinkedIn posts using the following strict format:
+    <BLOG_TITLE_START>The Blog Title Goes Here<BLOG_TITLE_END>
+    <BLOG_CONTENT_START>
+    The entire blog content, with a minimum of 1500 words, goes here.
+    <BLOG_CONTENT_END>
+    <POST_START>
+    LinkedIn Post 1 content...
+    #hashtag1 #hashtag2
+    <POST_END>
+    <POST_START>
+    LinkedIn Post 2 content...
+    #hashtag3 #hashtag4
+    <POST_END>
+    <POST_START>
+    LinkedIn Post 3 content...
+    #hashtag5 #hashtag6
+    <POST_END>
+    <POST_START>
+    LinkedIn Post 4 content...
+    #hashtag7 #hashtag8
+    <POST_END>
+    <POST_START>
+    LinkedIn Post 5 content...
+    #hashtag9 #hashtag10
+    <POST_END>
+    """
+    return full_prompt
+
+
+# --- GEMINI ---
+
+def call_gemini(full_prompt, bypass_cache=False):
+    """
+    Sends a prompt to Gemini and returns the generated text.
+    Identical prompts are served from the generation cache unless bypass_cache is set.
+    """
+    client = get_gemini_client()
+    cache = get_generation_cache()
+    try:
+        if cache is None:
+            return client.generate_text(full_prompt)
+        key = generation_key(client.model, full_prompt)
+        return cache.get_or_generate(key, lambda: client.generate_text(full_prompt), bypass=bypass_cache)
+    except GeminiError as e:
+        raise GenerationError(str(e))
+
+
+# --- GENERATION ---
+
+def generate_posts(user_id, topic, bypass_cache=False):
+    """Generates 5 LinkedIn drafts for a user and returns their ids."""
+    generated_text = call_gemini(build_posts_prompt(topic), bypass_cache)
+    records = parse_posts(generated_text)
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        post_ids = insert_drafts(cur, user_id, records)
+        conn.commit()
+        cur.close()
+    return post_ids
+
+def generate_blog(user_id, topic, bypass_cache=False):
+    """Generates a blog post plus 5 LinkedIn drafts. Returns (blog_post_id, post_ids)."""
+    generated_text = call_gemini(build_blog_prompt(topic), bypass_cache)
+    blog_title, blog_content, records = parse_blog(generated_text)
+    if blog_title is None or blog_content is None or not records:
+        raise GenerationError("Could not find all required separators in the AI response.")
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        cur.execute("INSERT INTO blog_posts (title, content, user_id) VALUES (%s, %s, %s) RETURNING id;", (blog_title, blog_content, user_id))
+        blog_id = cur.fetchone()[0]
+        post_ids = insert_drafts(cur, user_id, records, blog_post_id=blog_id)
+        conn.commit()
+        cur.close()
+    invalidate_pages(user_id, 'blog_list')
+    return blog_id, post_ids
+
+def stream_blog(user_id, topic, bypass_cache=False):
+    """
+    Streams a blog generation, yielding (event, data) pairs for the SSE endpoint.
+
+    The blog row is saved as soon as <BLOG_CONTENT_END> arrives and each
+    LinkedIn post as soon as its <POST_END> arrives, so the browser can show
+    content long before Gemini has finished.
+    """
+    client = get_gemini_client()
+    cache = get_generation_cache()
+    full_prompt = build_blog_prompt(topic)
+    key = generation_key(client.model, full_prompt)
+    cached = cache.get(key) if cache and not bypass_cache else None
+    chunks = [cached] if cached is not None else client.stream_text(full_prompt)
+
+    parser = MarkerStreamParser()
+    received = []
+    title = None
+    blog_id = None
+    early_posts = []   # posts that arrive before the blog content is complete
+    post_ids = []
+    try:
+        for chunk in chunks:
+            received.append(chunk)
+            for event, value in parser.feed(chunk):
+                if event == 'title':
+                    title = value
+                    yield 'title', {'title': title}
+                elif event == 'content':
+                    yield 'content', {'text': value}
+                elif event == 'content_end':
+                    blog_id = _insert_blog(user_id, title or 'Untitled', value)
+                    yield 'blog', {'blog_post_id': blog_id}
+                    for raw_post in early_posts:
+                        post = _insert_streamed_post(user_id, blog_id, raw_post)
+                        post_ids.append(post['id'])
+                        yield 'post', post
+                    early_posts = []
+                elif event == 'post' and value:   # empty posts are skipped, as in parse_blog
+                    if blog_id is None:
+                        early_posts.append(value)
+                        continue
+                    post = _insert_streamed_post(user_id, blog_id, value)
+                    post_ids.append(post['id'])
+                    yield 'post', post
+    except GeminiError as e:
+        raise GenerationError(str(e))
+
+    if blog_id is None or not post_ids:
+        raise GenerationError("Could not find all required separators in the AI response.")
+    if cache and cached is None:
+        cache.set(key, ''.join(received))
+    yield 'done', {'blog_post_id': blog_id, 'post_ids': post_ids}
+
+def _insert_blog(user_id, title, content):
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        cur.execute("INSERT INTO blog_posts (title, content, user_id) VALUES (%s, %s, %s) RETURNING id;", (title, content, user_id))
+        blog_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    invalidate_pages(user_id, 'blog_list')
+    return blog_id
+
+def _insert_streamed_post(user_id, blog_id, raw_post):
+    post_text, hashtags = split_post(raw_post)
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        post_id = insert_drafts(cur, user_id, [(post_text, hashtags)], blog_post_id=blog_id)[0]
+        conn.commit()
+        cur.close()
+    return {'id': post_id, 'text': post_text, 'hashtags': hashtags}
+
+
+# --- GENERATION JOBS ---
+
+JOB_KINDS = ('posts', 'blog')
+
+def create_job(user_id, kind, topic, bypass_cache=False):
+    """Records a pending generation job and returns its id (None if the DB is down)."""
+    with get_db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("INSERT INTO generation_jobs (user_id, kind, topic, bypass_cache, status) VALUES (%s, %s, %s, %s, 'pending') RETURNING id;", (user_id, kind, topic, bypass_cache))
+        job_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+    return job_id
+
+def update_job(job_id, status, post_ids=None, blog_post_id=None, error=None):
+    """Moves a job to running/done/failed, storing its results or error."""
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE generation_jobs
+            SET status = %s, post_ids = COALESCE(%s, post_ids), blog_post_id = COALESCE(%s, blog_post_id),
+                error = %s, updated_at = NOW()
+            WHERE id = %s;
+        """, (status, post_ids, blog_post_id, error, job_id))
+        conn.commit()
+        cur.close()
+
+GET_JOB_SQL = """
+    SELECT id, kind, topic, status, post_ids, blog_post_id, error, created_at, updated_at
+    FROM generation_jobs WHERE id = %s AND user_id = %s;
+"""
+
+def get_job(job_id, user_id):
+    """Returns a job as a dict, or None if it doesn't exist or belongs to someone else."""
+    with get_db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute(GET_JOB_SQL, (job_id, user_id))
+        job_data = cur.fetchone()
+        cur.close()
+    if not job_data:
+        return None
+    return {
+        'id': job_data[0], 'kind': job_data[1], 'topic': job_data[2], 'status': job_data[3],
+        'post_ids': job_data[4] or [], 'blog_post_id': job_data[5], 'error': job_data[6],
+        'created_at': job_data[7], 'updated_at': job_data[8]
+    }
+
+def claim_job(job_id, user_id):
+    """
+    Moves one of the user's pending jobs to running and returns it as
+    (kind, topic, bypass_cache), or None if it doesn't exist or has already
+    started. Used by the streaming endpoint, which runs the job itself.
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE generation_jobs SET status = 'running', updated_at = NOW()
+            WHERE id = %s AND user_id = %s AND status = 'pending'
+            RETURNING kind, topic, bypass_cache;
+        """, (job_id, user_id))
+        job_data = cur.fetchone()
+        conn.commit()
+        cur.close()
+    return job_data
+
+def run_job(job_id):
+    """
+    Runs a pending job end to end. Called from the Celery tasks. The job is
+    claimed by moving it from pending to running, so a task delivered twice
+    doesn't generate (and save drafts) twice; the second run returns None.
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE generation_jobs SET status = 'running', updated_at = NOW()
+            WHERE id = %s AND status = 'pending'
+            RETURNING user_id, kind, topic, bypass_cache;
+        """, (job_id,))
+        job_data = cur.fetchone()
+        conn.commit()
+        cur.close()
+    if not job_data:
+        print(f"WORKER: Generation job {job_id} not found or already started.")
+        return None
+    user_id, kind, topic, bypass_cache = job_data
+    try:
+        if kind == 'blog':
+            blog_post_id, post_ids = generate_blog(user_id, topic, bypass_cache)
+        else:
+            blog_post_id, post_ids = None, generate_posts(user_id, topic, bypass_cache)
+    except Exception as e:
+        print(f"WORKER: Generation job {job_id} failed: {e}")
+        update_job(job_id, 'failed', error=str(e))
+        raise
+    update_job(job_id, 'done', post_ids=post_ids, blog_post_id=blog_post_id)
+    print(f"WORKER: Generation job {job_id} created {len(post_ids)} post(s).")
+    return {'post_ids': post_ids, 'blog_post_id': blog_post_id}
+
+
+# --- GENERATION BATCHES ---
+# A batch is one job per topic, run by a single worker task that fans the
+# Gemini calls out concurrently. Each job saves its drafts as soon as its own
+# call returns, so progress and failures are tracked per topic.
+
+MAX_BATCH_TOPICS = int(os.getenv("MAX_BATCH_TOPICS", "50"))
+# Gemini calls all batches in a worker process keep in flight at once. Defaults
+# to half the client's limit, so batches leave slots free for single /generate
+# jobs, whose waits for a slot are bounded by GEMINI_QUEUE_TIMEOUT.
+GENERATION_BATCH_CONCURRENCY = int(os.getenv("GENERATION_BATCH_CONCURRENCY",
+                                             str(max(1, int(os.getenv("GEMINI_MAX_CONCURRENCY", "4")) // 2))))
+# Shared by every batch in the process. Topics wait here without a timeout, so
+# they queue behind each other instead of failing on the Gemini client's queue.
+_batch_slots = threading.BoundedSemaphore(max(1, GENERATION_BATCH_CONCURRENCY))
+
+def run_batch_job(job_id):
+    """Runs one job of a batch once a batch slot is free. Returns True if it succeeded."""
+    with _batch_slots:
+        try:
+            return run_job(job_id) is not None
+        except Exception:
+            return False   # run_job has already logged it and marked the job failed
+
+def parse_topics(values=(), csv_text=None):
+    """
+    Collects topics from form values (each may hold one topic per line) and
+    from the first column of an uploaded CSV, skipping a 'topic' header row.
+    Blank and repeated topics are dropped; the order is kept.
+    """
+    topics = []
+    for value in values or []:
+        topics.extend(str(value).splitlines())
+    if csv_text:
+        rows = [row for row in csv.reader(io.StringIO(csv_text)) if row]
+        if rows and rows[0][0].strip().lower() == 'topic':
+            rows = rows[1:]
+        topics.extend(row[0] for row in rows)
+    unique = []
+    for topic in topics:
+        topic = topic.strip()
+        if topic and topic not in unique:
+            unique.append(topic)
+    return unique
+
+def create_batch(user_id, kind, topics, bypass_cache=False):
+    """Records a batch with one pending job per topic. Returns (batch_id, job_ids), or (None, []) if the DB is down."""
+    from psycopg2.extras import execute_values
+    with get_db_connection() as conn:
+        if not conn:
+            return None, []
+        cur = conn.cursor()
+        cur.execute("INSERT INTO generation_batches (user_id, kind) VALUES (%s, %s) RETURNING id;", (user_id, kind))
+        batch_id = cur.fetchone()[0]
+        rows = execute_values(cur, """
+            INSERT INTO generation_jobs (user_id, kind, topic, bypass_cache, status, batch_id) VALUES %s RETURNING id;
+        """, [(user_id, kind, topic, bypass_cache, batch_id) for topic in topics],
+            template="(%s, %s, %s, %s, 'pending', %s)", page_size=len(topics), fetch=True)
+        conn.commit()
+        cur.close()
+    return batch_id, [row[0] for row in rows]
+
+def fail_batch(batch_id, error):
+    """Marks every job of a batch that hasn't started as failed."""
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE generation_jobs SET status = 'failed', error = %s, updated_at = NOW()
+            WHERE batch_id = %s AND status = 'pending';
+        """, (error, batch_id))
+        conn.commit()
+        cur.close()
+
+def pending_batch_jobs(batch_id):
+    """Ids of a batch's jobs that haven't started, so a redelivered task doesn't redo finished topics."""
+    with get_db_connection() as conn:
+        if not conn:
+            raise GenerationError("Database unavailable")
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM generation_jobs WHERE batch_id = %s AND status = 'pending' ORDER BY id;", (batch_id,))
+        job_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+    return job_ids
+
+BATCH_JOBS_SQL = """
+    SELECT j.id, j.topic, j.status, j.post_ids, j.blog_post_id, j.error
+    FROM generation_jobs j JOIN generation_batches b ON b.id = j.batch_id
+    WHERE j.batch_id = %s AND b.user_id = %s
+    ORDER BY j.id;
+"""
+
+def get_batch(batch_id, user_id):
+    """
+    Returns a batch with every job's status as a dict, or None if it doesn't
+    exist or belongs to someone else. The batch is 'done' once no job is
+    pending or running, even if some failed.
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("SELECT kind, created_at FROM generation_batches WHERE id = %s AND user_id = %s;", (batch_id, user_id))
+        batch_data = cur.fetchone()
+        if not batch_data:
+            cur.close()
+            return None
+        cur.execute(BATCH_JOBS_SQL, (batch_id, user_id))
+        jobs = [{
+            'id': job_data[0], 'topic': job_data[1], 'status': job_data[2],
+            'post_ids': job_data[3] or [], 'blog_post_id': job_data[4], 'error': job_data[5]
+        } for job_data in cur.fetchall()]
+        cur.close()
+    counts = {status: 0 for status in ('pending', 'running', 'done', 'failed')}
+    for job in jobs:
+        counts[job['status']] = counts.get(job['status'], 0) + 1
+    return {
+        'id': batch_id, 'kind': batch_data[0], 'created_at': batch_data[1],
+        'status': 'running' if counts['pending'] or counts['running'] else 'done',
+        'counts': counts, 'total': len(jobs),
+        'post_count': sum(len(job['post_ids']) for job in jobs),
+        'jobs': jobs
+    }
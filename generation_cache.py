@@ -0,0 +1,210 @@
+# =====================================================
+# FILE: generation_cache.py
+# Content-addressed cache of Gemini generations, keyed by a hash of
+# (model, fully rendered prompt). Redis when available, otherwise an
+# in-process LRU, with single-flight so identical concurrent prompts
+# share one upstream call.
+# =====================================================
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from cache import TTLCache
+
+KEY_PREFIX = "genie:gen:"
+
+
+def generation_key(model, prompt):
+    """Stable cache key for a model + rendered prompt."""
+    return hashlib.sha256(f"{model}\x00{prompt}".encode('utf-8')).hexdigest()
+
+
+class LocalBackend:
+    """Per-process LRU; used when Redis isn't configured or reachable."""
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def acquire(self, key, timeout):
+        # The in-process single-flight in GenerationCache is all we need locally.
+        return "local"
+
+    def release(self, key, token):
+        pass
+
+
+class RedisBackend:
+    """
+    Shared across web and worker processes. Entries expire after `ttl` and a
+    sorted-set index (scored by write time) evicts the oldest once more than
+    `maxsize` entries exist. A SET NX lock gives cross-process single-flight;
+    it holds a random token, so a holder whose lock expired can't release the
+    lock another process has taken since.
+    """
+
+    # Deletes the lock only if it still holds the caller's token.
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client, maxsize, ttl):
+        self.client = client
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.index_key = KEY_PREFIX + "index"
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+
+    def get(self, key):
+        value = self.client.get(KEY_PREFIX + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value):
+        pipe = self.client.pipeline()
+        pipe.set(KEY_PREFIX + key, value, ex=int(self.ttl))
+        pipe.zadd(self.index_key, {key: time.time()})
+        pipe.zcard(self.index_key)
+        size = pipe.execute()[-1]
+        if size > self.maxsize:
+            evicted = self.client.zpopmin(self.index_key, size - self.maxsize)
+            if evicted:
+                self.client.delete(*[KEY_PREFIX + k.decode('utf-8') for k, _ in evicted])
+
+    def acquire(self, key, timeout):
+        """The lock's token if this process now holds it, otherwise None."""
+        token = uuid.uuid4().hex
+        if self.client.set(KEY_PREFIX + "lock:" + key, token, nx=True, ex=int(timeout)):
+            return token
+        return None
+
+    def release(self, key, token):
+        self._release(keys=[KEY_PREFIX + "lock:" + key], args=[token])
+
+
+class GenerationCache:
+    """Wraps a backend with get-or-generate and single-flight deduplication."""
+
+    def __init__(self, backend, lock_timeout=180.0, poll_interval=0.5):
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._inflight = {}   # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached text for `key`, or None. Backend errors count as a miss."""
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"Generation cache read failed: {e}")
+            return None
+
+    def set(self, key, value):
+        """Stores text for `key`; backend errors are logged and ignored."""
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            print(f"Generation cache write failed: {e}")
+
+    def _acquire(self, key):
+        """(lock token or None, whether the backend failed)."""
+        try:
+            return self.backend.acquire(key, self.lock_timeout), False
+        except Exception:
+            return None, True
+
+    def get_or_generate(self, key, generate, bypass=False):
+        """
+        Returns the cached text for `key`, or calls generate() and caches it.
+        With bypass=True the cache isn't read, but the fresh result is stored;
+        a bypassing caller that overlaps an identical prompt waits for it and
+        then generates its own text rather than taking the other's.
+        """
+        if not bypass:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+        # In-process single-flight: the first caller generates, the rest wait for it.
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+        if not leader:
+            event.wait(self.lock_timeout)
+            return self.get_or_generate(key, generate, bypass=bypass)
+
+        try:
+            # Cross-process single-flight: wait for another process already generating this prompt.
+            # If the backend fails, generate without the lock rather than not at all.
+            lock_token, backend_failed = self._acquire(key)
+            if lock_token is None and not backend_failed:
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(self.poll_interval)
+                    cached = None if bypass else self.get(key)
+                    if cached is not None:
+                        return cached
+                    lock_token, backend_failed = self._acquire(key)
+                    if lock_token is not None or backend_failed:
+                        break
+            try:
+                value = generate()
+                self.set(key, value)
+                return value
+            finally:
+                if lock_token is not None:
+                    try:
+                        self.backend.release(key, lock_token)
+                    except Exception:
+                        pass
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache():
+    """
+    Returns the process-wide cache, or None when GENERATION_CACHE_BACKEND=off.
+    Falls back to the in-process backend if Redis can't be reached.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend_name = os.getenv("GENERATION_CACHE_BACKEND", "redis").lower()
+                if backend_name == "off":
+                    return None
+                maxsize = int(os.getenv("GENERATION_CACHE_SIZE", "1000"))
+                ttl = float(os.getenv("GENERATION_CACHE_TTL", "86400"))
+                backend = None
+                if backend_name == "redis":
+                    try:
+                        import redis
+                        url = os.getenv("GENERATION_CACHE_URL") or os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+                        client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+                        client.ping()
+                        backend = RedisBackend(client, maxsize, ttl)
+                    except Exception as e:
+                        print(f"Generation cache: Redis unavailable ({e}); using in-process cache.")
+                if backend is None:
+                    backend = LocalBackend(maxsize, ttl)
+                _cache = GenerationCache(backend, lock_timeout=float(os.getenv("GENERATION_CACHE_LOCK_TIMEOUT", "180")))
+    return _cache
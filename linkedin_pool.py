@@ -0,0 +1,301 @@
+# =====================================================
+# FILE: linkedin_pool.py
+# Long-lived, per-account LinkedIn sessions for the Celery worker.
+# Sessions are kept in memory between ticks and their cookies are saved
+# (to disk or Redis, as JSON) so a restarted worker doesn't have to log in again.
+#
+# Per-user passwords are stored encrypted with pgcrypto under
+# LINKEDIN_CREDENTIALS_KEY. Rows written before that are encrypted by:
+#   python linkedin_pool.py encrypt-passwords
+# =====================================================
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+from linkedin_api import Linkedin
+
+from cache import TTLCache
+from db import get_db_connection
+
+try:
+    from linkedin_api.client import ChallengeException, UnauthorizedException
+    AUTH_EXCEPTIONS = (ChallengeException, UnauthorizedException)
+except ImportError:
+    AUTH_EXCEPTIONS = ()
+
+
+def is_auth_error(error):
+    """
+    True if a LinkedIn call was refused because the session is no longer
+    logged in: linkedin_api's auth exceptions or an HTTP 401. Anything else
+    (including a 403, which LinkedIn also uses for permissions and throttling)
+    is an ordinary failure.
+    """
+    if AUTH_EXCEPTIONS and isinstance(error, AUTH_EXCEPTIONS):
+        return True
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) == 401
+
+
+def dump_cookies(cookies):
+    """A cookie jar as JSON, keeping each cookie's domain and path."""
+    return json.dumps([{
+        'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+        'expires': cookie.expires, 'secure': cookie.secure,
+    } for cookie in cookies])
+
+
+def load_cookies(data):
+    """The cookie jar saved by dump_cookies."""
+    from requests.cookies import RequestsCookieJar, create_cookie
+    jar = RequestsCookieJar()
+    for cookie in json.loads(data):
+        jar.set_cookie(create_cookie(**cookie))
+    return jar
+
+
+class DiskCookieStore:
+    """Keeps one JSON cookie jar per account in a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, username):
+        safe_name = "".join(c if c.isalnum() else "_" for c in username)
+        return os.path.join(self.directory, f"{safe_name}.cookies.json")
+
+    def load(self, username):
+        try:
+            with open(self._path(username), encoding='utf-8') as f:
+                return load_cookies(f.read())
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, username, cookies):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(username), 'w', encoding='utf-8') as f:
+            f.write(dump_cookies(cookies))
+
+    def delete(self, username):
+        try:
+            os.remove(self._path(username))
+        except OSError:
+            pass
+
+
+class RedisCookieStore:
+    """Keeps cookie jars in Redis so every worker replica shares the same sessions."""
+
+    def __init__(self, client, prefix="genie:linkedin:cookies:"):
+        self.client = client
+        self.prefix = prefix
+
+    def load(self, username):
+        data = self.client.get(self.prefix + username)
+        if not data:
+            return None
+        try:
+            return load_cookies(data)
+        except (ValueError, TypeError):
+            return None   # e.g. a session saved in an older format; log in again
+
+    def save(self, username, cookies):
+        self.client.set(self.prefix + username, dump_cookies(cookies))
+
+    def delete(self, username):
+        self.client.delete(self.prefix + username)
+
+
+class LinkedInPool:
+    """
+    One authenticated Linkedin client per account.
+
+    Clients are created from saved cookies when possible. A fresh login only
+    happens when there are no usable cookies, or after a call fails with an
+    auth error, which drops the session. Only calls marked idempotent are
+    retried once after logging in again; others re-raise, so a post is never
+    sent twice by the pool itself.
+    """
+
+    def __init__(self, cookie_store):
+        self.cookie_store = cookie_store
+        self._clients = {}          # username -> Linkedin
+        self._locks = {}            # username -> lock, so an account only logs in once at a time
+        self._lock = threading.Lock()
+
+    def _account_lock(self, username):
+        with self._lock:
+            return self._locks.setdefault(username, threading.Lock())
+
+    def get(self, username, password):
+        """Returns a client for the account, restoring saved cookies or logging in."""
+        client = self._clients.get(username)
+        if client is not None:
+            return client
+        with self._account_lock(username):
+            client = self._clients.get(username)
+            if client is not None:
+                return client
+            cookies = None
+            try:
+                cookies = self.cookie_store.load(username)
+            except Exception as e:
+                print(f"WORKER: Could not load saved LinkedIn session for {username}: {e}")
+            if cookies:
+                client = Linkedin(username, password, cookies=cookies)
+                print(f"WORKER: Restored saved LinkedIn session for {username}.")
+            else:
+                client = self._login(username, password)
+            self._clients[username] = client
+            return client
+
+    def _login(self, username, password):
+        client = Linkedin(username, password, refresh_cookies=True)
+        print(f"WORKER: Successfully authenticated with LinkedIn as {username}.")
+        try:
+            self.cookie_store.save(username, client.client.session.cookies)
+        except Exception as e:
+            print(f"WORKER: Could not save LinkedIn session for {username}: {e}")
+        return client
+
+    def invalidate(self, username):
+        """Forgets an account's session so the next call logs in again."""
+        with self._lock:
+            self._clients.pop(username, None)
+        try:
+            self.cookie_store.delete(username)
+        except Exception:
+            pass
+
+    def call(self, account, fn, idempotent=False):
+        """
+        Runs fn(client) for an account given as (username, password). If the
+        session has expired it is dropped; an idempotent call is then retried
+        once with a fresh login, anything else re-raises and the next call
+        logs in.
+        """
+        username, password = account
+        client = self.get(username, password)
+        try:
+            return fn(client)
+        except Exception as e:
+            if not is_auth_error(e):
+                raise
+            print(f"WORKER: LinkedIn session for {username} expired ({e}); it will log in again.")
+            self.invalidate(username)
+            if not idempotent:
+                raise
+            with self._account_lock(username):
+                client = self._login(username, password)
+                self._clients[username] = client
+            return fn(client)
+
+
+# Per-user account lookups are cached briefly so a batch doesn't hit the DB per post.
+_accounts = TTLCache(maxsize=1024, ttl=float(os.getenv("LINKEDIN_ACCOUNT_CACHE_TTL", "300")))
+
+GET_ACCOUNT_SQL = """
+    SELECT linkedin_username, pgp_sym_decrypt(linkedin_password_encrypted, %s), linkedin_password
+    FROM linkedin_accounts WHERE user_id = %s;
+"""
+
+
+def get_account(user_id):
+    """
+    Returns (username, password) for the LinkedIn account a user posts as.
+    Users without their own row in linkedin_accounts fall back to the
+    LINKEDIN_USERNAME / LINKEDIN_PASSWORD account from .env. Returns None
+    if a stored password can't be decrypted.
+    """
+    account = _accounts.get(user_id)
+    if account:
+        return account
+    with get_db_connection() as conn:
+        if conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(GET_ACCOUNT_SQL, (os.getenv("LINKEDIN_CREDENTIALS_KEY"), user_id))
+                row = cur.fetchone()
+            except Exception as e:
+                print(f"WORKER: Could not decrypt the LinkedIn password of user {user_id}: {e}")
+                return None
+            finally:
+                cur.close()
+            if row:
+                username, password, legacy_password = row
+                if password is None and legacy_password is not None:
+                    print(f"WORKER: LinkedIn password of user {user_id} is stored unencrypted; "
+                          f"run `python linkedin_pool.py encrypt-passwords`.")
+                    password = legacy_password
+                if password is None:
+                    print(f"WORKER: LinkedIn password of user {user_id} can't be read; is LINKEDIN_CREDENTIALS_KEY set?")
+                    return None
+                account = (username, password)
+    if not account:
+        username = os.getenv("LINKEDIN_USERNAME")
+        password = os.getenv("LINKEDIN_PASSWORD")
+        account = (username, password) if username and password else None
+    if account:
+        account = tuple(account)
+        _accounts.set(user_id, account)
+    return account
+
+
+def encrypt_passwords(conn, key):
+    """Encrypts every plaintext linkedin_password under `key` and clears it. Returns the count."""
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE linkedin_accounts
+        SET linkedin_password_encrypted = pgp_sym_encrypt(linkedin_password, %s), linkedin_password = NULL
+        WHERE linkedin_password IS NOT NULL;
+    """, (key,))
+    encrypted = cur.rowcount
+    conn.commit()
+    cur.close()
+    return encrypted
+
+
+_pool = None
+
+
+def get_linkedin_pool():
+    """Returns the process-wide pool. LINKEDIN_SESSION_STORE chooses 'disk' (default) or 'redis'."""
+    global _pool
+    if _pool is None:
+        if os.getenv("LINKEDIN_SESSION_STORE", "disk").lower() == "redis":
+            import redis
+            url = os.getenv("LINKEDIN_SESSION_REDIS_URL") or os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+            store = RedisCookieStore(redis.Redis.from_url(url))
+        else:
+            store = DiskCookieStore(os.getenv("LINKEDIN_SESSION_DIR", ".linkedin_sessions"))
+        _pool = LinkedInPool(store)
+    return _pool
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LinkedIn account maintenance.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("encrypt-passwords", help="encrypt passwords stored before LINKEDIN_CREDENTIALS_KEY was used")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    key = os.getenv("LINKEDIN_CREDENTIALS_KEY")
+    if not key:
+        print("LINKEDIN_CREDENTIALS_KEY is not set.")
+        return 1
+    import migrate
+    conn = migrate.connect()
+    try:
+        if args.command == "encrypt-passwords":
+            print(f"Done: encrypted {encrypt_passwords(conn, key)} password(s).")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
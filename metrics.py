@@ -0,0 +1,199 @@
+# =====================================================
+# FILE: metrics.py
+# In-process counters and histograms rendered in the Prometheus text format,
+# plus a per-request breakdown of where time went (DB, Gemini, templates).
+# Each process keeps its own numbers: app.py serves them on /metrics and the
+# Celery worker on WORKER_METRICS_PORT.
+# =====================================================
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds. Wide enough for both a 2 ms query and a 90 s Gemini generation.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "50"))
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1   # buckets are cumulative
+            self._values[key] = (counts, total + value, observations + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key, value):
+        counts, total, observations = value
+        names = self.labelnames + ("le",)
+        lines = [f"{self.name}_bucket{_label_text(names, key + (bound,))} {count}"
+                 for bound, count in zip(self.buckets, counts)]
+        lines.append(f"{self.name}_bucket{_label_text(names, key + ('+Inf',))} {observations}")
+        lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {observations}")
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- PER-REQUEST BREAKDOWN ---
+# A thread (or, in the worker, greenlet) local tally that db.py and
+# gemini_client.py add to while a request or task is running.
+
+_current = threading.local()
+
+
+def start_tally():
+    _current.tally = {'db_seconds': 0.0, 'queries': 0, 'gemini_seconds': 0.0, 'gemini_calls': 0, 'render_seconds': 0.0}
+    return _current.tally
+
+
+def current_tally():
+    return getattr(_current, 'tally', None)
+
+
+def stop_tally():
+    tally = current_tally()
+    _current.tally = None
+    return tally
+
+
+def add_to_tally(field, amount, count_field=None):
+    tally = current_tally()
+    if tally is not None:
+        tally[field] += amount
+        if count_field:
+            tally[count_field] += 1
+
+
+# --- SHARED METRICS ---
+
+db_query_seconds = Histogram("genie_db_query_seconds", "Time spent executing one SQL statement.")
+gemini_request_seconds = Histogram("genie_gemini_request_seconds", "Gemini HTTP calls until response headers arrive.",
+                                   ["method", "outcome"])
+gemini_stream_seconds = Histogram("genie_gemini_stream_seconds", "Time spent waiting on a streamed Gemini response after its headers.")
+
+
+def is_slow(seconds, queries):
+    return seconds >= SLOW_REQUEST_SECONDS or queries >= SLOW_REQUEST_QUERIES
+
+
+def serve(port):
+    """
+    Serves /metrics on a background thread; used by processes without a web
+    app. Like the web app's endpoint it requires `Authorization: Bearer
+    $METRICS_TOKEN`, and serves nothing when METRICS_TOKEN isn't set.
+    """
+    import hmac
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            token = os.getenv("METRICS_TOKEN")
+            if not token or not self.path.startswith("/metrics"):
+                status, body = 404, b"Not Found\n"
+            elif not hmac.compare_digest(self.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+                status, body = 401, b"Unauthorized\n"
+            else:
+                status, body = 200, render().encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,209 @@
+# =====================================================
+# FILE: migrate.py
+# Applies the SQL files in migrations/ in order and records each one in
+# schema_migrations, then optionally checks that the hot queries use indexes.
+#
+#   python migrate.py            apply pending migrations (same as `up`)
+#   python migrate.py status     list applied and pending migrations
+#   python migrate.py check      EXPLAIN the route/worker queries and flag seq scans
+# =====================================================
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import psycopg2
+from dotenv import load_dotenv
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Any constant works; it just keeps two deploys from migrating at the same time.
+MIGRATION_LOCK_ID = 727001
+
+# A key no row was encrypted with; EXPLAIN never decrypts anything.
+SAMPLE_CREDENTIALS_KEY = "plan-check"
+
+
+def hot_queries():
+    """
+    (name, sql, params) for the queries behind the app's routes and the publish
+    worker, with sample parameters. The SQL is the constants the routes and the
+    worker run, so a changed query is checked as it now stands.
+    """
+    import app as web
+    import generation
+    import linkedin_pool
+    import publisher
+    import search
+    import similarity
+    from pagination import DEFAULT_PAGE_SIZE, page_query
+
+    now = datetime.now()
+    window_sql, window_params = web.calendar_window(now, now + timedelta(days=42))
+    return [
+        ("load_user", web.LOAD_USER_SQL, (1,)),
+        ("login", web.LOGIN_SQL, ("someone",)),
+        ("index (drafts page)", *page_query(web.DRAFTS_PAGE_SQL, (1,), (now, 2147483647), DEFAULT_PAGE_SIZE)),
+        ("blog (blog page)", *page_query(web.BLOG_PAGE_SQL, (1,), (now, 2147483647), DEFAULT_PAGE_SIZE)),
+        ("view_blog", web.VIEW_BLOG_SQL, (1, 1)),
+        ("calendar labels", web.LABELS_SQL, (1,)),
+        ("api_posts (validator)", web.CALENDAR_VALIDATOR_SQL.format(window=window_sql), (1,) + window_params),
+        ("api_posts (events)", web.CALENDAR_EVENTS_SQL.format(window=window_sql), (1,) + window_params),
+        ("near_duplicates_of", similarity.DUPLICATES_OF_SQL, (1, 1)),
+        ("near_duplicate_candidates", *similarity.candidates_query(1, [1, 2], exclude_id=1)),
+        ("edit", web.EDIT_POST_SQL, (1, 1)),
+        ("delete_label", web.UNLABEL_POSTS_SQL, (1, 1)),
+        ("claim_due_posts", publisher.CLAIM_DUE_POSTS_SQL, ("plan-check", publisher.PUBLISH_LEASE_SECONDS, publisher.PUBLISH_BATCH_SIZE)),
+        ("posts_due_soon", publisher.POSTS_DUE_SOON_SQL, (publisher.PUBLISH_ETA_HORIZON,)),
+        ("get_job", generation.GET_JOB_SQL, (1, 1)),
+        ("get_batch", generation.BATCH_JOBS_SQL, (1, 1)),
+        ("search (posts)", search.POSTS_SEARCH_SQL.format(filters=""), (search.HEADLINE_OPTIONS, "remote work", 1, search.MAX_RESULTS)),
+        ("search (blog posts)", search.BLOG_SEARCH_SQL.format(filters=""), (search.HEADLINE_OPTIONS, "remote work", 1, search.MAX_RESULTS)),
+        ("get_account", linkedin_pool.GET_ACCOUNT_SQL, (SAMPLE_CREDENTIALS_KEY, 1)),
+    ]
+
+
+def connect():
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        sys.exit("DATABASE_URL is not set.")
+    return psycopg2.connect(dsn)
+
+
+def migration_files():
+    """(version, filename) for every migration, in the order they apply."""
+    files = sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql"))
+    return [(f.split("_", 1)[0], f) for f in files]
+
+
+def ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+
+
+def applied_versions(cur):
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn):
+    """
+    Applies every pending migration, each in its own transaction together with
+    its schema_migrations row. Returns the filenames that were applied.
+
+    Databases set up before this tool existed already have some of these
+    changes; the migrations are written with IF NOT EXISTS so they re-apply cleanly.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+    try:
+        ensure_version_table(cur)
+        conn.commit()
+        done = applied_versions(cur)
+        applied = []
+        for version, filename in migration_files():
+            if version in done:
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, filename), encoding="utf-8") as f:
+                statements = f.read()
+            try:
+                cur.execute(statements)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, filename))
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                print(f"Migration {filename} failed; nothing from it was applied.")
+                raise
+            print(f"Applied {filename}")
+            applied.append(filename)
+        return applied
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+
+
+def status(conn):
+    """Prints each migration with whether it has been applied."""
+    cur = conn.cursor()
+    ensure_version_table(cur)
+    conn.commit()
+    cur.execute("SELECT version, applied_at FROM schema_migrations;")
+    applied_at = dict(cur.fetchall())
+    cur.close()
+    for version, filename in migration_files():
+        when = applied_at.get(version)
+        print(f"{'applied ' + when.strftime('%Y-%m-%d %H:%M') if when else 'pending':<24} {filename}")
+
+
+def seq_scans(plan):
+    """Relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan tree."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def check(conn, queries):
+    """
+    EXPLAINs every (name, sql, params) in `queries` and returns
+    [(name, [tables])] for the ones that still read a table sequentially.
+
+    Sequential scans are disabled for the check, so the planner only falls back
+    to one when no usable index exists; small development tables would
+    otherwise always be scanned.
+    """
+    cur = conn.cursor()
+    problems = []
+    try:
+        cur.execute("SET LOCAL enable_seqscan = off;")
+        for name, query, params in queries:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query.strip().rstrip(";"), params)
+            plan = cur.fetchone()[0]   # psycopg2 decodes the json column
+            tables = seq_scans(plan[0]["Plan"])
+            if tables:
+                problems.append((name, tables))
+    finally:
+        conn.rollback()
+        cur.close()
+    return problems
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply database migrations and check query plans.")
+    parser.add_argument("command", nargs="?", default="up", choices=["up", "status", "check"])
+    args = parser.parse_args(argv)
+
+    conn = connect()
+    try:
+        if args.command == "status":
+            status(conn)
+            return 0
+        if args.command == "up":
+            if not migrate(conn):
+                print("Database is up to date.")
+            return 0
+        queries = hot_queries()
+        problems = check(conn, queries)
+        for name, tables in problems:
+            print(f"SEQ SCAN  {name}: {', '.join(tables)}")
+        if problems:
+            print(f"{len(problems)} of {len(queries)} queries fall back to a sequential scan.")
+            return 1
+        print(f"All {len(queries)} queries use indexes.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+-- =====================================================
+-- FILE: migrations/0000_initial_schema.sql
+-- The base tables the app was originally deployed with. Everything is
+-- IF NOT EXISTS, so running this against an existing database is a no-op.
+-- Apply with: python migrate.py
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS labels (
+    id SERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    color TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS blog_posts (
+    id SERIAL PRIMARY KEY,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- scheduled_for holds the wall-clock time typed into the schedule form.
+CREATE TABLE IF NOT EXISTS posts (
+    id SERIAL PRIMARY KEY,
+    post_text TEXT NOT NULL,
+    hashtags TEXT,
+    status TEXT NOT NULL DEFAULT 'draft',   -- draft, scheduled, publishing, posted, failed
+    scheduled_for TIMESTAMP,
+    linkedin_post_urn TEXT,
+    label_id INTEGER REFERENCES labels (id) ON DELETE SET NULL,
+    blog_post_id INTEGER REFERENCES blog_posts (id) ON DELETE SET NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
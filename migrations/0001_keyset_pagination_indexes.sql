@@ -0,0 +1,13 @@
+-- =====================================================
+-- FILE: migrations/0001_keyset_pagination_indexes.sql
+-- Indexes backing the keyset (created_at, id) pagination in index() and blog().
+-- Apply with: python migrate.py
+-- =====================================================
+
+-- index() pages through one user's drafts, newest first.
+CREATE INDEX IF NOT EXISTS posts_user_status_created_idx
+    ON posts (user_id, status, created_at DESC, id DESC);
+
+-- blog() pages through one user's blog posts, newest first.
+CREATE INDEX IF NOT EXISTS blog_posts_user_created_idx
+    ON blog_posts (user_id, created_at DESC, id DESC);
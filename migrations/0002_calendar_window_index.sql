@@ -0,0 +1,24 @@
+-- =====================================================
+-- FILE: migrations/0002_calendar_window_index.sql
+-- Date-range lookups and change tracking for /api/posts.
+-- Apply with: python migrate.py
+-- =====================================================
+
+-- The calendar asks for one user's scheduled posts inside the visible window.
+CREATE INDEX IF NOT EXISTS posts_user_status_scheduled_idx
+    ON posts (user_id, status, scheduled_for);
+
+-- updated_at feeds the ETag/Last-Modified validators on /api/posts.
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posts_set_updated_at ON posts;
+CREATE TRIGGER posts_set_updated_at
+    BEFORE UPDATE ON posts
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
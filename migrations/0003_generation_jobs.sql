@@ -0,0 +1,21 @@
+-- =====================================================
+-- FILE: migrations/0003_generation_jobs.sql
+-- Tracks background Gemini generations queued by /generate and /generate_blog.
+-- Apply with: python migrate.py
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,                      -- 'posts' or 'blog'
+    topic TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    post_ids INTEGER[],
+    blog_post_id INTEGER REFERENCES blog_posts (id) ON DELETE SET NULL,
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS generation_jobs_user_created_idx
+    ON generation_jobs (user_id, created_at DESC);
@@ -0,0 +1,7 @@
+-- =====================================================
+-- FILE: migrations/0004_generation_cache_bypass.sql
+-- Lets a generation job skip the Gemini generation cache.
+-- Apply with: python migrate.py
+-- =====================================================
+
+ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS bypass_cache BOOLEAN NOT NULL DEFAULT FALSE;
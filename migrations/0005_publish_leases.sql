@@ -0,0 +1,15 @@
+-- =====================================================
+-- FILE: migrations/0005_publish_leases.sql
+-- Lease columns for SKIP LOCKED claiming in publisher.py.
+-- Apply with: python migrate.py
+-- =====================================================
+
+-- Posts move scheduled -> publishing (leased to one worker) -> posted.
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+
+-- The claim query only ever looks at due scheduled posts and expired leases.
+CREATE INDEX IF NOT EXISTS posts_scheduled_due_idx
+    ON posts (scheduled_for) WHERE status = 'scheduled';
+CREATE INDEX IF NOT EXISTS posts_publishing_lease_idx
+    ON posts (lease_expires_at) WHERE status = 'publishing';
@@ -0,0 +1,12 @@
+-- =====================================================
+-- FILE: migrations/0006_linkedin_accounts.sql
+-- Per-user LinkedIn accounts used by the worker's session pool.
+-- Users without a row post through LINKEDIN_USERNAME / LINKEDIN_PASSWORD.
+-- Apply with: python migrate.py
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS linkedin_accounts (
+    user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+    linkedin_username TEXT NOT NULL,
+    linkedin_password TEXT NOT NULL
+);
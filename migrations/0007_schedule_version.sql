@@ -0,0 +1,8 @@
+-- =====================================================
+-- FILE: migrations/0007_schedule_version.sql
+-- Versioning for exact-time publish tasks: every schedule change bumps
+-- schedule_version, so tasks queued for an older time become no-ops.
+-- Apply with: python migrate.py
+-- =====================================================
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS schedule_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,11 @@
+-- =====================================================
+-- FILE: migrations/0008_publish_retries.sql
+-- Retry bookkeeping for publishing: failed attempts are counted and backed
+-- off via next_attempt_at; after PUBLISH_MAX_ATTEMPTS a post is marked
+-- 'failed' with the last error kept for the user.
+-- Apply with: python migrate.py
+-- =====================================================
+
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS publish_attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMPTZ;
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS last_error TEXT;
@@ -0,0 +1,13 @@
+-- =====================================================
+-- FILE: migrations/0009_label_indexes.sql
+-- Indexes for the label queries, the last route queries without one.
+-- Apply with: python migrate.py
+-- =====================================================
+
+-- The label lists on the calendar and edit pages: one user's labels by name.
+CREATE INDEX IF NOT EXISTS labels_user_name_idx
+    ON labels (user_id, name);
+
+-- delete_label() detaches a label from every post that uses it.
+CREATE INDEX IF NOT EXISTS posts_label_idx
+    ON posts (label_id) WHERE label_id IS NOT NULL;
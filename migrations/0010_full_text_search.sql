@@ -0,0 +1,22 @@
+-- =====================================================
+-- FILE: migrations/0010_full_text_search.sql
+-- tsvector columns and GIN indexes behind /search. The columns are
+-- generated, so Postgres keeps them in step with every insert and edit.
+-- Needs Postgres 12+. Apply with: python migrate.py
+-- =====================================================
+
+-- Post text outranks hashtags; blog titles outrank their content.
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(post_text, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(hashtags, '')), 'B')
+    ) STORED;
+
+ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS posts_search_idx ON posts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS blog_posts_search_idx ON blog_posts USING GIN (search_vector);
@@ -0,0 +1,20 @@
+-- =====================================================
+-- FILE: migrations/0011_generation_batches.sql
+-- Groups the generation jobs submitted together by /generate/batch. Each
+-- topic is still its own job, so progress and failures stay per topic.
+-- Apply with: python migrate.py
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS generation_batches (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,                      -- 'posts' or 'blog', for every job in the batch
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE generation_jobs
+    ADD COLUMN IF NOT EXISTS batch_id INTEGER REFERENCES generation_batches (id) ON DELETE CASCADE;
+
+-- Batch progress polls read every job of one batch.
+CREATE INDEX IF NOT EXISTS generation_jobs_batch_idx
+    ON generation_jobs (batch_id, id) WHERE batch_id IS NOT NULL;
@@ -0,0 +1,17 @@
+-- =====================================================
+-- FILE: migrations/0012_near_duplicates.sql
+-- MinHash signatures and LSH buckets for near-duplicate detection (see
+-- similarity.py), plus the closest near-duplicate found for each post.
+-- Apply with: python migrate.py
+-- Then index existing posts with: python similarity.py backfill
+-- =====================================================
+
+ALTER TABLE posts
+    ADD COLUMN IF NOT EXISTS minhash BIGINT[],
+    ADD COLUMN IF NOT EXISTS lsh_buckets BIGINT[],
+    ADD COLUMN IF NOT EXISTS near_duplicate_of INTEGER REFERENCES posts (id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS near_duplicate_score REAL;
+
+-- Candidate lookup: posts sharing any LSH bucket (lsh_buckets && ...).
+CREATE INDEX IF NOT EXISTS posts_lsh_buckets_idx
+    ON posts USING GIN (lsh_buckets);
@@ -0,0 +1,13 @@
+-- =====================================================
+-- FILE: migrations/0013_encrypt_linkedin_passwords.sql
+-- Per-user LinkedIn passwords, encrypted with pgcrypto under
+-- LINKEDIN_CREDENTIALS_KEY (see linkedin_pool.py). The plaintext column only
+-- stays nullable for rows written before this.
+-- Apply with: python migrate.py
+-- Then encrypt existing passwords with: python linkedin_pool.py encrypt-passwords
+-- =====================================================
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+ALTER TABLE linkedin_accounts ADD COLUMN IF NOT EXISTS linkedin_password_encrypted BYTEA;
+ALTER TABLE linkedin_accounts ALTER COLUMN linkedin_password DROP NOT NULL;
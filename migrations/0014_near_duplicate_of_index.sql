@@ -0,0 +1,9 @@
+-- =====================================================
+-- FILE: migrations/0014_near_duplicate_of_index.sql
+-- Finds the posts flagged as near-duplicates of a post, which are re-flagged
+-- when it is edited; also keeps ON DELETE SET NULL from scanning posts.
+-- Apply with: python migrate.py
+-- =====================================================
+
+CREATE INDEX IF NOT EXISTS posts_near_duplicate_of_idx
+    ON posts (near_duplicate_of) WHERE near_duplicate_of IS NOT NULL;
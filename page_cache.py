@@ -0,0 +1,168 @@
+# =====================================================
+# FILE: page_cache.py
+# Per-user cache of rendered pages (and small lists like a user's labels).
+# Entries live in a namespace per user; invalidating a namespace bumps its
+# version, so every entry cached under the old version is skipped at once.
+# =====================================================
+
+import json
+import os
+import threading
+from collections import Counter
+
+from cache import TTLCache
+
+KEY_PREFIX = "genie:page:"
+
+
+def blog_namespace(blog_id):
+    """Namespace for one blog article, so editing it only drops its own page."""
+    return f"blog:{blog_id}"
+
+
+class LocalBackend:
+    """Per-process storage; invalidations only reach the process that makes them."""
+
+    def __init__(self, maxsize, ttl):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, name):
+        return self._versions.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+
+class RedisBackend:
+    """
+    Shared by every web and worker process, so a blog generated by the worker
+    invalidates the web processes' copies too. Versions outlive entries by a
+    wide margin, so an expired version can never resurrect a stale entry.
+    """
+
+    VERSION_TTL = 30 * 86400
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+
+    def version(self, name):
+        value = self.client.get(KEY_PREFIX + "ver:" + name)
+        return int(value) if value is not None else 0
+
+    def bump(self, name):
+        pipe = self.client.pipeline()
+        pipe.incr(KEY_PREFIX + "ver:" + name)
+        pipe.expire(KEY_PREFIX + "ver:" + name, self.VERSION_TTL)
+        pipe.execute()
+
+    def get(self, key):
+        value = self.client.get(KEY_PREFIX + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(KEY_PREFIX + key, json.dumps(value), ex=int(self.ttl))
+
+
+class PageCache:
+    """Versioned per-user namespaces on top of a backend, with hit/miss counters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _key(self, user_id, namespace, key):
+        name = f"{user_id}:{namespace}"
+        return f"{name}:{self.backend.version(name)}:{key}"
+
+    def get(self, user_id, namespace, key=''):
+        """The cached value, or None. Backend errors count as a miss."""
+        kind = namespace.split(':')[0]
+        try:
+            value = self.backend.get(self._key(user_id, namespace, key))
+        except Exception as e:
+            print(f"Page cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+        return value
+
+    def set(self, user_id, namespace, key, value):
+        try:
+            self.backend.set(self._key(user_id, namespace, key), value)
+        except Exception as e:
+            print(f"Page cache write failed: {e}")
+
+    def invalidate(self, user_id, *namespaces):
+        """Drops everything cached for the user under the given namespaces."""
+        for namespace in namespaces:
+            try:
+                self.backend.bump(f"{user_id}:{namespace}")
+            except Exception as e:
+                print(f"Page cache invalidation failed: {e}")
+
+    def stats(self):
+        """{kind: {'hits': n, 'misses': n}} for this process."""
+        kinds = set(self.hits) | set(self.misses)
+        return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind]} for kind in sorted(kinds)}
+
+
+_cache = None
+_cache_ready = False
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """
+    Returns the process-wide cache, or None when caching is off.
+    PAGE_CACHE_BACKEND is 'redis' (the default), 'local' or 'off'. Redis is
+    shared by every web and worker process, so an invalidation reaches all of
+    them; if it can't be reached the cache is turned off rather than falling
+    back to per-process copies that other processes would never invalidate.
+    'local' is only right for a single web process, and it doesn't see the
+    worker's invalidations, so new blogs can take PAGE_CACHE_TTL to appear.
+    """
+    global _cache, _cache_ready
+    if not _cache_ready:
+        with _cache_lock:
+            if not _cache_ready:
+                _cache = _create_page_cache()
+                _cache_ready = True
+    return _cache
+
+
+def _create_page_cache():
+    backend_name = os.getenv("PAGE_CACHE_BACKEND", "redis").lower()
+    ttl = float(os.getenv("PAGE_CACHE_TTL", "300"))
+    if backend_name == "local":
+        return PageCache(LocalBackend(int(os.getenv("PAGE_CACHE_SIZE", "2000")), ttl))
+    if backend_name != "redis":
+        return None
+    try:
+        import redis
+        url = os.getenv("PAGE_CACHE_URL") or os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+        client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        client.ping()
+    except Exception as e:
+        print(f"Page cache: Redis unavailable ({e}); page caching is off.")
+        return None
+    return PageCache(RedisBackend(client, ttl))
+
+
+def invalidate(user_id, *namespaces):
+    """Convenience for code outside the web app, e.g. the generation jobs."""
+    cache = get_page_cache()
+    if cache is not None:
+        cache.invalidate(user_id, *namespaces)
@@ -0,0 +1,69 @@
+# =====================================================
+# FILE: pagination.py
+# Keyset (created_at, id) cursors for the post and blog lists.
+# =====================================================
+
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, row_id):
+    """Turns the last row of a page into an opaque, URL-safe cursor."""
+    raw = f"{created_at.isoformat()}|{row_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Returns (created_at, id) for a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parses a ?page_size= value, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def page_query(sql, params, position, page_size):
+    """
+    The (query, params) fetch_page runs for a keyset template: rows after
+    `position` (a decoded cursor, or None for the first page), one extra row
+    over `page_size`.
+    """
+    if position:
+        keyset = "AND (created_at, id) < (%s, %s)"
+        params = tuple(params) + tuple(position)
+    else:
+        keyset = ""
+    return sql.format(keyset=keyset) + " LIMIT %s;", tuple(params) + (page_size + 1,)
+
+
+def fetch_page(cur, sql, params, cursor, page_size):
+    """
+    Runs a keyset query and returns (rows, next_cursor).
+
+    `sql` must contain a `{keyset}` placeholder inside its WHERE clause, must
+    ORDER BY created_at DESC, id DESC and select id and created_at as its
+    first two columns. One extra row is fetched to know if another page exists.
+    """
+    query, query_params = page_query(sql, params, decode_cursor(cursor), page_size)
+    cur.execute(query, query_params)
+    rows = cur.fetchall()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    return rows, next_cursor
@@ -0,0 +1,149 @@
+# =====================================================
+# FILE: post_parser.py
+# Parsing of Gemini output into blog titles, blog content and LinkedIn posts.
+# =====================================================
+
+TITLE_START, TITLE_END = '<BLOG_TITLE_START>', '<BLOG_TITLE_END>'
+CONTENT_START, CONTENT_END = '<BLOG_CONTENT_START>', '<BLOG_CONTENT_END>'
+POST_START, POST_END = '<POST_START>', '<POST_END>'
+
+# Which end marker closes each start marker, and the event it produces.
+BLOCKS = {
+    TITLE_START: (TITLE_END, 'title'),
+    CONTENT_START: (CONTENT_END, 'content'),
+    POST_START: (POST_END, 'post'),
+}
+LONGEST_MARKER = max(len(marker) for marker in list(BLOCKS) + [end for end, _ in BLOCKS.values()])
+
+
+def split_post(post_content):
+    """
+    Splits one generated post into (post_text, hashtags).
+    Hashtags start at the last line beginning with '#' and run to the end.
+    """
+    parts = post_content.strip().split('\n')
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i].strip().startswith('#'):
+            return "\n".join(parts[:i]).strip(), " ".join(parts[i:]).strip()
+    # Fallback if no hashtags are found
+    return "\n".join(parts).strip(), ""
+
+
+def _is_separator(line):
+    """A line made only of three or more dashes (surrounding whitespace allowed)."""
+    stripped = line.strip()
+    return len(stripped) >= 3 and set(stripped) == {'-'}
+
+
+def parse_posts(generated_text):
+    """
+    Splits a '---'-separated generation into a list of (post_text, hashtags)
+    records in a single pass over its lines. Empty posts are skipped.
+
+    Only a line made entirely of dashes separates posts. Earlier versions
+    split on every '---', so a dash run inside a sentence ("a --- b") or a
+    Markdown rule ("----") cut a post in two; now the former stays in its
+    post and the latter still separates.
+    """
+    records = []
+    lines = []
+    hashtag_index = -1   # index in `lines` of the last line starting with '#'
+
+    def flush():
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if lines:
+            if hashtag_index != -1:
+                records.append(("\n".join(lines[:hashtag_index]).strip(), " ".join(lines[hashtag_index:]).strip()))
+            else:
+                records.append(("\n".join(lines).strip(), ""))
+
+    for line in generated_text.split('\n'):
+        if _is_separator(line):
+            flush()
+            lines = []
+            hashtag_index = -1
+            continue
+        if not lines and not line.strip():
+            continue
+        if line.strip().startswith('#'):
+            hashtag_index = len(lines)
+        lines.append(line)
+    flush()
+    return records
+
+
+def parse_blog(generated_text):
+    """
+    Parses a complete blog generation in one pass.
+    Returns (title, content, records); title/content are None if missing.
+    """
+    parser = MarkerStreamParser()
+    title = content = None
+    records = []
+    for event, value in parser.feed(generated_text):
+        if event == 'title':
+            title = value
+        elif event == 'content_end':
+            content = value
+        elif event == 'post' and value:
+            records.append(split_post(value))
+    return title, content, records
+
+
+class MarkerStreamParser:
+    """
+    Incremental parser for the <BLOG_TITLE_START>/<BLOG_CONTENT_START>/<POST_START>
+    format, fed with chunks as Gemini streams them.
+
+    feed() returns a list of (event, value) tuples:
+      ('title', title)             once the title is complete
+      ('content', delta)           new blog content as it arrives
+      ('content_end', content)     the full blog content once it is complete
+      ('post', raw_post)           each LinkedIn post as soon as its <POST_END> arrives
+    Text is only emitted once it can no longer be the start of a marker.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._block = None      # the start marker we are inside, or None
+        self._content = []
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        events = []
+        while True:
+            if self._block is None:
+                found = [(self._buffer.find(marker), marker) for marker in BLOCKS]
+                found = [(pos, marker) for pos, marker in found if pos != -1]
+                if not found:
+                    # Keep just enough to recognise a marker split across chunks.
+                    self._buffer = self._buffer[-(LONGEST_MARKER - 1):]
+                    return events
+                pos, marker = min(found)
+                self._buffer = self._buffer[pos + len(marker):]
+                self._block = marker
+                continue
+
+            end_marker, event = BLOCKS[self._block]
+            end = self._buffer.find(end_marker)
+            if end == -1:
+                if event == 'content':
+                    safe = len(self._buffer) - (len(end_marker) - 1)
+                    if safe > 0:
+                        events.append(('content', self._buffer[:safe]))
+                        self._content.append(self._buffer[:safe])
+                        self._buffer = self._buffer[safe:]
+                return events
+
+            text = self._buffer[:end]
+            self._buffer = self._buffer[end + len(end_marker):]
+            self._block = None
+            if event == 'content':
+                if text:
+                    events.append(('content', text))
+                    self._content.append(text)
+                events.append(('content_end', ''.join(self._content).strip()))
+                self._content = []
+            else:
+                events.append((event, text.strip()))
@@ -0,0 +1,263 @@
+# =====================================================
+# FILE: publisher.py
+# Claiming of due posts for publishing. Posts are claimed in batches with
+# FOR UPDATE SKIP LOCKED and moved to 'publishing' with a lease, so any
+# number of workers can drain the queue without double-posting.
+# =====================================================
+
+import os
+import socket
+import uuid
+
+import metrics
+from db import get_db_connection
+
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "20"))
+PUBLISH_MAX_BATCHES = int(os.getenv("PUBLISH_MAX_BATCHES", "50"))
+PUBLISH_LEASE_SECONDS = int(os.getenv("PUBLISH_LEASE_SECONDS", "300"))
+# How many posts one worker process publishes at the same time (green threads).
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "5"))
+# Per-LinkedIn-account pacing: sustained posts per minute and allowed burst.
+LINKEDIN_POSTS_PER_MINUTE = float(os.getenv("LINKEDIN_POSTS_PER_MINUTE", "10"))
+LINKEDIN_BURST = int(os.getenv("LINKEDIN_BURST", "3"))
+# Posts due within this many seconds get an exact-time ETA task; later ones are
+# picked up by the reconciliation sweep as they come into range. Kept below the
+# Redis broker's visibility timeout (1 hour) so ETA tasks aren't redelivered early.
+PUBLISH_ETA_HORIZON = int(os.getenv("PUBLISH_ETA_HORIZON", "3000"))
+# How often the reconciliation sweep runs (seconds).
+PUBLISH_RECONCILE_INTERVAL = float(os.getenv("PUBLISH_RECONCILE_INTERVAL", "300"))
+# Failed publishes are retried with exponential backoff (base * 2^attempt, capped)
+# and marked 'failed' for good after PUBLISH_MAX_ATTEMPTS.
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))
+PUBLISH_RETRY_BASE = float(os.getenv("PUBLISH_RETRY_BASE", "60"))
+PUBLISH_RETRY_MAX = float(os.getenv("PUBLISH_RETRY_MAX", "3600"))
+
+claim_seconds = metrics.Histogram("genie_publish_claim_seconds", "Latency of the due-post claim queries.", ["path"])
+publish_seconds = metrics.Histogram("genie_publish_seconds", "Time to publish one post to LinkedIn.", ["outcome"])
+publish_posts = metrics.Counter("genie_publish_posts_total", "Publish attempts by outcome.", ["outcome"])
+due_backlog = metrics.Gauge("genie_publish_due_backlog", "Scheduled posts that are due but not yet claimed.")
+oldest_due_seconds = metrics.Gauge("genie_publish_oldest_due_seconds", "How overdue the oldest unclaimed due post is.")
+queue_backlog = metrics.Gauge("genie_celery_queue_backlog", "Messages waiting in the Celery broker queue.", ["queue"])
+
+# Identifies this worker process in claim tokens.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_claim_token():
+    """
+    A token for the posts one task invocation claims. Tasks in the same
+    process run concurrently (green threads), so ownership can't be per
+    process: a sweep must never release or fail a post another task reclaimed.
+    """
+    return f"{WORKER_ID}:{uuid.uuid4().hex}"
+
+
+# Claims due posts (and posts whose lease expired) for the sweep.
+CLAIM_DUE_POSTS_SQL = """
+    UPDATE posts
+    SET status = 'publishing', claimed_by = %s,
+        lease_expires_at = NOW() + make_interval(secs => %s)
+    WHERE id IN (
+        SELECT id FROM posts
+        WHERE (status = 'scheduled' AND scheduled_for <= NOW()
+               AND (next_attempt_at IS NULL OR next_attempt_at <= NOW()))
+           OR (status = 'publishing' AND lease_expires_at < NOW())
+        ORDER BY scheduled_for
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, post_text, hashtags, user_id, linkedin_post_urn;
+"""
+
+POSTS_DUE_SOON_SQL = """
+    SELECT id, schedule_version, EXTRACT(EPOCH FROM (scheduled_for - NOW()))
+    FROM posts
+    WHERE status = 'scheduled' AND scheduled_for > NOW()
+      AND scheduled_for <= NOW() + make_interval(secs => %s);
+"""
+
+
+def claim_due_posts(claim_token, limit=PUBLISH_BATCH_SIZE, lease_seconds=PUBLISH_LEASE_SECONDS):
+    """
+    Claims up to `limit` posts that are due and past any retry backoff (or whose
+    lease has expired because a worker crashed mid-publish) and returns them as
+    (id, post_text, hashtags, user_id, linkedin_post_urn) tuples, leased under
+    `claim_token`. Rows locked by other workers are skipped.
+    """
+    with claim_seconds.time(path='sweep'), get_db_connection() as conn:
+        if not conn:
+            return []
+        cur = conn.cursor()
+        cur.execute(CLAIM_DUE_POSTS_SQL, (claim_token, lease_seconds, limit))
+        claimed = cur.fetchall()
+        conn.commit()
+        cur.close()
+    return claimed
+
+
+def claim_post(post_id, schedule_version, claim_token, lease_seconds=PUBLISH_LEASE_SECONDS):
+    """
+    Claims one post for an exact-time publish task. Returns the post tuple, or
+    None if it was rescheduled (newer schedule_version), unscheduled, already
+    claimed, or isn't due yet.
+    """
+    with claim_seconds.time(path='eta'), get_db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE posts
+            SET status = 'publishing', claimed_by = %s,
+                lease_expires_at = NOW() + make_interval(secs => %s)
+            WHERE id = %s AND schedule_version = %s
+              AND status = 'scheduled' AND scheduled_for <= NOW() + INTERVAL '1 second'
+              AND (next_attempt_at IS NULL OR next_attempt_at <= NOW() + INTERVAL '1 second')
+            RETURNING id, post_text, hashtags, user_id, linkedin_post_urn;
+        """, (claim_token, lease_seconds, post_id, schedule_version))
+        claimed = cur.fetchone()
+        conn.commit()
+        cur.close()
+    return claimed
+
+
+def posts_due_soon(horizon=PUBLISH_ETA_HORIZON):
+    """(id, schedule_version, seconds_until_due) for scheduled posts due within `horizon` seconds."""
+    with get_db_connection() as conn:
+        if not conn:
+            return []
+        cur = conn.cursor()
+        cur.execute(POSTS_DUE_SOON_SQL, (horizon,))
+        upcoming = cur.fetchall()
+        cur.close()
+    return upcoming
+
+
+def measure_backlog():
+    """Updates the backlog gauges: due posts nobody has claimed yet, and how late the oldest is."""
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COUNT(*), EXTRACT(EPOCH FROM (NOW() - MIN(scheduled_for)))
+            FROM posts WHERE status = 'scheduled' AND scheduled_for <= NOW();
+        """)
+        due, oldest = cur.fetchone()
+        cur.close()
+    due_backlog.set(due)
+    oldest_due_seconds.set(float(oldest or 0))
+
+
+def enqueue_publish(post_id, schedule_version, seconds_until_due):
+    """
+    Queues an exact-time publish task for a post if it falls inside the ETA
+    horizon. Rescheduling bumps schedule_version, which turns any task queued
+    for the old time into a no-op.
+    """
+    if seconds_until_due is None or seconds_until_due > PUBLISH_ETA_HORIZON:
+        return
+    from celery_app import celery_app
+    try:
+        celery_app.send_task('celery_worker.publish_scheduled_post', args=[post_id, schedule_version],
+                             countdown=max(0.0, float(seconds_until_due)))
+    except Exception as e:
+        # The reconciliation sweep will still publish it, just less promptly.
+        print(f"Error queueing publish task for post {post_id}: {e}")
+
+
+def mark_posted_many(results):
+    """
+    Records a batch of successful publishes, given as (post_id, post_urn) pairs,
+    in one statement, and returns the ids it updated. The URN is stored even if
+    this worker's lease has lapsed, so the idempotency guard stops anyone else
+    from publishing the post again; only the first URN recorded for a post wins.
+    A post claimed again with the URN it already has (e.g. rescheduled after it
+    went out) is moved back to 'posted' rather than left in 'publishing'.
+    """
+    if not results:
+        return []
+    from psycopg2.extras import execute_values
+    with get_db_connection() as conn:
+        if not conn:
+            return []
+        cur = conn.cursor()
+        rows = execute_values(cur, """
+            UPDATE posts SET status = 'posted', linkedin_post_urn = v.urn, lease_expires_at = NULL,
+                claimed_by = NULL, next_attempt_at = NULL, last_error = NULL
+            FROM (VALUES %s) AS v (id, urn)
+            WHERE posts.id = v.id AND (posts.linkedin_post_urn IS NULL OR posts.linkedin_post_urn = v.urn)
+            RETURNING posts.id;
+        """, [(post_id, post_urn) for post_id, post_urn in results],
+            template="(%s::integer, %s::text)", fetch=True)
+        conn.commit()
+        cur.close()
+    return [row[0] for row in rows]
+
+
+def record_failures(failures, claim_token):
+    """
+    Records failed publish attempts, given as (post_id, error) pairs, in one
+    statement. Each post goes back to 'scheduled' with next_attempt_at pushed
+    out exponentially, or to 'failed' once it has used PUBLISH_MAX_ATTEMPTS.
+    Only posts still leased under `claim_token` are touched.
+    Returns (id, schedule_version, seconds_until_retry) for posts that will be retried.
+    """
+    if not failures:
+        return []
+    from psycopg2 import sql
+    from psycopg2.extras import execute_values
+    with get_db_connection() as conn:
+        if not conn:
+            return []
+        cur = conn.cursor()
+        # execute_values only fills the VALUES placeholder, so the settings go in as literals.
+        query = sql.SQL("""
+            UPDATE posts SET
+                publish_attempts = posts.publish_attempts + 1,
+                last_error = v.error,
+                status = CASE WHEN posts.publish_attempts + 1 >= {max_attempts} THEN 'failed' ELSE 'scheduled' END,
+                next_attempt_at = CASE WHEN posts.publish_attempts + 1 >= {max_attempts} THEN NULL
+                    ELSE NOW() + make_interval(secs => LEAST({retry_max}, {retry_base} * 2 ^ posts.publish_attempts)) END,
+                lease_expires_at = NULL, claimed_by = NULL
+            FROM (VALUES %s) AS v (id, error)
+            WHERE posts.id = v.id AND posts.status = 'publishing' AND posts.claimed_by = {claim_token}
+            RETURNING posts.id, posts.status, posts.schedule_version,
+                EXTRACT(EPOCH FROM (posts.next_attempt_at - NOW()));
+        """).format(
+            max_attempts=sql.Literal(PUBLISH_MAX_ATTEMPTS),
+            retry_max=sql.Literal(PUBLISH_RETRY_MAX),
+            retry_base=sql.Literal(PUBLISH_RETRY_BASE),
+            claim_token=sql.Literal(claim_token),
+        )
+        rows = execute_values(cur, query, [(post_id, str(error)[:1000]) for post_id, error in failures],
+                              template="(%s::integer, %s::text)", fetch=True)
+        conn.commit()
+        cur.close()
+    retries = []
+    for post_id, status, schedule_version, seconds_until_retry in rows:
+        if status == 'failed':
+            print(f"WORKER: Giving up on post ID {post_id} after {PUBLISH_MAX_ATTEMPTS} attempts.")
+            publish_posts.inc(outcome='gave_up')
+        else:
+            retries.append((post_id, schedule_version, seconds_until_retry))
+    return retries
+
+
+def release_posts(post_ids, claim_token):
+    """
+    Hands claimed posts back to the 'scheduled' queue without counting an attempt,
+    e.g. when the account's rate limit meant we never tried to publish them.
+    Posts another task has reclaimed since (under a different token) are left alone.
+    """
+    if not post_ids:
+        return
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE posts SET status = 'scheduled', lease_expires_at = NULL, claimed_by = NULL
+            WHERE id = ANY(%s) AND status = 'publishing' AND claimed_by = %s;
+        """, (list(post_ids), claim_token))
+        conn.commit()
+        cur.close()
@@ -0,0 +1,138 @@
+# =====================================================
+# FILE: rate_limit.py
+# Token buckets for pacing calls per LinkedIn account. The buckets live in
+# Redis so every worker process and replica draws from the same per-account
+# budget; in-process buckets are the fallback when Redis isn't available.
+# =====================================================
+
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second on average, with bursts of up to `capacity`.
+    acquire() sleeps until a token is free (a green sleep under eventlet).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Takes one token, waiting for it if needed. Returns False if `timeout` runs out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """One TokenBucket per key (e.g. per LinkedIn account), created on first use."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            return bucket
+
+    def acquire(self, key, timeout=None):
+        return self.bucket(key).acquire(timeout)
+
+
+# Refills and takes one token atomically. Returns "0" when a token was taken,
+# otherwise the seconds until one is free (as a string: Lua numbers would be
+# truncated to integers in the reply). Uses the Redis server's clock, so
+# workers on different hosts agree on the refill.
+TOKEN_BUCKET_SCRIPT = """
+redis.replicate_commands()
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisKeyedRateLimiter:
+    """
+    KeyedRateLimiter with the buckets in Redis, shared by every process that
+    uses the same Redis. If Redis fails mid-run, calls fall back to
+    in-process buckets until it answers again.
+    """
+
+    def __init__(self, client, rate, capacity, prefix="genie:ratelimit:"):
+        self.rate = rate
+        self.capacity = capacity
+        self.prefix = prefix
+        self._take = client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._fallback = KeyedRateLimiter(rate, capacity)
+
+    def acquire(self, key, timeout=None):
+        """Takes one token for `key`, waiting for it if needed. Returns False if `timeout` runs out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                wait = float(self._take(keys=[self.prefix + key], args=[self.rate, self.capacity]))
+            except Exception as e:
+                print(f"Rate limiter: Redis unavailable ({e}); pacing {key} in this process only.")
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                return self._fallback.acquire(key, remaining)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def create_keyed_limiter(rate, capacity):
+    """
+    The limiter the worker paces accounts with. RATE_LIMIT_BACKEND is 'redis'
+    (the default; RATE_LIMIT_REDIS_URL or the Celery broker) or 'local', which
+    only enforces the limits for a single worker process.
+    """
+    if os.getenv("RATE_LIMIT_BACKEND", "redis").lower() == "redis":
+        try:
+            import redis
+            url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+            client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            client.ping()
+            return RedisKeyedRateLimiter(client, rate, capacity)
+        except Exception as e:
+            print(f"Rate limiter: Redis unavailable ({e}); limits are enforced per process.")
+    return KeyedRateLimiter(rate, capacity)
@@ -0,0 +1,107 @@
+# =====================================================
+# FILE: search.py
+# Full-text search over a user's posts and blog posts, using the generated
+# search_vector columns and their GIN indexes (migrations/0010).
+# =====================================================
+
+from markupsafe import Markup, escape
+
+SEARCH_KINDS = ('all', 'posts', 'blog')
+POST_STATUSES = ('draft', 'scheduled', 'publishing', 'posted', 'failed')
+MAX_RESULTS = 50
+
+# ts_headline marks matches with control characters, which can't clash with
+# anything a user typed, and highlight() turns them into <mark> after escaping.
+_START, _STOP = '\x02', '\x03'
+HEADLINE_OPTIONS = f"StartSel={_START}, StopSel={_STOP}, MaxWords=35, MinWords=15, MaxFragments=2"
+
+
+# Snippets are only built for the page of hits, not for every match. `{filters}`
+# takes the extra conditions (see _filters); migrate.py check EXPLAINs these too.
+POSTS_SEARCH_SQL = """
+    SELECT id, created_at, rank, ts_headline('english', post_text, q, %s),
+           hashtags, status, scheduled_for, label_name, label_color
+    FROM (
+        SELECT p.id, p.created_at, ts_rank_cd(p.search_vector, q) AS rank, p.post_text, q,
+               p.hashtags, p.status, p.scheduled_for, l.name AS label_name, l.color AS label_color
+        FROM posts p
+        CROSS JOIN websearch_to_tsquery('english', %s) AS q
+        LEFT JOIN labels l ON l.id = p.label_id
+        WHERE p.user_id = %s AND p.search_vector @@ q{filters}
+        ORDER BY rank DESC, p.created_at DESC, p.id DESC
+        LIMIT %s
+    ) hits
+    ORDER BY rank DESC, created_at DESC, id DESC;
+"""
+BLOG_SEARCH_SQL = """
+    SELECT id, created_at, rank, title, ts_headline('english', regexp_replace(content, '<[^>]*>', ' ', 'g'), q, %s)
+    FROM (
+        SELECT b.id, b.created_at, ts_rank_cd(b.search_vector, q) AS rank, b.title, b.content, q
+        FROM blog_posts b
+        CROSS JOIN websearch_to_tsquery('english', %s) AS q
+        WHERE b.user_id = %s AND b.search_vector @@ q{filters}
+        ORDER BY rank DESC, b.created_at DESC, b.id DESC
+        LIMIT %s
+    ) hits
+    ORDER BY rank DESC, created_at DESC, id DESC;
+"""
+
+
+def highlight(headline):
+    """Escapes a ts_headline snippet and wraps the matched words in <mark>."""
+    return Markup(str(escape(headline or '')).replace(_START, '<mark>').replace(_STOP, '</mark>'))
+
+
+def _filters(alias, date_from, date_to):
+    sql, params = "", ()
+    if date_from:
+        sql += f" AND {alias}.created_at >= %s"
+        params += (date_from,)
+    if date_to:
+        sql += f" AND {alias}.created_at < %s"
+        params += (date_to,)
+    return sql, params
+
+
+def search_posts(cur, user_id, query, limit, label_id=None, status=None, date_from=None, date_to=None):
+    """Best-ranked posts matching `query`, newest first among equal ranks."""
+    filter_sql, filter_params = _filters('p', date_from, date_to)
+    if label_id:
+        filter_sql += " AND p.label_id = %s"
+        filter_params += (label_id,)
+    if status:
+        filter_sql += " AND p.status = %s"
+        filter_params += (status,)
+    cur.execute(POSTS_SEARCH_SQL.format(filters=filter_sql), (HEADLINE_OPTIONS, query, user_id) + filter_params + (limit,))
+    return [{
+        'kind': 'post', 'id': row[0], 'created_at': row[1], 'rank': row[2], 'snippet': highlight(row[3]),
+        'hashtags': row[4], 'status': row[5], 'scheduled_for': row[6],
+        'label': {'name': row[7], 'color': row[8]} if row[7] else None,
+    } for row in cur.fetchall()]
+
+
+def search_blog_posts(cur, user_id, query, limit, date_from=None, date_to=None):
+    """
+    Best-ranked blog posts matching `query`, newest first among equal ranks.
+    HTML tags are stripped from the content before the snippet is cut.
+    """
+    filter_sql, filter_params = _filters('b', date_from, date_to)
+    cur.execute(BLOG_SEARCH_SQL.format(filters=filter_sql), (HEADLINE_OPTIONS, query, user_id) + filter_params + (limit,))
+    return [{
+        'kind': 'blog', 'id': row[0], 'created_at': row[1], 'rank': row[2],
+        'title': row[3], 'snippet': highlight(row[4]),
+    } for row in cur.fetchall()]
+
+
+def search(cur, user_id, query, kind='all', label_id=None, status=None, date_from=None, date_to=None, limit=MAX_RESULTS):
+    """
+    Searches posts and/or blog posts and returns one list ordered by rank.
+    Label and status only exist on posts, so filtering by them leaves blogs out.
+    """
+    results = []
+    if kind in ('all', 'posts'):
+        results += search_posts(cur, user_id, query, limit, label_id, status, date_from, date_to)
+    if kind in ('all', 'blog') and not (label_id or status):
+        results += search_blog_posts(cur, user_id, query, limit, date_from, date_to)
+    results.sort(key=lambda result: (result['rank'], result['created_at']), reverse=True)
+    return results[:limit]
@@ -0,0 +1,223 @@
+# =====================================================
+# FILE: similarity.py
+# Near-duplicate detection for posts with MinHash signatures and LSH.
+#
+# Each post's text is cut into word shingles and summarised by NUM_PERM
+# MinHash values (posts.minhash). The signature is split into BANDS bands;
+# each band hashes (with the user id) to one bucket, stored in
+# posts.lsh_buckets under a GIN index. Posts sharing any bucket are
+# candidates, so a lookup reads a handful of rows instead of every post the
+# user has, and only candidates are compared by estimated Jaccard similarity.
+#
+# Signatures are written with every insert and edit. Posts written before
+# this existed are indexed by:  python similarity.py backfill
+# =====================================================
+
+import argparse
+import hashlib
+import os
+import re
+import struct
+import sys
+
+NUM_PERM = 64
+BANDS = 16                     # 4 rows per band: pairs above ~0.5 similarity usually share a bucket
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3               # words per shingle
+
+# Estimated Jaccard similarity from which two posts count as near-duplicates.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+# What scheduling a near-duplicate of a scheduled or published post does: off, warn or block.
+NEAR_DUPLICATE_ON_SCHEDULE = os.getenv("NEAR_DUPLICATE_ON_SCHEDULE", "warn").lower()
+MAX_CANDIDATES = 200
+BACKFILL_BATCH_SIZE = 1000
+
+# NUM_PERM independent 32-bit hashes per shingle, read from one SHAKE-128
+# digest. Stable across processes and machines, so stored signatures stay comparable.
+_HASHES = struct.Struct(f"<{NUM_PERM}I")
+
+_HASHTAG_OR_URL = re.compile(r"#\w+|https?://\S+")
+_WORD = re.compile(r"[a-z0-9']+")
+
+PUBLISHED_STATUSES = ('scheduled', 'publishing', 'posted')
+
+
+def shingles(text):
+    """The set of SHINGLE_SIZE-word shingles of a post, ignoring case, punctuation, hashtags and links."""
+    words = _WORD.findall(_HASHTAG_OR_URL.sub(" ", (text or "").lower()))
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """NUM_PERM MinHash values for a post's text (None if it has no words)."""
+    hashes = [_HASHES.unpack(hashlib.shake_128(shingle.encode("utf-8")).digest(_HASHES.size)) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return list(map(min, zip(*hashes)))
+
+
+def buckets(user_id, minhash):
+    """One LSH bucket per band, salted with the user id so lookups only match that user's posts."""
+    if minhash is None:
+        return None
+    bucket_ids = []
+    for band in range(BANDS):
+        rows = minhash[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(f"{user_id}:{band}:{rows}".encode("utf-8"), digest_size=8).digest()
+        bucket_ids.append(int.from_bytes(digest, "big", signed=True))
+    return bucket_ids
+
+
+def index_values(user_id, text):
+    """(minhash, lsh_buckets) to store with a post; both empty for a post with no words."""
+    minhash = signature(text)
+    if minhash is None:
+        return [], []
+    return minhash, buckets(user_id, minhash)
+
+
+def estimate(minhash_a, minhash_b):
+    """Estimated Jaccard similarity of two signatures."""
+    if not minhash_a or not minhash_b:
+        return 0.0
+    return sum(1 for a, b in zip(minhash_a, minhash_b) if a == b) / NUM_PERM
+
+
+DUPLICATES_OF_SQL = "SELECT id FROM posts WHERE near_duplicate_of = %s AND user_id = %s;"
+
+
+def candidates_query(user_id, bucket_ids, exclude_id=None, older_than=None, statuses=None):
+    """The (query, params) that reads a user's posts sharing any of `bucket_ids`, for find_similar."""
+    conditions = ["user_id = %s", "lsh_buckets && %s::bigint[]"]
+    params = [user_id, bucket_ids]
+    if exclude_id is not None:
+        conditions.append("id <> %s")
+        params.append(exclude_id)
+    if older_than is not None:
+        conditions.append("id < %s")
+        params.append(older_than)
+    if statuses:
+        conditions.append("status = ANY(%s)")
+        params.append(list(statuses))
+    return f"SELECT id, minhash FROM posts WHERE {' AND '.join(conditions)} LIMIT {MAX_CANDIDATES};", params
+
+
+def find_similar(cur, user_id, minhash, bucket_ids, exclude_id=None, older_than=None, statuses=None,
+                 threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    The user's posts similar to a signature, best first, as (post_id, score)
+    pairs. Only posts sharing an LSH bucket are read (via the GIN index).
+    """
+    if not minhash:
+        return []
+    cur.execute(*candidates_query(user_id, bucket_ids, exclude_id, older_than, statuses))
+    scored = [(post_id, estimate(minhash, candidate)) for post_id, candidate in cur.fetchall()]
+    return sorted([item for item in scored if item[1] >= threshold], key=lambda item: (-item[1], item[0]))
+
+
+def flag_posts(cur, user_id, post_ids, older_only=True):
+    """
+    Records the closest near-duplicate of each post in near_duplicate_of /
+    near_duplicate_score (clearing them when there is none) and returns
+    {post_id: (duplicate_id, score)} for the flagged ones. With older_only,
+    a post is only compared with posts created before it, so of two similar
+    posts only the newer one is flagged. Runs on the caller's transaction.
+    """
+    if not post_ids:
+        return {}
+    cur.execute("SELECT id, minhash, lsh_buckets FROM posts WHERE id = ANY(%s) AND user_id = %s;", (list(post_ids), user_id))
+    flagged = {}
+    for post_id, minhash, bucket_ids in cur.fetchall():
+        matches = find_similar(cur, user_id, minhash, bucket_ids, exclude_id=post_id,
+                               older_than=post_id if older_only else None)
+        if matches:
+            flagged[post_id] = matches[0]
+    cur.execute("""
+        UPDATE posts SET near_duplicate_of = v.duplicate_id, near_duplicate_score = v.score
+        FROM unnest(%s::integer[], %s::integer[], %s::real[]) AS v (id, duplicate_id, score)
+        WHERE posts.id = v.id;
+    """, (list(post_ids), [flagged.get(post_id, (None, None))[0] for post_id in post_ids],
+          [flagged.get(post_id, (None, None))[1] for post_id in post_ids]))
+    return flagged
+
+
+def reflag_duplicates_of(cur, user_id, post_id):
+    """
+    Re-flags the posts recorded as near-duplicates of `post_id`, e.g. after
+    it was edited, so their warnings don't outlive the text they matched.
+    Returns flag_posts' result for them.
+    """
+    cur.execute(DUPLICATES_OF_SQL, (post_id, user_id))
+    return flag_posts(cur, user_id, [row[0] for row in cur.fetchall()])
+
+
+def published_duplicates(cur, user_id, post_ids):
+    """
+    {post_id: (duplicate_id, score)} for posts that are near-duplicates of a
+    post already scheduled or published (other than the posts themselves).
+    Used when scheduling, so the same content doesn't go out twice.
+    """
+    if not post_ids:
+        return {}
+    cur.execute("SELECT id, minhash, lsh_buckets FROM posts WHERE id = ANY(%s) AND user_id = %s;", (list(post_ids), user_id))
+    duplicates = {}
+    for post_id, minhash, bucket_ids in cur.fetchall():
+        matches = [match for match in find_similar(cur, user_id, minhash, bucket_ids, exclude_id=post_id,
+                                                   statuses=PUBLISHED_STATUSES)
+                   if match[0] not in post_ids]
+        if matches:
+            duplicates[post_id] = matches[0]
+    return duplicates
+
+
+def backfill(conn, batch_size=BACKFILL_BATCH_SIZE):
+    """Indexes every post without a signature, batch by batch, then flags near-duplicates. Returns the count."""
+    from psycopg2.extras import execute_values
+    indexed = 0
+    cur = conn.cursor()
+    while True:
+        cur.execute("SELECT id, user_id, post_text FROM posts WHERE minhash IS NULL ORDER BY id LIMIT %s;", (batch_size,))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        values = [(post_id,) + index_values(user_id, post_text) for post_id, user_id, post_text in rows]
+        execute_values(cur, """
+            UPDATE posts SET minhash = v.minhash, lsh_buckets = v.lsh_buckets
+            FROM (VALUES %s) AS v (id, minhash, lsh_buckets)
+            WHERE posts.id = v.id;
+        """, values, template="(%s::integer, %s::bigint[], %s::bigint[])")
+        by_user = {}
+        for post_id, user_id, _ in rows:
+            by_user.setdefault(user_id, []).append(post_id)
+        for user_id, post_ids in by_user.items():
+            flag_posts(cur, user_id, post_ids)
+        conn.commit()
+        indexed += len(rows)
+        print(f"Indexed {indexed} post(s)...")
+    cur.close()
+    return indexed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Near-duplicate index for posts.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill", help="index posts written before signatures were stored")
+    backfill_parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    import migrate
+    conn = migrate.connect()
+    try:
+        if args.command == "backfill":
+            print(f"Done: indexed {backfill(conn, args.batch_size)} post(s).")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
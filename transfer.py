@@ -0,0 +1,309 @@
+# =====================================================
+# FILE: transfer.py
+# Bulk export and import of a user's posts and blog posts. Exports stream
+# from a server-side (named) cursor, so memory stays flat however many rows
+# there are. Imports are validated in Python, COPYed into a temporary
+# staging table and merged into the real table with a few set-based
+# statements, all in one transaction.
+# =====================================================
+
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+import similarity
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "100000"))
+MAX_IMPORT_ERRORS = 20                 # reported back; the rest are only counted
+DEFAULT_LABEL_COLOR = "#6366f1"
+IMPORT_STATUSES = ('draft', 'scheduled', 'posted')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+# Exported columns per kind. Imports read the same columns (ids are ignored),
+# so an export can be edited in a spreadsheet and imported into another account.
+COLUMNS = {
+    'posts': ('id', 'post_text', 'hashtags', 'status', 'scheduled_for', 'label', 'label_color',
+              'linkedin_post_urn', 'created_at'),
+    'blog_posts': ('id', 'title', 'content', 'created_at'),
+}
+
+EXPORT_QUERIES = {
+    'posts': """
+        SELECT p.id, p.post_text, p.hashtags, p.status, p.scheduled_for, l.name, l.color,
+               p.linkedin_post_urn, p.created_at
+        FROM posts p LEFT JOIN labels l ON l.id = p.label_id
+        WHERE p.user_id = %s
+        ORDER BY p.created_at DESC, p.id DESC;
+    """,
+    'blog_posts': """
+        SELECT id, title, content, created_at FROM blog_posts
+        WHERE user_id = %s
+        ORDER BY created_at DESC, id DESC;
+    """,
+}
+
+
+class TransferError(Exception):
+    """Raised when an upload can't be imported at all (bad format, too many rows)."""
+
+
+# --- EXPORT ---
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _encode(rows, fmt, header=None):
+    """A batch of rows as one CSV or JSONL chunk."""
+    if fmt == 'jsonl':
+        return "".join(json.dumps(dict(zip(header, row)), default=_json_value) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def export_rows(conn, user_id, kind, fmt):
+    """
+    Yields the user's rows as CSV (with a header) or JSONL text chunks, one
+    chunk per EXPORT_BATCH_SIZE rows, read through a named cursor. The caller
+    keeps `conn` checked out until the generator is exhausted or closed.
+    """
+    header = COLUMNS[kind]
+    if fmt == 'csv':
+        yield _encode([header], fmt)
+    cur = conn.cursor(name=f"export_{kind}")
+    cur.itersize = EXPORT_BATCH_SIZE
+    try:
+        cur.execute(EXPORT_QUERIES[kind], (user_id,))
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            yield _encode(rows, fmt, header)
+    finally:
+        cur.close()
+        conn.rollback()
+
+
+# --- IMPORT ---
+
+def _read_records(stream, fmt):
+    """(line number, dict) for every record of an uploaded CSV or JSONL file."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline="")
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def _text(record, key):
+    value = record.get(key)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _timestamp(record, key):
+    """An ISO 8601 timestamp as a naive datetime (like the posts columns), or None. Raises ValueError."""
+    value = _text(record, key)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{key} is not an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _post_row(record, user_id, now):
+    post_text = _text(record, 'post_text')
+    if not post_text:
+        raise ValueError("post_text is required")
+    status = (_text(record, 'status') or 'draft').lower()
+    if status in ('failed', 'publishing'):
+        status = 'draft'   # exported mid-publish or after giving up; needs a fresh schedule
+    if status not in IMPORT_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(IMPORT_STATUSES)}")
+    scheduled_for = _timestamp(record, 'scheduled_for')
+    linkedin_post_urn = _text(record, 'linkedin_post_urn')
+    if status == 'scheduled':
+        if linkedin_post_urn:
+            raise ValueError("scheduled posts can't have a linkedin_post_urn; it was already published")
+        if scheduled_for is None:
+            raise ValueError("scheduled posts need a scheduled_for")
+        if scheduled_for <= now:
+            raise ValueError("scheduled_for is in the past; import it as a draft or posted")
+    minhash, lsh_buckets = similarity.index_values(user_id, post_text)
+    return (post_text, _text(record, 'hashtags'), status, scheduled_for, _text(record, 'label'),
+            _text(record, 'label_color'), linkedin_post_urn, _timestamp(record, 'created_at'),
+            _array(minhash), _array(lsh_buckets))
+
+
+def _array(values):
+    """A Postgres array literal, as COPY reads it from CSV."""
+    return "{" + ",".join(map(str, values)) + "}"
+
+
+def _blog_row(record, user_id, now):
+    title = _text(record, 'title')
+    content = _text(record, 'content')
+    if not title or not content:
+        raise ValueError("title and content are required")
+    return title, content, _timestamp(record, 'created_at')
+
+
+# kind -> (staging table DDL, staging table, COPY columns, record -> row)
+STAGING = {
+    'posts': ("""
+        CREATE TEMP TABLE import_posts (
+            post_text TEXT, hashtags TEXT, status TEXT, scheduled_for TIMESTAMP, label TEXT,
+            label_color TEXT, linkedin_post_urn TEXT, created_at TIMESTAMP, minhash BIGINT[], lsh_buckets BIGINT[]
+        ) ON COMMIT DROP;
+    """, "import_posts",
+        "post_text, hashtags, status, scheduled_for, label, label_color, linkedin_post_urn, created_at, minhash, lsh_buckets",
+        _post_row),
+    'blog_posts': ("""
+        CREATE TEMP TABLE import_blog_posts (title TEXT, content TEXT, created_at TIMESTAMP) ON COMMIT DROP;
+    """, "import_blog_posts", "title, content, created_at", _blog_row),
+}
+
+
+def stage_upload(stream, user_id, kind, fmt):
+    """
+    Validates an upload and writes the good rows as CSV to a spooled temp file
+    ready for COPY. Returns (file, staged, skipped, errors); errors holds the
+    first MAX_IMPORT_ERRORS '(line N) message' strings.
+    """
+    make_row = STAGING[kind][3]
+    staged_file = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024, mode="w+", newline="", encoding="utf-8")
+    writer = csv.writer(staged_file)
+    now = datetime.now()
+    staged = skipped = 0
+    errors = []
+    try:
+        for line_number, record in _read_records(stream, fmt):
+            try:
+                if record is None:
+                    raise ValueError("not a JSON object")
+                writer.writerow(make_row(record, user_id, now))
+                staged += 1
+            except ValueError as e:
+                skipped += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append(f"(line {line_number}) {e}")
+            if staged > MAX_IMPORT_ROWS:
+                raise TransferError(f"At most {MAX_IMPORT_ROWS} rows can be imported at once.")
+    except BaseException as e:
+        staged_file.close()
+        if isinstance(e, csv.Error):
+            raise TransferError(f"Could not read the CSV file: {e}")
+        raise
+    staged_file.seek(0)
+    return staged_file, staged, skipped, errors
+
+
+def _merge_posts(cur, user_id):
+    """
+    Moves staged posts into posts. Labels are matched by name (missing ones are
+    created), and a post whose text the user already has is skipped, so
+    re-running an import adds nothing twice. Posts are stored with their
+    near-duplicate signatures but not flagged: one lookup per row would cost
+    more than the rest of a large import. Returns (inserted, labels created,
+    scheduled rows as (id, schedule_version, seconds_until_due)).
+    """
+    cur.execute("""
+        INSERT INTO labels (name, color, user_id)
+        SELECT s.label, COALESCE(MIN(s.label_color), %s), %s
+        FROM import_posts s
+        WHERE s.label IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM labels l WHERE l.user_id = %s AND l.name = s.label)
+        GROUP BY s.label;
+    """, (DEFAULT_LABEL_COLOR, user_id, user_id))
+    labels_created = cur.rowcount
+    cur.execute("""
+        WITH new_posts AS (
+            SELECT DISTINCT ON (s.post_text) s.*
+            FROM import_posts s
+            WHERE NOT EXISTS (SELECT 1 FROM posts p WHERE p.user_id = %s AND p.post_text = s.post_text)
+            ORDER BY s.post_text, s.created_at
+        ), user_labels AS (
+            SELECT name, MIN(id) AS id FROM labels WHERE user_id = %s GROUP BY name
+        )
+        INSERT INTO posts (post_text, hashtags, status, scheduled_for, label_id, linkedin_post_urn, user_id, created_at,
+                           minhash, lsh_buckets)
+        SELECT n.post_text, n.hashtags, n.status, n.scheduled_for, ul.id, n.linkedin_post_urn, %s,
+               COALESCE(n.created_at, CURRENT_TIMESTAMP), n.minhash, n.lsh_buckets
+        FROM new_posts n LEFT JOIN user_labels ul ON ul.name = n.label
+        RETURNING id, status, schedule_version, EXTRACT(EPOCH FROM (scheduled_for - NOW()));
+    """, (user_id, user_id, user_id))
+    rows = cur.fetchall()
+    scheduled = [(post_id, version, seconds) for post_id, status, version, seconds in rows if status == 'scheduled']
+    return len(rows), labels_created, scheduled
+
+
+def _merge_blog_posts(cur, user_id):
+    """Moves staged blog posts into blog_posts, skipping titles the user already has. Returns the count inserted."""
+    cur.execute("""
+        INSERT INTO blog_posts (title, content, user_id, created_at)
+        SELECT DISTINCT ON (s.title) s.title, s.content, %s, COALESCE(s.created_at, CURRENT_TIMESTAMP)
+        FROM import_blog_posts s
+        WHERE NOT EXISTS (SELECT 1 FROM blog_posts b WHERE b.user_id = %s AND b.title = s.title)
+        ORDER BY s.title, s.created_at;
+    """, (user_id, user_id))
+    return cur.rowcount
+
+
+def import_upload(conn, user_id, kind, fmt, stream):
+    """
+    Imports an uploaded CSV/JSONL file of posts or blog posts for a user in a
+    single transaction and returns a summary dict. Raises TransferError if the
+    file can't be used at all, including data Postgres rejects (e.g. a NUL
+    byte or an over-long value), in which case nothing is imported; rows that
+    fail validation are skipped and reported. The caller queues publish tasks
+    for summary['scheduled'] after this returns.
+    """
+    from psycopg2 import DataError
+    staged_file, staged, skipped, errors = stage_upload(stream, user_id, kind, fmt)
+    create_staging, staging_table, columns, _ = STAGING[kind]
+    summary = {'kind': kind, 'rows': staged + skipped, 'skipped': skipped, 'errors': errors,
+               'inserted': 0, 'duplicates': 0, 'labels_created': 0, 'scheduled': []}
+    try:
+        cur = conn.cursor()
+        cur.execute(create_staging)
+        cur.copy_expert(f"COPY {staging_table} ({columns}) FROM STDIN WITH (FORMAT csv)", staged_file)
+        if kind == 'posts':
+            summary['inserted'], summary['labels_created'], summary['scheduled'] = _merge_posts(cur, user_id)
+        else:
+            summary['inserted'] = _merge_blog_posts(cur, user_id)
+        conn.commit()
+        cur.close()
+    except DataError as e:
+        conn.rollback()
+        raise TransferError(f"The file could not be imported: {str(e).strip().splitlines()[0]}")
+    finally:
+        staged_file.close()
+    summary['duplicates'] = staged - summary['inserted']
+    return summary